@@ -0,0 +1,94 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Events per second written by FileLogger to log_auth.csv and
+log_session.json, flushing every row versus group commit.
+
+Usage: python benchmarks/bench_file_logger.py
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+from heralding.reporting.file_logger import FileLogger
+
+EVENTS = 100000
+
+AUTH = {
+    'timestamp': '2017-01-01 00:00:00.000000',
+    'auth_id': 'b9e2ee3f-5a76-4d8b-84a7-58a4cb4cfb58',
+    'session_id': 'b0d3f5e4-7a8e-4d6b-9e53-d6b8e1b7c0a2',
+    'source_ip': '192.168.0.10',
+    'source_port': 51234,
+    'destination_ip': '192.168.0.1',
+    'destination_port': 22,
+    'protocol': 'ssh',
+    'username': 'root',
+    'password': 'letmein',
+    'password_hash': None
+}
+
+SESSION = {
+    'timestamp': '2017-01-01 00:00:00.000000',
+    'duration': 3,
+    'session_id': 'b0d3f5e4-7a8e-4d6b-9e53-d6b8e1b7c0a2',
+    'source_ip': '192.168.0.10',
+    'source_port': 51234,
+    'destination_ip': '192.168.0.1',
+    'destination_port': 22,
+    'protocol': 'ssh',
+    'num_auth_attempts': 3,
+    'auth_attempts': [AUTH, AUTH, AUTH],
+    'session_ended': True
+}
+
+
+def events_per_second(directory, **kwargs):
+  file_logger = FileLogger('',
+                           os.path.join(directory, 'log_session.json'),
+                           os.path.join(directory, 'log_auth.csv'), **kwargs)
+  start = time.perf_counter()
+  for i in range(EVENTS):
+    if i % 10 == 0:
+      file_logger.handle_session_log(SESSION)
+    else:
+      file_logger.handle_auth_log(AUTH)
+    # called this often by BaseLogger under load
+    if i % 100 == 0:
+      file_logger._execute_regulary()
+  file_logger.loggerStopped()
+  return EVENTS / (time.perf_counter() - start)
+
+
+def main():
+  for name, kwargs in [('flush every row', {
+      'flush_interval': 0
+  }), ('group commit', {
+      'flush_interval': 1
+  }), ('group commit, fsync every second', {
+      'flush_interval': 1,
+      'fsync_interval': 1
+  })]:
+    directory = tempfile.mkdtemp()
+    try:
+      rate = events_per_second(directory, **kwargs)
+    finally:
+      shutil.rmtree(directory)
+    print('{0:34} {1:10.0f} events/s'.format(name + ':', rate))
+
+
+if __name__ == '__main__':
+  main()
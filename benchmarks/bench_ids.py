@@ -0,0 +1,35 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Ids per second made by the id generators, as strings ready to be logged.
+
+Usage: python benchmarks/bench_ids.py
+"""
+
+import timeit
+
+from heralding.misc.ids import GENERATORS
+
+IDS = 200000
+
+
+def main():
+  for name, generator_class in sorted(GENERATORS.items()):
+    new_id = generator_class(worker_id=1).new_id
+    seconds = min(timeit.repeat(new_id, number=IDS, repeat=5))
+    print('{0:6} {1:10.0f} ids/s'.format(name + ':', IDS / seconds))
+
+
+if __name__ == '__main__':
+  main()
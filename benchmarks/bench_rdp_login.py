@@ -0,0 +1,136 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Event loop iterations, reads from the connection and time spent by the
+RDP capability per login, with a client sending the PDUs of
+heralding/tests/test_rdp.py from a thread. A read of data the StreamReader
+already holds does not take a loop iteration, but costs a coroutine round
+trip all the same.
+
+Usage: python benchmarks/bench_rdp_login.py
+"""
+
+import os
+import ssl
+import socket
+import asyncio
+import tempfile
+import time
+import warnings
+
+from heralding.capabilities import rdp
+from heralding.libs.msrdp.tls import ServerContext
+from heralding.misc.common import generate_self_signed_cert
+from heralding.tests.test_rdp import RDPClient
+
+LOGINS = 200
+
+
+class CountingEventLoop(asyncio.SelectorEventLoop):
+
+  iterations = 0
+
+  def _run_once(self):
+    self.iterations += 1
+    super()._run_once()
+
+
+class CountingStreamReader(asyncio.StreamReader):
+
+  reads = 0
+
+  async def read(self, n=-1):
+    CountingStreamReader.reads += 1
+    return await super().read(n)
+
+
+class LegacyServerContext(ServerContext):
+  """OpenSSL 3 refuses the signature algorithms of TLS 1.1 at the default
+    security level."""
+
+  def get(self):
+    context = super().get()
+    context.set_ciphers('RSA:!aNULL:@SECLEVEL=0')
+    return context
+
+
+def client_context():
+  with warnings.catch_warnings():
+    warnings.simplefilter('ignore', DeprecationWarning)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLSv1_1)
+  context.check_hostname = False
+  context.verify_mode = ssl.CERT_NONE
+  context.set_ciphers('ALL:@SECLEVEL=0')
+  return context
+
+
+def login(context, port):
+  with socket.create_connection(('127.0.0.1', port)) as sock:
+    # the client's small writes would wait for delayed acks otherwise
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.sendall(RDPClient.ConnectionRequestPDU())
+    sock.recv(1024)
+    tls = context.wrap_socket(sock)
+    tls.sendall(RDPClient.ClientDataPDU())
+    tls.recv(4096)
+    tls.sendall(RDPClient.ErectDomainRequest())
+    tls.sendall(RDPClient.AttactUserRequest())
+    tls.recv(512)
+    for channel in (1007, 1003):
+      tls.sendall(RDPClient.ChannelJoinRequest(channel))
+      tls.recv(1024)
+    tls.sendall(RDPClient.ClientInfoPDU())
+    # closed by the server after the login
+    tls.recv(512)
+
+
+async def logins(loop, port):
+  context = client_context()
+  for _ in range(LOGINS):
+    await loop.run_in_executor(None, login, context, port)
+
+
+def main():
+  directory = tempfile.mkdtemp()
+  pem_file = os.path.join(directory, 'rdp.pem')
+  cert, key = generate_self_signed_cert('US', 'None', 'None', 'None', 'None',
+                                        '*', 365, 0)
+  with open(pem_file, 'wb') as f:
+    f.write(cert + key)
+
+  asyncio.streams.StreamReader = CountingStreamReader
+  loop = CountingEventLoop()
+  cap = rdp.RDP({'port': 3389, 'timeout': 30})
+  cap.tls_context = LegacyServerContext(pem_file)
+  server = loop.run_until_complete(
+      asyncio.start_server(cap.handle_session, '127.0.0.1', 0))
+  port = server.sockets[0].getsockname()[1]
+
+  start = time.perf_counter()
+  loop.run_until_complete(logins(loop, port))
+  elapsed = time.perf_counter() - start
+  print('{0:.0f} loop iterations/login, {1:.0f} reads/login, {2:.2f} '
+        'ms/login'.format(loop.iterations / LOGINS,
+                          CountingStreamReader.reads / LOGINS,
+                          elapsed / LOGINS * 1000))
+
+  server.close()
+  loop.run_until_complete(server.wait_closed())
+  loop.close()
+  os.remove(pem_file)
+  os.rmdir(directory)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,59 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""PDUs per second parsed by the RDP parsers, the memoryview cursor versus
+the parsers they replaced, on the PDUs of heralding/tests/test_rdp.py.
+
+Usage: python benchmarks/bench_rdp_parser.py
+"""
+
+import timeit
+
+from heralding.libs.msrdp import parser
+from heralding.tests import rdp_reference_parser as reference
+from heralding.tests.test_rdp import RDPClient
+
+NUMBER = 20000
+
+
+def benchmarks(module):
+  connection_request = RDPClient.ConnectionRequestPDU()
+  channel_join_request = RDPClient.ChannelJoinRequest(1007)
+  erect_domain_request = RDPClient.ErectDomainRequest()
+  client_info = RDPClient.ClientInfoPDU()
+  return [
+      ('tpkt header',
+       lambda: module.tpktPDUParser().parse(client_info)),
+      ('connection request',
+       lambda: module.x224ConnectionRequestPDU().parse(connection_request)),
+      ('channel join request',
+       lambda: module.MCSChannelJoinRequestPDU().parse(channel_join_request)),
+      ('erect domain request',
+       lambda: module.ErectDomainRequestPDU.checkPDU(erect_domain_request)),
+      ('client info', lambda: module.ClientInfoPDU().parseTLS(client_info)),
+  ]
+
+
+def main():
+  for (name, before), (_, after) in zip(
+      benchmarks(reference), benchmarks(parser)):
+    rates = [
+        NUMBER / min(timeit.repeat(func, number=NUMBER, repeat=5))
+        for func in (before, after)
+    ]
+    print('{0:22} {1:9.0f} -> {2:9.0f} PDUs/s'.format(name + ':', *rates))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,63 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Time to build the responses the RDP capability sends in a session, field
+by field with the certificate signed every time as before, versus from the
+templates.
+
+Usage: python benchmarks/bench_rdp_pdu.py
+"""
+
+import timeit
+
+from heralding.libs.msrdp.pdu import (
+    tpktPDU, x224DataPDU, x224ConnectionConfirmPDU, MCSConnectResponsePDU,
+    MCSAttachUserConfirmPDU, MCSChannelJoinConfirmPDU)
+from heralding.libs.msrdp.security import ServerSecurity
+
+SESSIONS = 2000
+CHANNELS = (1007, 1003)
+
+
+def generated(pdu):
+  return tpktPDU(x224DataPDU.generate() + pdu.generate()).generate()
+
+
+def field_by_field():
+  ServerSecurity._serverCertBytes = None
+  tpktPDU(x224ConnectionConfirmPDU(1).generate()).generate()
+  generated(MCSConnectResponsePDU(1, ServerSecurity()))
+  generated(MCSAttachUserConfirmPDU())
+  for channel in CHANNELS:
+    generated(MCSChannelJoinConfirmPDU(6, channel))
+
+
+def from_templates():
+  x224ConnectionConfirmPDU(1).getFullPacket()
+  MCSConnectResponsePDU(1).getFullPacket()
+  MCSAttachUserConfirmPDU().getFullPacket()
+  for channel in CHANNELS:
+    MCSChannelJoinConfirmPDU(6, channel).getFullPacket()
+
+
+def main():
+  for name, func in [('field by field', field_by_field),
+                     ('templates', from_templates)]:
+    seconds = min(timeit.repeat(func, number=SESSIONS, repeat=5))
+    print('{0:16} {1:8.1f} us/session'.format(name + ':',
+                                              seconds / SESSIONS * 1e6))
+
+
+if __name__ == '__main__':
+  main()
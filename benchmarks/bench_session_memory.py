@@ -0,0 +1,62 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Memory held by open sessions and time to create them, with a number of
+authentication attempts per session. Nothing is reported, as in a worker
+whose loggers cannot keep up the messages would be gone anyway.
+
+Usage: python benchmarks/bench_session_memory.py
+"""
+
+import gc
+import time
+import tracemalloc
+
+# only imported for the import order, heralding.misc.session cannot be
+# imported before it because of a circular import
+import heralding.honeypot  # noqa: F401
+from heralding.misc.session import Session
+
+SESSIONS = 10000
+
+
+def open_sessions(auth_attempts):
+  sessions = []
+  for i in range(SESSIONS):
+    session = Session('192.168.{0}.{1}'.format(i // 256 % 256, i % 256),
+                      40000 + i % 20000, 'ssh', None, 22, '192.168.0.1')
+    for j in range(auth_attempts):
+      session.add_auth_attempt(
+          'plaintext', username='root', password='password{0}'.format(j))
+    sessions.append(session)
+  return sessions
+
+
+def main():
+  for auth_attempts in (0, 3, 10):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    sessions = open_sessions(auth_attempts)
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('{0:2} auth attempts: {1:6.0f} bytes/session, {2:6.1f} us/session'
+          .format(auth_attempts, size / len(sessions),
+                  elapsed / len(sessions) * 1e6))
+    del sessions
+
+
+if __name__ == '__main__':
+  main()
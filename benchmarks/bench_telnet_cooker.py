@@ -0,0 +1,71 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Telnet login lines per second read by readline, the chunked input cooker
+versus the one byte at a time cooker it replaced, for a Hydra like flood of
+username and password lines. The flood arrives a line per segment, as from a
+client waiting for each prompt, in full 1460 byte segments, as from a client
+pipelining its attempts, and a byte per segment, as from a client in
+character mode.
+
+Usage: python benchmarks/bench_telnet_cooker.py
+"""
+
+import time
+import asyncio
+
+from heralding.tests.test_telnetsrv import Handler, ReferenceHandler, \
+  read_lines
+
+ATTEMPTS = 5000
+
+
+def flood():
+  return [
+      line for i in range(ATTEMPTS)
+      for line in (b'admin%d\r\n' % i, b'password%d\r\n' % i)
+  ]
+
+
+def segments(data, size):
+  return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def lines_per_second(handler_class, chunks):
+  loop = asyncio.new_event_loop()
+  try:
+    start = time.perf_counter()
+    lines, _, _ = loop.run_until_complete(read_lines(handler_class, chunks))
+    elapsed = time.perf_counter() - start
+  finally:
+    loop.close()
+  assert len(lines) == 2 * ATTEMPTS
+  return len(lines) / elapsed
+
+
+def main():
+  lines = flood()
+  data = b''.join(lines)
+  for name, chunks in (('line per segment', lines),
+                       ('1460 byte segments', segments(data, 1460)),
+                       ('byte per segment', segments(data, 1))):
+    rates = [
+        max(lines_per_second(handler_class, chunks) for _ in range(3))
+        for handler_class in (ReferenceHandler, Handler)
+    ]
+    print('{0:20} {1:9.0f} -> {2:9.0f} lines/s'.format(name + ':', *rates))
+
+
+if __name__ == '__main__':
+  main()
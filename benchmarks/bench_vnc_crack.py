@@ -0,0 +1,91 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Time per VNC crack attempt against the shipped wordlist.
+
+Usage: python benchmarks/bench_vnc_crack.py
+"""
+
+import os
+import time
+
+from Crypto.Cipher import DES
+
+from heralding.libs.cracker.vnc import (BIT_FLIP, VncKeyTable, crack_hash,
+                                        crack_hash_reference, vnc_hash_check)
+
+WORDLIST = os.path.join(
+    os.path.dirname(__file__), '..', 'heralding', 'wordlist.txt')
+ROUNDS = 5
+
+
+def legacy_get_vnc_key(key):
+  # key derivation as it was done before VncKeyTable, on every attempt
+  bit_flip = list(BIT_FLIP)
+  key = (key + bytes(8))[:8]
+  res = bytearray(8)
+  i = 0
+  for b in key:
+    res[i] = bit_flip[b]
+    i += 1
+  return bytes(res)
+
+
+def legacy_crack_hash(challenge, response, password_list):
+  for potential_password in password_list:
+    vnc_key = legacy_get_vnc_key(potential_password.encode('ascii'))
+    if vnc_hash_check(challenge, response, vnc_key):
+      return potential_password
+  return None
+
+
+def timed(func, *args):
+  start = time.perf_counter()
+  for _ in range(ROUNDS):
+    func(*args)
+  return (time.perf_counter() - start) / ROUNDS
+
+
+def main():
+  with open(WORDLIST, 'r') as f:
+    wordlist = f.read().splitlines()
+
+  start = time.perf_counter()
+  key_table = VncKeyTable(wordlist)
+  build_time = time.perf_counter() - start
+
+  # a response no password matches, so the whole wordlist is tried
+  challenge = os.urandom(16)
+  response = DES.new(b'\x01' * 8, DES.MODE_ECB).encrypt(os.urandom(16))
+
+  start = time.perf_counter()
+  key_table.prepare()
+  prepare_time = time.perf_counter() - start
+
+  before = timed(legacy_crack_hash, challenge, response, wordlist)
+  reference = timed(crack_hash_reference, challenge, response, key_table)
+  after = timed(crack_hash, challenge, response, key_table)
+
+  print('wordlist: {0} passwords, {1} distinct keys, table built in {2:.1f} ms'
+        .format(len(wordlist), len(key_table), build_time * 1000))
+  print('ciphers set up in {0:.1f} ms'.format(prepare_time * 1000))
+  print('before:    {0:.1f} ms per attempt'.format(before * 1000))
+  print('key table: {0:.1f} ms per attempt ({1:.2f}x)'.format(
+      reference * 1000, before / reference))
+  print('ciphers:   {0:.1f} ms per attempt ({1:.2f}x)'.format(
+      after * 1000, before / after))
+
+
+if __name__ == '__main__':
+  main()
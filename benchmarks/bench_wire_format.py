@@ -0,0 +1,101 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Encode/decode time and frame size of reporting batches, pickle (as sent
+with send_pyobj before) versus the wire format.
+
+Usage: python benchmarks/bench_wire_format.py
+"""
+
+import uuid
+import pickle
+import timeit
+
+from heralding.reporting import wire_format
+
+ROUNDS = 200
+
+
+def auth_message(i):
+  return {
+      'message_type': 'auth',
+      'content': {
+          'timestamp': '2017-01-01 00:00:00.{0:06d}'.format(i),
+          'session_id': str(uuid.uuid4()),
+          'auth_id': str(uuid.uuid4()),
+          'source_ip': '192.168.0.{0}'.format(i % 255),
+          'source_port': 40000 + i,
+          'destination_ip': '192.168.0.1',
+          'destination_port': 22,
+          'protocol': 'ssh',
+          'username': 'root',
+          'password': 'password{0}'.format(i),
+          'password_hash': None
+      }
+  }
+
+
+def session_message(i):
+  return {
+      'message_type': 'session_info',
+      'content': {
+          'timestamp': '2017-01-01 00:00:00.{0:06d}'.format(i),
+          'duration': 3,
+          'session_id': str(uuid.uuid4()),
+          'source_ip': '192.168.0.{0}'.format(i % 255),
+          'source_port': 40000 + i,
+          'destination_ip': '192.168.0.1',
+          'destination_port': 22,
+          'protocol': 'ssh',
+          'num_auth_attempts': 1,
+          'auth_attempts': [{
+              'timestamp': '2017-01-01 00:00:00.000000',
+              'username': 'root',
+              'password': 'password'
+          }],
+          'session_ended': True,
+          'auxiliary_data': {}
+      }
+  }
+
+
+def per_message_us(func, arg, count):
+  best = min(timeit.repeat(lambda: func(arg), number=ROUNDS, repeat=5))
+  return best / ROUNDS / count * 1e6
+
+
+def main():
+  for batch_size in (1, 100):
+    batch = [
+        session_message(i) if i % 10 == 0 else auth_message(i)
+        for i in range(batch_size)
+    ]
+    pickled = pickle.dumps(batch)
+    encoded = wire_format.encode_batch(batch)
+    assert wire_format.decode_batch(encoded) == batch
+
+    print('batch of {0}:'.format(batch_size))
+    print('  pickle: {0:6} bytes, encode {1:.2f} us/msg, decode {2:.2f} us/msg'
+          .format(
+              len(pickled), per_message_us(pickle.dumps, batch, batch_size),
+              per_message_us(pickle.loads, pickled, batch_size)))
+    print('  wire:   {0:6} bytes, encode {1:.2f} us/msg, decode {2:.2f} us/msg'
+          .format(
+              len(encoded),
+              per_message_us(wire_format.encode_batch, batch, batch_size),
+              per_message_us(wire_format.decode_batch, encoded, batch_size)))
+
+
+if __name__ == '__main__':
+  main()
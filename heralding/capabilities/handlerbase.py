@@ -23,6 +23,10 @@ logger = logging.getLogger(__name__)
 class HandlerBase:
     MAX_GLOBAL_SESSIONS = 800
     global_sessions = 0
+    # when running with multiple workers this is a shared array holding the
+    # session count of each worker, so the limit covers all of them.
+    worker_sessions = None
+    worker_slot = 0
 
     def __init__(self, options):
         """
@@ -45,7 +49,7 @@ class HandlerBase:
         session = Session(address[0], address[1], protocol, self.users,
                           dest_address[1], dest_address[0])
         self.sessions[session.id] = session
-        HandlerBase.global_sessions += 1
+        HandlerBase._adjust_global_sessions(1)
         logger.debug('Accepted %s session on %s:%s from %s:%s. (%s)', protocol,
                      dest_address[0], dest_address[1], address[0], address[1],
                      str(session.id))
@@ -60,7 +64,23 @@ class HandlerBase:
             del self.sessions[session.id]
         else:
             assert False
-        HandlerBase.global_sessions -= 1
+        HandlerBase._adjust_global_sessions(-1)
+
+    @staticmethod
+    def _adjust_global_sessions(delta):
+        HandlerBase.global_sessions += delta
+        if HandlerBase.worker_sessions is not None:
+            # every worker only writes its own slot, so no locking is needed
+            HandlerBase.worker_sessions[
+                HandlerBase.worker_slot] = HandlerBase.global_sessions
+
+    @staticmethod
+    def session_limit_reached():
+        if HandlerBase.worker_sessions is not None:
+            sessions = sum(HandlerBase.worker_sessions)
+        else:
+            sessions = HandlerBase.global_sessions
+        return sessions > HandlerBase.MAX_GLOBAL_SESSIONS
 
     async def execute_capability(self, reader, writer, session):
         reader = None  # NOQA
@@ -72,7 +92,7 @@ class HandlerBase:
         address = writer.get_extra_info('peername')
         dest_address = writer.get_extra_info('sockname')
 
-        if HandlerBase.global_sessions > HandlerBase.MAX_GLOBAL_SESSIONS:
+        if HandlerBase.session_limit_reached():
             protocol = self.__class__.__name__.lower()
             logger.warning(
                 'Got %s session on port %s from %s:%s, but not handling it because the global session limit has '
@@ -20,13 +20,15 @@ from heralding.capabilities.handlerbase import HandlerBase
 from heralding.libs.msrdp.pdu import x224ConnectionConfirmPDU, MCSConnectResponsePDU, MCSAttachUserConfirmPDU, MCSChannelJoinConfirmPDU
 from heralding.libs.msrdp.parser import x224ConnectionRequestPDU, MCSChannelJoinRequestPDU, ClientInfoPDU
 from heralding.libs.msrdp.parser import ErectDomainRequestPDU, tpktPDUParser
-from heralding.libs.msrdp.security import ServerSecurity
 from heralding.libs.msrdp.parser import InvalidExpectedData
-from heralding.libs.msrdp.tls import TLS, TLSHandshakeError
+from heralding.libs.msrdp.tls import TLS, TLSHandshakeError, ServerContext
 logger = logging.getLogger(__name__)
 
 
 class RDP(HandlerBase):
+  # shared by all sessions, set up by the honeypot when it starts
+  tls_context = None
+
   # will parse the TPKT header and read the entire packet (TPKT + payload)
   async def recv_next_tpkt(self, reader, tlsObj=None):
     # data buffer
@@ -83,16 +85,16 @@ class RDP(HandlerBase):
 
       # TLS Upgrade start
       logger.debug("RDP TLS initilization")
-      tls_obj = TLS(writer, reader, 'rdp.pem')
+      if self.tls_context is None:
+        self.tls_context = ServerContext('rdp.pem')
+      tls_obj = TLS(writer, reader, self.tls_context.get())
       await tls_obj.do_tls_handshake()
 
       # Now using send_data and recv_next_tpkt
       data = await self.recv_next_tpkt(reader, tls_obj)
 
       # This packet includes ServerSecurity data
-      server_sec = ServerSecurity()
-      mcs_cres = MCSConnectResponsePDU(client_reqProto,
-                                       server_sec).getFullPacket()
+      mcs_cres = MCSConnectResponsePDU(client_reqProto).getFullPacket()
       await self.send_data(writer, mcs_cres, tls_obj)
 
       data = await self.recv_next_tpkt(reader, tls_obj)
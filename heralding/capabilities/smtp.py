@@ -48,7 +48,9 @@ class SMTPHandler(SMTP):
     self.transport = writer
 
     self._set_rset_state()
-    self.session = session
+    # aiosmtpd keeps its own state in self.session
+    self.heralding_session = session
+    self.session = self._create_session()
     self.session.peer = self.transport.get_extra_info('peername')
     self.session.extended_smtp = None
     self.session.host_name = None
@@ -105,7 +107,7 @@ class SMTPHandler(SMTP):
       except ValueError:  # not enough args
         await self.push("500 Can't split auth value")
         return
-      self.session.add_auth_attempt(
+      self.heralding_session.add_auth_attempt(
           'PLAIN',
           username=str(login, 'utf-8'),
           password=str(password, 'utf-8'))
@@ -118,7 +120,7 @@ class SMTPHandler(SMTP):
         if not password_bytes:
           return
         password = str(base64.b64decode(password_bytes), 'utf-8')
-        self.session.add_auth_attempt(
+        self.heralding_session.add_auth_attempt(
             'LOGIN', username=username, password=password)
       else:
         await self.push('334 ' + str(base64.b64encode(b'Username:'), 'utf-8'))
@@ -132,7 +134,7 @@ class SMTPHandler(SMTP):
         password_bytes = await self.readline()
         if not password_bytes:
           return
-        self.session.add_auth_attempt(
+        self.heralding_session.add_auth_attempt(
             'LOGIN',
             username=str(base64.b64decode(username_bytes), 'utf-8'),
             password=str(base64.b64decode(password_bytes), 'utf-8'))
@@ -155,7 +157,7 @@ class SMTPHandler(SMTP):
         await self.push('451 Internal confusion')
         return
       username, digest = credentials.split()
-      self.session.add_auth_attempt(
+      self.heralding_session.add_auth_attempt(
           'cram_md5',
           username=username,
           digest=digest,
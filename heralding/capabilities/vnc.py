@@ -17,8 +17,8 @@ import os
 import logging
 import binascii
 
+import heralding.honeypot
 from heralding.capabilities.handlerbase import HandlerBase
-from heralding.libs.cracker.vnc import crack_hash
 
 # VNC constants
 RFB_VERSION = b'RFB 003.007\n'
@@ -59,15 +59,30 @@ class Vnc(HandlerBase):
     client_response = await reader.read(1024)
     writer.write(AUTH_FAILED)
 
-    # try to decrypt the hash
-    dkey = crack_hash(challenge, client_response)
-    if dkey:
-      session.add_auth_attempt('cracked', password=dkey)
-    else:
-      hash_data = {
-          'challenge': binascii.hexlify(challenge).decode(),
-          'response': binascii.hexlify(client_response).decode()
-      }
-      session.add_auth_attempt('des_challenge', password_hash=hash_data)
+    hash_data = {
+        'challenge': binascii.hexlify(challenge).decode(),
+        'response': binascii.hexlify(client_response).decode()
+    }
+    session.add_auth_attempt('des_challenge', password_hash=hash_data)
+
+    # try to decrypt the hash, the result is reported when it arrives
+    cracker_pool = heralding.honeypot.Honeypot.cracker_pool
+    if cracker_pool:
+      future = cracker_pool.submit_vnc(challenge, client_response)
+      if future:
+        future.add_done_callback(
+            lambda f: self._handle_crack_result(f, session))
 
     session.end_session()
+
+  @staticmethod
+  def _handle_crack_result(future, session):
+    if future.cancelled():
+      return
+    if future.exception():
+      logger.debug('VNC hash cracking failed: %s. (%s)', future.exception(),
+                   session.id)
+      return
+    dkey = future.result()
+    if dkey:
+      session.add_auth_attempt('cracked', password=dkey)
@@ -15,17 +15,31 @@
 
 import os
 import ssl
+import shutil
+import signal
 import logging
+import tempfile
 import asyncio
+import threading
+import multiprocessing
 
 import heralding.misc.common as common
 import heralding.capabilities.handlerbase
 
-from heralding.reporting.reporting_relay import ReportingRelay
+from heralding.misc.socket_names import worker_reporting_address
+from heralding.reporting.reporting_relay import ReportingRelay, ReportingCollector, WorkerLogHandler
 from heralding.reporting.file_logger import FileLogger
-from heralding.reporting.syslog_logger import SyslogLogger
+from heralding.reporting.syslog_logger import SyslogLogger, RemoteSyslogLogger
+from heralding.reporting.sqlite_logger import SqliteLogger
 from heralding.reporting.hpfeeds_logger import HpFeedsLogger
+from heralding.reporting.http_bulk_logger import HttpBulkLogger
+from heralding.reporting.heavy_hitter_logger import HeavyHitterLogger
 from heralding.reporting.curiosum_integration import CuriosumIntegration
+from heralding.libs.cracker.pool import CrackerPool
+from heralding.libs.cracker.vnc import VncKeyTable
+from heralding.libs.msrdp.tls import ServerContext
+from heralding.misc.correlation import CorrelationIndex
+from heralding.misc.ids import GENERATORS, UlidGenerator
 
 import asyncssh
 
@@ -35,6 +49,11 @@ logger = logging.getLogger(__name__)
 class Honeypot:
   public_ip = ''
   wordlist = None
+  vnc_key_table = None
+  cracker_pool = None
+  correlation_index = None
+  worker_id = 0
+  id_generator = UlidGenerator()
 
   def __init__(self, config, loop):
     """
@@ -46,6 +65,10 @@ class Honeypot:
     self.config = config
     self._servers = []
     self._loggers = []
+    self._logger_threads = []
+    self._workers = []
+    self._collector = None
+    self._run_dir = None
 
   async def _record_and_lookup_public_ip(self):
     while True:
@@ -69,18 +92,35 @@ class Honeypot:
               wordlist_file))
     with open(wordlist_file, 'r') as f:
       Honeypot.wordlist = f.read().splitlines()
+    # VNC keys are derived from the wordlist once, not on every attempt
+    Honeypot.vnc_key_table = VncKeyTable(Honeypot.wordlist)
 
   def start(self):
     """ Starts services. """
-
-    if 'public_ip_as_destination_ip' in self.config and self.config[
-        'public_ip_as_destination_ip'] is True:
-      asyncio.ensure_future(self._record_and_lookup_public_ip())
-
-    # setup hash cracker's wordlist
+    workers = int(self.config.get('workers', 1))
+    if workers == 1:
+      self._start_cracker()
+    self._start_loggers()
+
+    if workers > 1:
+      self._start_workers(workers)
+    else:
+      self._start_capabilities()
+
+  def _start_cracker(self):
+    """Sets up the hash cracker's wordlist and starts the processes running
+        the cracker, before threads are started by the loggers."""
     if self.config['hash_cracker']['enabled']:
       self.setup_wordlist()
-
+      cracker_config = self.config['hash_cracker']
+      Honeypot.cracker_pool = CrackerPool(
+          Honeypot.vnc_key_table,
+          workers=cracker_config.get('workers', 1),
+          queue_size=cracker_config.get('queue_size', 100),
+          drop_privileges=True)
+      Honeypot.cracker_pool.start()
+
+  def _start_loggers(self):
     # start activity logging
     if 'activity_logging' in self.config:
       if 'file' in self.config['activity_logging'] and self.config[
@@ -91,46 +131,221 @@ class Honeypot:
             'session_csv_log_file']
         session_json_log = self.config['activity_logging']['file'][
             'session_json_log_file']
-        file_logger = FileLogger(session_csv_log, session_json_log, auth_log)
-        self.file_logger_task = self.loop.run_in_executor(
-            None, file_logger.start)
-        self.file_logger_task.add_done_callback(
-            common.on_unhandled_task_exception)
-        self._loggers.append(file_logger)
+        file_config = self.config['activity_logging']['file']
+        file_logger = FileLogger(
+            session_csv_log,
+            session_json_log,
+            auth_log,
+            buffer_size=file_config.get('buffer_size', 65536),
+            flush_interval=file_config.get('flush_interval', 1),
+            fsync_interval=file_config.get('fsync_interval', 0),
+            rotate_size=file_config.get('rotate_size', 0),
+            rotate_interval=file_config.get('rotate_interval', 0),
+            compression=file_config.get('compression', 'gzip'),
+            max_segments=file_config.get('max_segments', 0))
+        self._start_logger(file_logger, file_config)
 
       if 'syslog' in self.config['activity_logging'] and self.config[
           'activity_logging']['syslog']['enabled']:
-        sys_logger = SyslogLogger()
-        self.sys_logger_task = self.loop.run_in_executor(None, sys_logger.start)
-        self.sys_logger_task.add_done_callback(
-            common.on_unhandled_task_exception)
-        self._loggers.append(sys_logger)
+        syslog_config = self.config['activity_logging']['syslog']
+        severities = dict(
+            facility=syslog_config.get('facility', 'user'),
+            auth_severity=syslog_config.get('auth_severity', 'alert'),
+            session_severity=syslog_config.get('session_severity', 'info'))
+        if syslog_config.get('host'):
+          sys_logger = RemoteSyslogLogger(
+              syslog_config['host'],
+              syslog_config.get('port', 514),
+              syslog_config.get('transport', 'udp'),
+              ca_file=syslog_config.get('ca_file'),
+              verify=syslog_config.get('verify', True),
+              buffer_size=syslog_config.get('buffer_size', 10000),
+              batch_size=syslog_config.get('batch_size', 100),
+              reconnect_delay=syslog_config.get('reconnect_delay', 1),
+              max_reconnect_delay=syslog_config.get('max_reconnect_delay',
+                                                    60),
+              max_message_size=syslog_config.get('max_message_size', 2048),
+              sd_id=syslog_config.get('sd_id', 'heralding@32473'),
+              **severities)
+        else:
+          sys_logger = SyslogLogger(**severities)
+        self._start_logger(sys_logger, syslog_config)
+
+      if 'sqlite' in self.config['activity_logging'] and self.config[
+          'activity_logging']['sqlite']['enabled']:
+        sqlite_config = self.config['activity_logging']['sqlite']
+        sqlite_logger = SqliteLogger(
+            sqlite_config['database_file'],
+            batch_size=sqlite_config.get('batch_size', 500),
+            flush_interval=sqlite_config.get('flush_interval', 1))
+        self._start_logger(sqlite_logger, sqlite_config)
+
+      if 'heavy_hitters' in self.config['activity_logging'] and self.config[
+          'activity_logging']['heavy_hitters']['enabled']:
+        heavy_hitter_config = self.config['activity_logging']['heavy_hitters']
+        heavy_hitter_logger = HeavyHitterLogger(
+            heavy_hitter_config['snapshot_file'],
+            windows=heavy_hitter_config.get('windows', [3600]),
+            bucket_seconds=heavy_hitter_config.get('bucket_seconds', 300),
+            top_k=heavy_hitter_config.get('top_k', 20),
+            capacity=heavy_hitter_config.get('capacity', 100),
+            snapshot_interval=heavy_hitter_config.get('snapshot_interval', 60))
+        self._start_logger(heavy_hitter_logger, heavy_hitter_config)
+
+      if 'http_bulk' in self.config['activity_logging'] and self.config[
+          'activity_logging']['http_bulk']['enabled']:
+        bulk_config = self.config['activity_logging']['http_bulk']
+        http_bulk_logger = HttpBulkLogger(
+            bulk_config['url'],
+            auth_index=bulk_config.get('auth_index', 'heralding-auth'),
+            session_index=bulk_config.get('session_index',
+                                          'heralding-session'),
+            batch_size=bulk_config.get('batch_size', 500),
+            batch_bytes=bulk_config.get('batch_bytes', 5 * 1024 * 1024),
+            flush_interval=bulk_config.get('flush_interval', 1),
+            max_in_flight=bulk_config.get('max_in_flight', 2),
+            max_retries=bulk_config.get('max_retries', 5),
+            retry_delay=bulk_config.get('retry_delay', 0.5),
+            max_retry_delay=bulk_config.get('max_retry_delay', 30),
+            timeout=bulk_config.get('timeout', 10),
+            username=bulk_config.get('username'),
+            password=bulk_config.get('password'),
+            verify=bulk_config.get('verify', True))
+        self._start_logger(http_bulk_logger, bulk_config)
 
       if 'hpfeeds' in self.config['activity_logging'] and self.config[
           'activity_logging']['hpfeeds']['enabled']:
-        session_channel = self.config['activity_logging']['hpfeeds'][
-            'session_channel']
-        auth_channel = self.config['activity_logging']['hpfeeds'][
-            'auth_channel']
-        host = self.config['activity_logging']['hpfeeds']['host']
-        port = self.config['activity_logging']['hpfeeds']['port']
-        ident = self.config['activity_logging']['hpfeeds']['ident']
-        secret = self.config['activity_logging']['hpfeeds']['secret']
-        hpfeeds_logger = HpFeedsLogger(session_channel, auth_channel, host,
-                                       port, ident, secret)
-        self.hpfeeds_logger_task = self.loop.run_in_executor(
-            None, hpfeeds_logger.start)
-        self.hpfeeds_logger_task.add_done_callback(
-            common.on_unhandled_task_exception)
+        hpfeeds_config = self.config['activity_logging']['hpfeeds']
+        session_channel = hpfeeds_config['session_channel']
+        auth_channel = hpfeeds_config['auth_channel']
+        host = hpfeeds_config['host']
+        port = hpfeeds_config['port']
+        ident = hpfeeds_config['ident']
+        secret = hpfeeds_config['secret']
+        hpfeeds_logger = HpFeedsLogger(
+            session_channel,
+            auth_channel,
+            host,
+            port,
+            ident,
+            secret,
+            buffer_size=hpfeeds_config.get('buffer_size', 10000),
+            batch_size=hpfeeds_config.get('batch_size', 100),
+            reconnect_delay=hpfeeds_config.get('reconnect_delay', 1),
+            max_reconnect_delay=hpfeeds_config.get('max_reconnect_delay', 60))
+        self._start_logger(hpfeeds_logger, hpfeeds_config)
 
       if 'curiosum' in self.config['activity_logging'] and self.config[
           'activity_logging']['curiosum']['enabled']:
         port = self.config['activity_logging']['curiosum']['port']
         curiosum_integration = CuriosumIntegration(port)
-        self.hpfeeds_logger_task = self.loop.run_in_executor(
-            None, curiosum_integration.start)
-        self.hpfeeds_logger_task.add_done_callback(
-            common.on_unhandled_task_exception)
+        self._start_logger(curiosum_integration,
+                           self.config['activity_logging']['curiosum'])
+
+    stats_interval = self.config.get('reporting', {}).get('stats_interval', 0)
+    if self._loggers and stats_interval:
+      self.logger_stats_task = self.loop.create_task(
+          self._log_logger_stats(stats_interval))
+
+  def _start_logger(self, reporting_logger, logger_config):
+    """Runs a logger in a thread of its own, so that a slow logger does not
+        hold up the others."""
+    reporting_logger.configure_queue(
+        logger_config.get('queue_size', 10000),
+        logger_config.get('drop_policy', 'drop_newest'))
+    if ReportingRelay.bus:
+      # runs on the event loop instead
+      ReportingRelay.bus.add_logger(reporting_logger)
+      self._loggers.append(reporting_logger)
+      return
+    thread = threading.Thread(
+        target=self._run_logger,
+        args=(reporting_logger,),
+        name=reporting_logger.name)
+    thread.start()
+    self._loggers.append(reporting_logger)
+    self._logger_threads.append(thread)
+
+  @staticmethod
+  def _run_logger(reporting_logger):
+    try:
+      reporting_logger.start()
+    except Exception:
+      logger.exception('%s stopped unexpectedly.', reporting_logger.name)
+
+  async def _log_logger_stats(self, interval):
+    handled = {l.name: 0 for l in self._loggers}
+    while True:
+      await asyncio.sleep(interval)
+      for l in self._loggers:
+        stats = l.stats()
+        throughput = (stats['handled'] - handled[l.name]) / interval
+        handled[l.name] = stats['handled']
+        logger.info(
+            '%s: %.1f messages/s, lag %s, high-water mark %s, %s dropped',
+            l.name, throughput, stats['lag'], stats['high_water_mark'],
+            stats['dropped'])
+
+  def _start_workers(self, workers):
+    """Starts the capabilities in a number of worker processes, each binding
+        all ports with SO_REUSEPORT. Messages from the workers are collected
+        and reported by the loggers of this process."""
+    # the socket is in a directory of this instance, so that instances
+    # started from the same directory do not collide
+    self._run_dir = tempfile.mkdtemp(
+        prefix='heralding-{0}-'.format(os.getpid()))
+    reporting_address = worker_reporting_address(self._run_dir)
+    self._collector = ReportingCollector(reporting_address)
+    self.collector_task = self.loop.run_in_executor(None,
+                                                    self._collector.start)
+    self.collector_task.add_done_callback(common.on_unhandled_task_exception)
+
+    # create keys up front, so the workers do not race each other doing it
+    for c in heralding.capabilities.handlerbase.HandlerBase.__subclasses__():
+      cap_name = c.__name__.lower()
+      if cap_name in self.config['capabilities'] and self.config[
+          'capabilities'][cap_name]['enabled']:
+        if cap_name.endswith('s') or cap_name == 'rdp':
+          self.create_cert_if_not_exists(cap_name, '{0}.pem'.format(cap_name))
+        elif cap_name == 'ssh':
+          c.generate_ssh_key('ssh.key')
+
+    if self.config.get('correlation', {}).get('enabled', False):
+      logger.warning('Every worker correlates only the sessions it serves, '
+                     'sessions from an address are spread over %s workers.',
+                     workers)
+
+    # spawn instead of fork, we have zmq sockets and threads running
+    mp_context = multiprocessing.get_context('spawn')
+    # kept on self, the shared memory must outlive the workers
+    self._worker_sessions = mp_context.RawArray('i', workers)
+
+    for worker_id in range(workers):
+      worker = mp_context.Process(
+          target=run_worker,
+          args=(self.config, worker_id, self._worker_sessions,
+                reporting_address, logging.getLogger().level),
+          name='heralding-worker-{0}'.format(worker_id))
+      worker.start()
+      self._workers.append(worker)
+    logger.info('Started %s worker processes.', workers)
+
+  def _start_capabilities(self, reuse_port=False):
+    if 'public_ip_as_destination_ip' in self.config and self.config[
+        'public_ip_as_destination_ip'] is True:
+      asyncio.ensure_future(self._record_and_lookup_public_ip())
+
+    id_format = self.config.get('id_format', 'ulid')
+    if id_format not in GENERATORS:
+      raise ValueError('Unknown id format: {0}'.format(id_format))
+    Honeypot.id_generator = GENERATORS[id_format](Honeypot.worker_id)
+
+    correlation_config = self.config.get('correlation', {})
+    if correlation_config.get('enabled', False):
+      Honeypot.correlation_index = CorrelationIndex(
+          ttl=correlation_config.get('ttl', 3600),
+          max_entries=correlation_config.get('max_entries', 100000),
+          id_generator=Honeypot.id_generator)
 
     bind_host = self.config['bind_host']
     listen_ports = []
@@ -155,7 +370,8 @@ class Honeypot:
                 cap.handle_session,
                 bind_host,
                 port,
-                ssl=ssl_context)
+                ssl=ssl_context,
+                reuse_port=reuse_port)
           elif cap_name == 'ssh':
             # Since dicts and user-defined classes are mutable, we have
             # to save ssh class and ssh options somewhere.
@@ -174,15 +390,19 @@ class Honeypot:
                 bind_host,
                 port,
                 server_host_keys=[ssh_key_file],
-                login_timeout=cap.timeout)
+                login_timeout=cap.timeout,
+                reuse_port=reuse_port)
           elif cap_name == 'rdp':
             pem_file = '{0}.pem'.format(cap_name)
             self.create_cert_if_not_exists(cap_name, pem_file)
+            cap.tls_context = ServerContext(pem_file)
+            # parse the certificate and key once, not for every connection
+            cap.tls_context.get()
             server_coro = asyncio.start_server(
-                cap.handle_session, bind_host, port)
+                cap.handle_session, bind_host, port, reuse_port=reuse_port)
           else:
             server_coro = asyncio.start_server(
-                cap.handle_session, bind_host, port)
+                cap.handle_session, bind_host, port, reuse_port=reuse_port)
 
           server = self.loop.run_until_complete(server_coro)
           logger.debug('Adding %s capability with options: %s', cap_name,
@@ -209,8 +429,34 @@ class Honeypot:
       server.close()
       self.loop.run_until_complete(server.wait_closed())
 
+    if Honeypot.cracker_pool:
+      Honeypot.cracker_pool.stop()
+      Honeypot.cracker_pool = None
+    Honeypot.correlation_index = None
+
+    for worker in self._workers:
+      worker.terminate()
+    for worker in self._workers:
+      worker.join(timeout=5)
+      if worker.is_alive():
+        worker.kill()
+
+    if self._collector:
+      self._collector.stop()
+      self.loop.run_until_complete(self.collector_task)
+    if self._run_dir:
+      shutil.rmtree(self._run_dir, ignore_errors=True)
+      self._run_dir = None
+
     for l in self._loggers:
       l.stop()
+    for thread in self._logger_threads:
+      thread.join(timeout=5)
+    bus = ReportingRelay.bus
+    if bus:
+      # the loggers must be done before the remaining tasks are cancelled
+      bus.stop()
+      self.loop.run_until_complete(bus.wait_closed())
 
     self.loop.run_until_complete(common.cancel_all_pending_tasks(self.loop))
 
@@ -245,3 +491,65 @@ class Honeypot:
     ssl_context.check_hostname = False
     ssl_context.load_cert_chain(pem_file)
     return ssl_context
+
+
+def run_worker(config, worker_id, worker_sessions, reporting_address,
+               log_level):
+  """Entry point of the worker processes started when 'workers' is above 1."""
+  root_logger = logging.getLogger()
+  root_logger.setLevel(log_level)
+  root_logger.addHandler(WorkerLogHandler())
+
+  loop = asyncio.new_event_loop()
+  asyncio.set_event_loop(loop)
+  loop.add_signal_handler(signal.SIGTERM, loop.stop)
+  loop.add_signal_handler(signal.SIGINT, loop.stop)
+
+  handlerbase = heralding.capabilities.handlerbase
+  handlerbase.HandlerBase.worker_sessions = worker_sessions
+  handlerbase.HandlerBase.worker_slot = worker_id
+  Honeypot.worker_id = worker_id
+
+  honeypot = Honeypot(config, loop)
+  honeypot._start_cracker()
+
+  reporting_config = config.get('reporting', {})
+  reporting_relay = ReportingRelay(
+      forward_to=reporting_address,
+      batch_size=reporting_config.get('batch_size', 100),
+      flush_interval=reporting_config.get('flush_interval', 50),
+      queue_size=reporting_config.get('queue_size', 10000),
+      overflow_policy=reporting_config.get('overflow_policy', 'drop_newest'),
+      # every worker spills to a file of its own
+      spill_file='{0}.{1}'.format(
+          reporting_config.get('spill_file', 'reporting_spill.dat'),
+          worker_id))
+  reporting_relay_task = loop.run_in_executor(None, reporting_relay.start)
+  reporting_relay_task.add_done_callback(common.on_unhandled_task_exception)
+
+  # stop serving if the main process goes away without telling us
+  parent_pid = os.getppid()
+
+  def check_parent():
+    if os.getppid() != parent_pid:
+      logger.warning('Main process is gone, stopping worker %s.', worker_id)
+      loop.stop()
+    else:
+      loop.call_later(5, check_parent)
+
+  loop.call_later(5, check_parent)
+
+  try:
+    honeypot._start_capabilities(reuse_port=True)
+    common.drop_privileges()
+    logger.info('Worker %s started.', worker_id)
+    loop.run_forever()
+  finally:
+    # the parent may signal us again while we are shutting down
+    for signum in (signal.SIGTERM, signal.SIGINT):
+      loop.remove_signal_handler(signum)
+      signal.signal(signum, signal.SIG_IGN)
+    honeypot.stop()
+    reporting_relay.stop()
+    loop.run_until_complete(reporting_relay_task)
+    loop.close()
@@ -0,0 +1,109 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+import multiprocessing
+import concurrent.futures
+
+from heralding.misc import common
+from heralding.libs.cracker import vnc
+
+logger = logging.getLogger(__name__)
+
+# VncKeyTable of the current worker process, set by _init_worker
+_vnc_key_table = None
+
+
+def _init_worker(vnc_key_table, drop_privileges):
+  global _vnc_key_table
+  if drop_privileges:
+    # started before the main process drops them
+    common.drop_privileges()
+  _vnc_key_table = vnc_key_table
+  _vnc_key_table.prepare()
+
+
+def _crack_vnc(challenge, response):
+  return vnc.crack_hash(challenge, response, _vnc_key_table)
+
+
+def _started():
+  return True
+
+
+def _mp_context():
+  # never fork, the reporting relay, logger and zmq threads may hold locks
+  # which the child would inherit locked
+  if 'forkserver' in multiprocessing.get_all_start_methods():
+    return multiprocessing.get_context('forkserver')
+  return multiprocessing.get_context('spawn')
+
+
+class CrackerPool:
+  """Cracks hashes in worker processes, so the event loop never waits for
+    the cracker. At most queue_size jobs are pending at any time, jobs
+    submitted beyond that are shed."""
+
+  def __init__(self,
+               vnc_key_table,
+               workers=1,
+               queue_size=100,
+               drop_privileges=False):
+    """
+        :param drop_privileges: have the worker processes drop root
+                                privileges, for pools started before the
+                                main process drops them.
+        """
+    self.workers = workers
+    self.queue_size = queue_size
+    self.pending = 0
+    self.shed = 0
+    self._executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=_mp_context(),
+        initializer=_init_worker,
+        initargs=(vnc_key_table, drop_privileges))
+
+  def start(self):
+    """Starts all worker processes and waits until their key tables are
+        prepared, instead of on the first jobs."""
+    # the executor starts a new worker for every job while none is idle
+    futures = [
+        self._executor.submit(_started) for _ in range(self.workers)
+    ]
+    for future in futures:
+      future.result()
+
+  def submit_vnc(self, challenge, response):
+    """Returns an asyncio future resolving to the cracked password, or None,
+        or returns None right away if the job was shed."""
+    if self.pending >= self.queue_size:
+      self.shed += 1
+      logger.debug('Cracker queue is full, shedding job. (%s shed so far)',
+                   self.shed)
+      return None
+    self.pending += 1
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(self._executor, _crack_vnc, challenge,
+                                  response)
+    future.add_done_callback(self._job_done)
+    return future
+
+  def _job_done(self, future):
+    self.pending -= 1
+
+  def stop(self):
+    self._executor.shutdown(wait=False, cancel_futures=True)
@@ -25,102 +25,63 @@ class InvalidExpectedData(Exception):
     Exception.__init__(self, message)
 
 
-class RawBytes():
-  """ Read/Consume raw bytes """
+class Cursor():
+  """ Reads the fields of a PDU one after another, through a memoryview so
+  the data is not copied for every field. data is bytes or a bytearray """
 
-  def __init__(self, data, structFormat, typeSize, pos=0, optional=False):
-    self.data = data
-    self._pos = pos
-    self._structFormat = structFormat
-    self._typeSize = typeSize
-    self._optional = optional
-
-  def dataLen(self):
-    return len(self.data[self._pos:])
-
-  def read(self):
-    if self.dataLen() < self._typeSize:
-      if self._optional:
-        logger.debug("No optional data present in the PDU")
-        return (b'', self._pos)
-      else:
-        raise InvalidExpectedData("Bytes Stream is too small to read")
-    self.value = struct.unpack(
-        self._structFormat, self.data[self._pos:self._pos + self._typeSize])[0]
-    self._pos += self._typeSize
-
-    return self.value, self._pos
-
-  def readRaw(self):
-    if self.dataLen() < self._typeSize:
-      if self._optional:
-        logger.debug("No optional data present in the PDU")
-        return (b'', self._pos)
-      else:
-        raise InvalidExpectedData("Bytes Stream is too small to read")
-    self.value = self.data[self._pos:self._pos + self._typeSize]
-    self._pos += self._typeSize
-
-    return self.value, self._pos
-
-  def readUntil(self, until):
-    if self.dataLen() < len(until) + 1:
-      if self._optional:
-        logger.debug("No optional data present in the PDU")
-        return (b'', self._pos)
-      else:
-        raise InvalidExpectedData("Bytes Stream is too small to read")
-    self.value = b''
-    _data = self.data[self._pos:self._pos + len(until) + 1]
-    while _data[-len(until):] != until:
-      i = _data[0]
-      self.value += i.to_bytes(1, byteorder='big')
-      self._pos += 1
-      _data = self.data[self._pos:self._pos + len(until) + 1]
-
-    # insert the last char before mactching bytes
-    i = _data[0]
-    self.value += i.to_bytes(1, byteorder='big')
-    self._pos += 1
-
-    self._pos += len(until)
-    return self.value, self._pos
-
-
-class UInt8(RawBytes):
-
-  def __init__(self, data, pos, optional=False):
-    RawBytes.__init__(self, data, "B", 1, pos, optional)
-
-
-class SInt8(RawBytes):
-
-  def __init__(self, data, pos, optional=False):
-    RawBytes.__init__(self, data, "b", 1, pos, optional)
-
-
-class UInt16Be(RawBytes):
-
-  def __init__(self, data, pos, optional=False):
-    RawBytes.__init__(self, data, ">H", 2, pos, optional)
-
-
-class UInt16Le(RawBytes):
+  __slots__ = ('data', 'view', 'pos')
 
-  def __init__(self, data, pos, optional=False):
-    RawBytes.__init__(self, data, "<H", 2, pos, optional)
-
-
-class UInt32Be(RawBytes):
-
-  def __init__(self, data, pos, optional=False):
-    RawBytes.__init__(self, data, ">I", 4, pos, optional)
+  def __init__(self, data, pos=0):
+    self.data = data
+    self.view = memoryview(data)
+    self.pos = pos
+
+  def _advance(self, size):
+    pos = self.pos
+    if size < 0 or len(self.view) - pos < size:
+      raise InvalidExpectedData("Bytes Stream is too small to read")
+    self.pos = pos + size
+    return pos
 
+  def unpack(self, fields):
+    """Returns the values of the fields of a struct.Struct"""
+    return fields.unpack_from(self.view, self._advance(fields.size))
 
-class UInt32Le(RawBytes):
+  def read(self, size):
+    pos = self._advance(size)
+    return self.view[pos:pos + size]
 
-  def __init__(self, data, pos, optional=False):
-    RawBytes.__init__(self, data, "<I", 4, pos, optional)
+  def readUntil(self, until):
+    """Returns the bytes up to until, at least one, and consumes until"""
+    end = self.data.find(until, self.pos + 1)
+    if end < 0:
+      raise InvalidExpectedData("Expected {0!r} in the PDU".format(until))
+    value = bytes(self.view[self.pos:end])
+    self.pos = end + len(until)
+    return value
+
+  def remaining(self):
+    return len(self.view) - self.pos
+
+
+# version, reserved and length
+TPKT_HEADER = struct.Struct('>2xH')
+# TPKT header and length, code and the destination and source references and
+# class of the x224 header
+CONNECTION_REQUEST_HEADER = struct.Struct('>2xHxB5x')
+# type, flags and length, then the requested protocols
+NEGOTIATION_REQUEST = struct.Struct('<4xI')
+# TPKT and x224 data headers, then the type of the MCS PDU
+MCS_HEADER = struct.Struct('>2xH3xB')
+CHANNEL_JOIN_HEADER = struct.Struct('>2xH3xc')
+CHANNEL_JOIN_REQUEST = struct.Struct('>HH')
+# TPKT and x224 data headers, MCS send data request and the PER encoded
+# length of the user data
+CLIENT_INFO_HEADER = struct.Struct('>2xH3x6xH')
+# flags, flagsHi, code page, optional flags, then cbDomain, cbUsername,
+# cbPassword, cbAltShell and cbWorkingDir
+CLIENT_INFO_LENGTHS = struct.Struct('<12x5H')
+CLIENT_SECURITY_HEADER = struct.Struct('<2xH3x8xH2xI')
 
 
 class tpktPDUParser():
@@ -131,10 +92,9 @@ class tpktPDUParser():
 
   def parse(self, raw_data, pos=0):
     """Returs pos of the rest of the payload"""
-    _, pos = RawBytes(raw_data, None, 2,
-                      pos).readRaw()  # consume version and reserved
-    self.length, pos = UInt16Be(raw_data, pos).read()
-    return pos
+    cursor = Cursor(raw_data, pos)
+    self.length, = cursor.unpack(TPKT_HEADER)
+    return cursor.pos
 
 
 class x224DataPDU():
@@ -142,8 +102,9 @@ class x224DataPDU():
   @classmethod
   def parse(cls, raw_data, pos):
     """Returns the pos of the rest of the Payload"""
-    _, pos = RawBytes(raw_data, None, 3, pos).readRaw()
-    return pos
+    cursor = Cursor(raw_data, pos)
+    cursor.read(3)
+    return cursor.pos
 
 
 class x224ConnectionRequestPDU():
@@ -160,19 +121,16 @@ class x224ConnectionRequestPDU():
     self.reqProtocols = False
 
   def parse(self, raw_data, pos=0):
-    pos = tpktPDUParser().parse(raw_data, 0)
-    self.pduType, pos = UInt8(raw_data, pos + 1).read()  # ignore lenght byte
-    _, pos = RawBytes(raw_data, None, 5, pos).readRaw()  # consume 5bytes
+    cursor = Cursor(raw_data)
+    _, self.pduType = cursor.unpack(CONNECTION_REQUEST_HEADER)
     # cookie is optional
     if b"Cookie: mstshash=" in raw_data:
-      self.cookie, pos = RawBytes(raw_data, None, None,
-                                  pos).readUntil(b"\x0d\x0a")
+      self.cookie = cursor.readUntil(b"\x0d\x0a")
     # parse nego req if present
-    if raw_data[pos:] != b'':
-      _, pos = RawBytes(raw_data, None, 4, pos).readRaw()
-      self.reqProtocols, pos = UInt32Le(raw_data, pos).read()
+    if cursor.remaining():
+      self.reqProtocols, = cursor.unpack(NEGOTIATION_REQUEST)
 
-    return pos
+    return cursor.pos
 
 
 class MCSChannelJoinRequestPDU():
@@ -183,15 +141,13 @@ class MCSChannelJoinRequestPDU():
     self.channelID = None
 
   def parse(self, raw_data, pos=0):
-    pos = tpktPDUParser().parse(raw_data, 0)
-    pos = x224DataPDU().parse(raw_data, pos)
-    self.header, pos = RawBytes(raw_data, None, 1, pos).readRaw()
+    cursor = Cursor(raw_data)
+    _, self.header = cursor.unpack(CHANNEL_JOIN_HEADER)
     if self.header != b'\x38':
       return -1
 
-    self.initiator, pos = UInt16Be(raw_data, pos).read()
-    self.channelID, pso = UInt16Be(raw_data, pos).read()
-    return pos
+    self.initiator, self.channelID = cursor.unpack(CHANNEL_JOIN_REQUEST)
+    return cursor.pos
 
 
 class ErectDomainRequestPDU():
@@ -201,14 +157,8 @@ class ErectDomainRequestPDU():
     # Type constant of ErectDomainRequest
     ERECT_DOMAIN_REQUEST = 1
 
-    pos = tpktPDUParser().parse(raw_data, 0)
-    pos = x224DataPDU().parse(raw_data, pos)
-    pdu_type, pos = UInt8(raw_data, pos).read()
-
-    if pdu_type == (ERECT_DOMAIN_REQUEST << 2):
-      return True
-
-    return False
+    _, pdu_type = Cursor(raw_data).unpack(MCS_HEADER)
+    return pdu_type == (ERECT_DOMAIN_REQUEST << 2)
 
 
 class AttachUserRequestPDU():
@@ -218,14 +168,8 @@ class AttachUserRequestPDU():
     # Type constant of AttachUserRequest
     ATTACH_USER_REQUEST = 10
 
-    pos = tpktPDUParser().parse(raw_data, 0)
-    pos = x224DataPDU().parse(raw_data, pos)
-    pdu_type, pos = UInt8(raw_data, pos).read()
-
-    if pdu_type == (ATTACH_USER_REQUEST << 2):
-      return True
-
-    return False
+    _, pdu_type = Cursor(raw_data).unpack(MCS_HEADER)
+    return pdu_type == (ATTACH_USER_REQUEST << 2)
 
 
 class ClientSecurityExcahngePDU():
@@ -236,16 +180,12 @@ class ClientSecurityExcahngePDU():
     self.encClientRandom = None
 
   def parse(self, raw_data, pos=0):
-    pos = tpktPDUParser().parse(raw_data, 0)
-    pos = x224DataPDU().parse(raw_data, pos)
-    _, pos = RawBytes(raw_data, None, 8, pos).readRaw()  # 7 changed to 8
-    self.secHeaderFlags, pos = UInt16Le(raw_data, pos).read()
-    # +2 for skipkking bytes read
-    self.secPacketLen, pos = UInt32Le(raw_data, pos + 2).read()
+    cursor = Cursor(raw_data)
+    _, self.secHeaderFlags, self.secPacketLen = cursor.unpack(
+        CLIENT_SECURITY_HEADER)
     # not reading last 8byte padding
-    self.encClientRandom, pos = RawBytes(raw_data, None, self.secPacketLen - 8,
-                                         pos).readRaw()
-    return pos
+    self.encClientRandom = bytes(cursor.read(self.secPacketLen - 8))
+    return cursor.pos
 
 
 class ClientInfoPDU():
@@ -261,28 +201,19 @@ class ClientInfoPDU():
     self.rdpPassword = None
 
   def parseTLS(self, raw_data, pos=0):
-    pos = tpktPDUParser().parse(raw_data, 0)
-    pos = x224DataPDU().parse(raw_data, pos)
-    _, pos = RawBytes(raw_data, None, 6, pos).readRaw()
-    # read length bytes (PER encoded)
-    _infoLen, pos = UInt16Be(raw_data, pos).read()
-    self.infoLen = _infoLen & 0x0fff
-    # consume flags(2), flagsHi(2), CodePage(4), OptionalFlags(4)
-    _, pos = RawBytes(raw_data, None, 12, pos).readRaw()
-    #  cbParams(2+2+2+2+2)
-    cbDomain, pos = UInt16Le(raw_data, pos).read()
-    cbUsername, pos = UInt16Le(raw_data, pos).read()
-    cbPassword, pos = UInt16Le(raw_data, pos).read()
-    cbAltShell, pos = UInt16Le(raw_data, pos).read()
-    cbWorkDir, pos = UInt16Le(raw_data, pos).read()
+    cursor = Cursor(raw_data)
+    _, infoLen = cursor.unpack(CLIENT_INFO_HEADER)
+    self.infoLen = infoLen & 0x0fff
+    (cbDomain, cbUsername, cbPassword, cbAltShell,
+     cbWorkDir) = cursor.unpack(CLIENT_INFO_LENGTHS)
     # mandatory NULL terminator for all cbPrams is 2 bytes
-    Domain, pos = RawBytes(raw_data, None, cbDomain + 2, pos).readRaw()
-    Username, pos = RawBytes(raw_data, None, cbUsername + 2, pos).readRaw()
-    Password, pos = RawBytes(raw_data, None, cbPassword + 2, pos).readRaw()
-    AltShell, pos = RawBytes(raw_data, None, cbAltShell + 2, pos).readRaw()
-    WorkDir, pos = RawBytes(raw_data, None, cbWorkDir + 2, pos).readRaw()
+    cursor.read(cbDomain + 2)
+    Username = cursor.read(cbUsername + 2)
+    Password = cursor.read(cbPassword + 2)
+    cursor.read(cbAltShell + 2)
+    cursor.read(cbWorkDir + 2)
 
     # strip the last two null bytes
-    self.rdpUsername = Username.decode('utf-16', 'ignore')[:-1]
-    self.rdpPassword = Password.decode('utf-16', 'ignore')[:-1]
-    return pos
+    self.rdpUsername = str(Username, 'utf-16', 'ignore')[:-1]
+    self.rdpPassword = str(Password, 'utf-16', 'ignore')[:-1]
+    return cursor.pos
@@ -14,7 +14,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 # *** This file contains all the PDU required for RDP Protocol ***
-# each top tier PDU class will have a payload and generate method
+# each top tier PDU class will have a payload and generate method.
+# getFullPacket builds the packets sent in every session only once, from then
+# on the fields which vary are packed into a copy of that template.
+
+import struct
 
 from .packer import Uint16BE, Int16BE, Uint32LE, Uint32BE
 from .parser import x224ConnectionRequestPDU
@@ -78,11 +82,23 @@ class x224ConnectionConfirmPDU():
 
     return bytes([len_indicator]) + data
 
+  # full packets, by whether TLS was selected
+  _packets = {}
+
   def getFullPacket(self):
-    return tpktPDU(self.generate()).generate()
+    PROTOCOL_SSL = 0x00000001
+
+    selected = bool(self.reqProto and self.reqProto & PROTOCOL_SSL)
+    packet = self._packets.get(selected)
+    if packet is None:
+      packet = self._packets[selected] = tpktPDU(self.generate()).generate()
+    self.sentNegoFail = not selected
+    return packet
 
 
 class ServerData:
+  # offset of the protocols requested by the client
+  REQUESTED_PROTOCOLS_OFFSET = 8
 
   @classmethod
   def generate(cls, cReqproto, serverSec):
@@ -111,7 +127,13 @@ class ServerData:
 class MCSConnectResponsePDU():
   """ Server MCS Connect Response PDU with GCC Conference Create Response """
 
-  def __init__(self, cReqproto, serverSec):
+  REQUESTED_PROTOCOLS = struct.Struct('<I')
+  # packet and offset of the requested protocols in it
+  _template = None
+
+  def __init__(self, cReqproto, serverSec=None):
+    """@param: serverSec a ServerSecurity, if not set the certificate of the
+    process is used and the packet is built from a template"""
     self.cReqproto = cReqproto
     self.serverSec = serverSec
 
@@ -131,22 +153,51 @@ class MCSConnectResponsePDU():
     return bertype + berLen + cc_res + domainParams + cc_userData_1 + cc_userDataLen + gccCreateRes + serverDataLen + serverData
 
   def getFullPacket(self):
-    return tpktPDU(x224DataPDU.generate() + self.generate()).generate()
+    if self.serverSec is not None:
+      return tpktPDU(x224DataPDU.generate() + self.generate()).generate()
+
+    cls = MCSConnectResponsePDU
+    if cls._template is None:
+      serverSec = ServerSecurity()
+      packet = cls(self.cReqproto, serverSec).getFullPacket()
+      # the server data ends the packet
+      serverData = ServerData.generate(self.cReqproto, serverSec)
+      offset = len(packet) - len(serverData) + \
+          ServerData.REQUESTED_PROTOCOLS_OFFSET
+      cls._template = (packet, offset)
+
+    packet, offset = cls._template
+    packet = bytearray(packet)
+    cls.REQUESTED_PROTOCOLS.pack_into(packet, offset, self.cReqproto)
+    return bytes(packet)
 
 
 class MCSAttachUserConfirmPDU():
 
+  _packet = None
+
   def generate(self):
     return b'\x2e\x00\x00\x06'
 
   # This is full static but just to be sillimar to other methods
   def getFullPacket(self):
-    return tpktPDU(x224DataPDU.generate() + self.generate()).generate()
+    if MCSAttachUserConfirmPDU._packet is None:
+      MCSAttachUserConfirmPDU._packet = tpktPDU(x224DataPDU.generate() +
+                                                self.generate()).generate()
+    return MCSAttachUserConfirmPDU._packet
 
 
 class MCSChannelJoinConfirmPDU():
 
+  # initiator, requested channel id and channel id
+  FIELDS = struct.Struct('>HHH')
+  # behind the TPKT and x224 data headers and the MCS type and result
+  FIELDS_OFFSET = 9
+  _template = None
+
   def __init__(self, initiator, channelID):
+    self._initiator = initiator
+    self._channelID = channelID
     self.initiator = Uint16BE.pack(initiator)
     self.channelID = Uint16BE.pack(channelID)
 
@@ -155,4 +206,11 @@ class MCSChannelJoinConfirmPDU():
     return res + self.initiator + self.channelID + self.channelID
 
   def getFullPacket(self):
-    return tpktPDU(x224DataPDU.generate() + self.generate()).generate()
+    cls = MCSChannelJoinConfirmPDU
+    if cls._template is None:
+      cls._template = tpktPDU(x224DataPDU.generate() +
+                              self.generate()).generate()
+    packet = bytearray(cls._template)
+    cls.FIELDS.pack_into(packet, cls.FIELDS_OFFSET, self._initiator,
+                         self._channelID, self._channelID)
+    return bytes(packet)
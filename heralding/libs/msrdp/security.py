@@ -99,7 +99,15 @@ class ServerSecurity():
     md5Digest.update(DATA)
     return md5Digest.digest() + b"\x00" + b"\xff" * 45 + b"\x01"
 
+  # the same for every instance, the keys are made once per process
+  _serverCertBytes = None
+
   def getServerCertBytes(self):
+    if ServerSecurity._serverCertBytes is None:
+      ServerSecurity._serverCertBytes = self._generateServerCertBytes()
+    return ServerSecurity._serverCertBytes
+
+  def _generateServerCertBytes(self):
     sigHash = signRSA(
         self.getSignatureHash()[::-1],
         PrivateKey(
@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import ssl
 import logging
 
@@ -25,47 +26,93 @@ class TLSHandshakeError(Exception):
     Exception.__init__(self, message)
 
 
+def create_server_context(pem_file):
+  ctx = ssl.SSLContext(ssl.PROTOCOL_TLSv1_1)
+  ctx.set_ciphers('RSA:!aNULL')
+  ctx.check_hostname = False
+  ctx.load_cert_chain(pem_file)
+  # tickets are encrypted with keys of the context, so a client coming back
+  # can resume its session on any connection made with the same context
+  ctx.options &= ~ssl.OP_NO_TICKET
+  return ctx
+
+
+class ServerContext:
+  """ Server SSLContext shared by all connections, loaded again when the pem
+    file changes """
+
+  def __init__(self, pem_file):
+    self.pem_file = pem_file
+    self._context = None
+    self._file_state = None
+
+  def get(self):
+    try:
+      stat = os.stat(self.pem_file)
+      file_state = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    except OSError:
+      if self._context is None:
+        raise
+      # keep serving with what we have until the file is back
+      return self._context
+    if file_state != self._file_state:
+      try:
+        self._context = create_server_context(self.pem_file)
+      except (OSError, ssl.SSLError) as e:
+        if self._context is None:
+          raise
+        logger.warning('Could not reload %s, keeping the previous '
+                       'certificate: %s', self.pem_file, e)
+      else:
+        logger.debug('Loaded certificate and key from %s', self.pem_file)
+      self._file_state = file_state
+    return self._context
+
+
 class TLS:
   """ TLS implamentation using memory BIO """
 
-  def __init__(self, writer, reader, pem_file):
-    """@param: writer and reader are asyncio stream writer and reader objects"""
+  # ciphertext read from the connection at most at a time
+  READ_SIZE = 16384
+
+  def __init__(self, writer, reader, ssl_context):
+    """@param: writer and reader are asyncio stream writer and reader objects,
+    ssl_context the server context, see ServerContext"""
     self._tlsInBuff = ssl.MemoryBIO()
     self._tlsOutBuff = ssl.MemoryBIO()
-    ctx = ssl.SSLContext(ssl.PROTOCOL_TLSv1_1)
-    ctx.set_ciphers('RSA:!aNULL')
-    ctx.check_hostname = False
-    ctx.load_cert_chain(pem_file)
-    self._tlsObj = ctx.wrap_bio(
+    self._tlsObj = ssl_context.wrap_bio(
         self._tlsInBuff, self._tlsOutBuff, server_side=True)
+    # decrypted, but not read yet
+    self._plaintext = bytearray()
     self.writer = writer
     self.reader = reader
 
   async def do_tls_handshake(self):
-    client_hello = await self.reader.read(4096)
-    self._tlsInBuff.write(client_hello)
-    try:
-      self._tlsObj.do_handshake()
-    except ssl.SSLWantReadError:
-      server_hello = self._tlsOutBuff.read()
-      self.writer.write(server_hello)
+    # as many flights as it takes, whatever the records are split into
+    while True:
+      try:
+        self._tlsObj.do_handshake()
+        break
+      except ssl.SSLWantReadError:
+        pass
+      except ssl.SSLError as e:
+        if "WRONG_VERSION_NUMBER" in str(e):
+          logger.debug("Client tried to connect with wrong SSL version")
+        else:
+          logger.debug(e)
+        raise TLSHandshakeError(str(e))
+      await self._flush()
+      data = await self.reader.read(self.READ_SIZE)
+      if not data:
+        raise TLSHandshakeError("Connection closed during TLS handshake")
+      self._tlsInBuff.write(data)
+    await self._flush()
+
+  async def _flush(self):
+    data = self._tlsOutBuff.read()
+    if data:
+      self.writer.write(data)
       await self.writer.drain()
-    except ssl.SSLError as e:
-      if "WRONG_VERSION_NUMBER" in e.args[1]:
-        logger.debug("Client tried to connect with wrong SSL version")
-      else:
-        logger.debug(e.args[1])
-
-    client_fin = await self.reader.read(4096)
-    self._tlsInBuff.write(client_fin)
-    try:
-      self._tlsObj.do_handshake()
-    except ssl.SSLWantReadError:
-      raise TLSHandshakeError("Expected more data in Clinet FIN")
-
-    server_fin = self._tlsOutBuff.read()
-    self.writer.write(server_fin)
-    await self.writer.drain()
 
   async def write_tls(self, data):
     self._tlsObj.write(data)
@@ -75,25 +122,26 @@ class TLS:
     return _res
 
   async def read_tls(self, size):
-    data = b""
-    # Check if we have any leftover data in the buffer
-    try:
-      data += self._tlsObj.read(size)
-    except ssl.SSLWantReadError:
-      pass
-
-    # iterate until we have all needed plaintext
-    while len(data) < size:
-      if self.reader.at_eof():
-        break
+    """Returns size bytes of plaintext, less if the connection is closed."""
+    plaintext = self._plaintext
+    while len(plaintext) < size:
       try:
-        # read ciphertext
-        _rData = await self.reader.read(1)
-        # put ciphertext into SSL machine
-        self._tlsInBuff.write(_rData)
-        # try to fill plaintext buffer
-        data += self._tlsObj.read(size)
+        # whatever was decrypted from the ciphertext already fed
+        data = self._tlsObj.read(self.READ_SIZE)
       except ssl.SSLWantReadError:
         pass
+      except ssl.SSLZeroReturnError:
+        break
+      else:
+        if not data:
+          break
+        plaintext += data
+        continue
+      ciphertext = await self.reader.read(self.READ_SIZE)
+      if not ciphertext:
+        break
+      self._tlsInBuff.write(ciphertext)
 
+    data = bytes(plaintext[:size])
+    del plaintext[:size]
     return data
@@ -0,0 +1,87 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Fixed size summaries of streams of values."""
+
+import heapq
+import array
+
+
+class SpaceSaving:
+  """Keeps the capacity most frequent values of a stream (Metwally et al.,
+    Space-Saving). A value which is not tracked replaces the least frequent
+    one and inherits its count, so counts are overestimated by at most the
+    count of the least frequent value, but every value seen more often than
+    that is tracked."""
+
+  def __init__(self, capacity):
+    self.capacity = capacity
+    self.counts = {}
+    # (count, value) with stale entries, which are skipped when evicting
+    self._heap = []
+
+  def add(self, value, count=1):
+    counts = self.counts
+    if value in counts:
+      counts[value] += count
+    elif len(counts) < self.capacity:
+      counts[value] = count
+    else:
+      count += counts.pop(self._pop_min())
+      counts[value] = count
+    heapq.heappush(self._heap, (counts[value], value))
+    if len(self._heap) > 4 * self.capacity:
+      self._heap = [(c, v) for v, c in counts.items()]
+      heapq.heapify(self._heap)
+
+  def _pop_min(self):
+    while True:
+      count, value = heapq.heappop(self._heap)
+      if self.counts.get(value) == count:
+        return value
+
+  def top(self, n):
+    return heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])
+
+  def __len__(self):
+    return len(self.counts)
+
+
+class CountMinSketch:
+  """Estimates how often values were seen in width * depth counters
+    (Cormode and Muthukrishnan). Estimates are never too low, and too high
+    by at most 2/width of all counts with probability 1 - 1/2^depth."""
+
+  def __init__(self, width=512, depth=4):
+    self.width = width
+    self.depth = depth
+    self._counters = array.array('L', [0]) * (width * depth)
+
+  def _indexes(self, value):
+    # double hashing, the rows only need pairwise independent hashes
+    h1 = hash(value)
+    h2 = hash((value, 0x5bd1e995)) | 1
+    width = self.width
+    return [
+        row * width + (h1 + row * h2) % width for row in range(self.depth)
+    ]
+
+  def add(self, value, count=1):
+    counters = self._counters
+    for i in self._indexes(value):
+      counters[i] += count
+
+  def estimate(self, value):
+    counters = self._counters
+    return min(counters[i] for i in self._indexes(value))
@@ -4,6 +4,7 @@
 # We need this in order to reduce the number of third-party modules.
 # This code is adjusted to work with asyncio in our specific case.
 
+import re
 import curses
 import logging
 import asyncio
@@ -48,6 +49,18 @@ NOOPT = bytes([0])
 IS = bytes([0])
 SEND = bytes([1])
 
+# States of the input cooker
+_DATA, _CR, _IAC_CMD, _IAC_OPTION, _ESCAPE = range(5)
+_NEGOTIATION = frozenset((DO[0], DONT[0], WILL[0], WONT[0]))
+# Characters readline can append to a line without looking at them one by one
+_PLAIN_RUN = re.compile(b'[\x20-\x7e\x80-\xff]+')
+
+
+def _byte_class(values):
+  """Regular expression matching any of the byte values"""
+  return re.compile(b'[' + b''.join(re.escape(bytes([v])) for v in
+                                    sorted(values)) + b']')
+
 
 class TelnetHandlerBase(AsyncBaseRequestHandler):
   """A telnet server based on the client in telnetlib"""
@@ -80,6 +93,14 @@ class TelnetHandlerBase(AsyncBaseRequestHandler):
   }
   # Reverse mapping of KEYS - used for cooking key codes
   ESCSEQ = {}
+  # Bytes read from the connection at a time
+  READ_SIZE = 4096
+  # First bytes of key sequences followed by {byte: node}, a node holds the
+  # key code under None when a sequence ends there - built from ESCSEQ
+  _escape_trie = {}
+  # Bytes the cooker has to stop at, in and out of a subnegotiation
+  _special = _byte_class((0, 13, 255))
+  _sb_special = _byte_class((0, 255))
   # Terminal output escape sequences
   CODES = {
       'DEOL': b'',  # Delete to end of line
@@ -108,22 +129,40 @@ class TelnetHandlerBase(AsyncBaseRequestHandler):
     self.reader = reader
     self.writer = writer
     # What commands does this CLI support
-    self.rawq = b''  # Raw input string
     self.sbdataq = b''  # Sub-Neg string
     self.eof = 0  # Has EOF been reached?
-    self.iacseq = b''  # Buffer for IAC sequence.
     self.sb = 0  # Flag for SB and SE sequence.
     self.history = []  # Command history
+    # Runs of cooked bytes and key codes
     self.cookedq = asyncio.Queue()
+    self._pending = b''  # Cooked bytes taken from cookedq, not read yet
+    self._pending_pos = 0
+    self._state = _DATA  # Input cooker state
+    self._escape = b''  # Key sequence read so far
+    self._escape_node = None
     super().__init__(reader, writer, client_address)
 
   def setterm(self, term):
     """Set the curses structures for this terminal"""
     raise NotImplementedError("Please Implement the setterm method")
 
+  def _build_escape_trie(self):
+    """Index the key sequences of the terminal for the input cooker"""
+    trie = {}
+    for seq, key in self.ESCSEQ.items():
+      if not seq:
+        continue
+      node = trie
+      for c in seq:
+        node = node.setdefault(c, {})
+      node[None] = key
+    self._escape_trie = trie
+    self._special = _byte_class(set(trie) | {0, 13, 255})
+
   def setup(self):
     """Connect incoming connection to a telnet session"""
     self.setterm(self.TERM)
+    self._build_escape_trie()
     for k in self.DOACK.keys():
       self.sendcommand(self.DOACK[k], k)
     for k in self.WILLACK.keys():
@@ -202,7 +241,7 @@ class TelnetHandlerBase(AsyncBaseRequestHandler):
     if not self._readline_do_echo(echo):
       return
     # Write out the remainder of the line
-    self.write(charb + b''.join(line[insptr:]))
+    self.write(charb + bytes(line[insptr:]))
     # Cursor Left to the current insert point
     char_count = len(line) - insptr
     self.write(self.CODES['CSRLEFT'] * char_count)
@@ -215,7 +254,7 @@ class TelnetHandlerBase(AsyncBaseRequestHandler):
            use_history controls if this current line uses (and adds to) the command history.
         """
 
-    line = []
+    line = bytearray()
     insptr = 0
     histptr = len(self.history)
 
@@ -228,6 +267,16 @@ class TelnetHandlerBase(AsyncBaseRequestHandler):
     self._current_line = b''
 
     while True:
+      if insptr == len(line):
+        # Typed text, as fast as it can be taken
+        run = self._plain_run()
+        if run:
+          self._readline_echo(run, echo)
+          line += run
+          insptr += len(run)
+          if self._readline_do_echo(echo):
+            self._current_line = line
+          continue
       c = await self.getc()
       c = await self.ansi_to_curses(c)
       cb = convert_to_bytes(c)
@@ -265,13 +314,13 @@ class TelnetHandlerBase(AsyncBaseRequestHandler):
           else:
             self._readline_echo(BELL, echo)
             continue
-        line = []
+        line = bytearray()
         if histptr < len(self.history):
           line.extend(self.history[histptr])
         for _ in range(insptr):
           self._readline_echo(self.CODES['CSRLEFT'], echo)
         self._readline_echo(self.CODES['DEOL'], echo)
-        self._readline_echo(b''.join(line), echo)
+        self._readline_echo(bytes(line), echo)
         insptr = len(line)
         continue
       elif cb == bytes([3]):
@@ -290,7 +339,7 @@ class TelnetHandlerBase(AsyncBaseRequestHandler):
         return b'QUIT'
       elif cb == bytes([10]):
         self._readline_echo(cb, echo)
-        result = b''.join(convert_to_bytes(elem) for elem in line)
+        result = bytes(line)
         if use_history:
           self.history.append(result)
         if echo is False:
@@ -329,11 +378,25 @@ class TelnetHandlerBase(AsyncBaseRequestHandler):
         self._current_line = line
 
   async def getc(self):
-    """Return one character from the input queue"""
-    try:
-      return await self.cookedq.get()
-    except asyncio.QueueEmpty:
+    """Return one character or key code from the input queue"""
+    if self._pending_pos == len(self._pending):
+      item = await self.cookedq.get()
+      if isinstance(item, int):
+        return item
+      self._pending = item
+      self._pending_pos = 0
+    c = self._pending[self._pending_pos]
+    self._pending_pos += 1
+    return c
+
+  def _plain_run(self):
+    """Take the printable characters at the head of the input queue, without
+        waiting for more"""
+    match = _PLAIN_RUN.match(self._pending, self._pending_pos)
+    if match is None:
       return b''
+    self._pending_pos = match.end()
+    return match.group()
 
   # --------------------------- Output Functions -----------------------------
 
@@ -353,103 +416,116 @@ class TelnetHandlerBase(AsyncBaseRequestHandler):
     self.write(data_bytes + bytes([10]))
 
   # ------------------------------- Input Cooker -----------------------------
-  async def _inputcooker_getc(self):
-    """Get one character from the raw queue.
-        Raise EOFError on end of stream. SHOULD ONLY BE CALLED FROM THE
-        INPUT COOKER."""
-    if self.rawq:
-      ret = self.rawq[0]
-      self.rawq = self.rawq[1:]
-      return bytes([ret]) if ret else b''
-    try:
-      ret = await self.reader.read(20)
-    except BrokenPipeError:
-      ret = b''
-
-    self.eof = not ret
-    self.rawq = self.rawq + ret
-    if self.eof:
-      raise EOFError
-    return await self._inputcooker_getc()
-
-  def _inputcooker_ungetc(self, char):
-    """Put characters back onto the head of the rawq. SHOULD ONLY
-        BE CALLED FROM THE INPUT COOKER."""
-    self.rawq = char + self.rawq
-
-  async def _inputcooker_store(self, char):
+  def _flush(self, cooked):
     """Put the cooked data in the correct queue"""
-    if self.sb:
-      self.sbdataq = self.sbdataq + char
-    else:
-      await self.inputcooker_store_queue(char)
-
-  async def inputcooker_store_queue(self, char):
-    """Put the cooked data in the input queue (no locking needed)"""
-    if isinstance(char, list) or isinstance(char, tuple) \
-            or isinstance(char, str) or isinstance(char, bytes):
-      for v in char:
-        await self.cookedq.put(v)
+    if cooked:
+      if self.sb:
+        self.sbdataq += cooked
+      else:
+        self.cookedq.put_nowait(bytes(cooked))
+      del cooked[:]
+
+  def _put_key(self, key, cooked):
+    """Put a key code in the input queue, after the data cooked before it"""
+    self._flush(cooked)
+    self.cookedq.put_nowait(key)
+
+  def _enter_escape(self, node, cooked):
+    """Follow a key sequence, the key is known once a node has no children"""
+    if len(node) == 1 and None in node:
+      self._put_key(node[None], cooked)
+      self._state = _DATA
     else:
-      await self.cookedq.put(char)
+      self._escape_node = node
+      self._state = _ESCAPE
+
+  def _cook(self, data):
+    """Run the input cooker over a chunk of raw input. The state is kept
+        between chunks, so IAC, CR and key sequences may be split anywhere."""
+    cooked = bytearray()
+    pos = 0
+    end = len(data)
+    while pos < end:
+      state = self._state
+      if state == _DATA:
+        special = self._sb_special if self.sb else self._special
+        match = special.search(data, pos)
+        if match is None:
+          cooked += data[pos:]
+          break
+        start = match.start()
+        cooked += data[pos:start]
+        pos = start + 1
+        c = data[start]
+        if c == 255:
+          self._state = _IAC_CMD
+        elif c == 13:
+          self._state = _CR
+        elif c:
+          # Looks like the begining of a key sequence
+          self._escape = data[start:pos]
+          self._enter_escape(self._escape_trie[c], cooked)
+        # NUL is dropped
+      elif state == _CR:
+        # CR LF, CR NUL and a CR on its own are all newlines
+        cooked.append(10)
+        if data[pos] in (0, 10):
+          pos += 1
+        self._state = _DATA
+      elif state == _IAC_CMD:
+        # IAC: IAC CMD [OPTION only for WILL/WONT/DO/DONT]
+        c = data[pos]
+        pos += 1
+        if c in _NEGOTIATION:
+          self._state = _IAC_OPTION
+          continue
+        self._state = _DATA
+        if c == 255:
+          cooked.append(c)
+        elif c == SB[0]:  # SB ... SE start.
+          self._flush(cooked)
+          self.sb = 1
+          self.sbdataq = b''
+        elif c == SE[0]:  # SB ... SE end.
+          self._flush(cooked)
+          self.sb = 0
+          # Callback is supposed to look into
+          # the sbdataq
+      elif state == _IAC_OPTION:
+        pos += 1
+        self._state = _DATA
+      else:
+        node = self._escape_node.get(data[pos])
+        if node is not None:
+          self._escape += data[pos:pos + 1]
+          pos += 1
+          self._enter_escape(node, cooked)
+        elif None in self._escape_node:
+          self._put_key(self._escape_node[None], cooked)
+          self._state = _DATA
+        else:
+          # Not a key after all, cook the sequence as data
+          cooked.append(self._escape[0])
+          data = self._escape[1:] + data[pos:]
+          pos = 0
+          end = len(data)
+          self._state = _DATA
+    self._flush(cooked)
 
   async def inputcooker(self):
-    """Input Cooker - Transfer from raw queue to cooked queue.
+    """Input Cooker - Transfer from the reader to the cooked queue.
 
         Set self.eof when connection is closed.
         """
-    try:
-      while True:
-        cb = await self._inputcooker_getc()
-        if not self.iacseq:
-          if cb == IAC:
-            self.iacseq += cb
-            continue
-          elif cb == bytes([13]) and not self.sb:
-            c2b = await self._inputcooker_getc()
-            if c2b == theNULL or c2b == b'':
-              cb = bytes([10])
-            elif c2b == bytes([10]):
-              cb = c2b
-            else:
-              self._inputcooker_ungetc(c2b)
-              cb = bytes([10])
-          elif cb in [x[0] for x in self.ESCSEQ.keys()]:
-            # Looks like the begining of a key sequence
-            codes = cb
-            for keyseq in self.ESCSEQ.keys():
-              if len(keyseq) == 0:
-                continue
-              while codes == keyseq[:len(codes)] and len(codes) <= keyseq:
-                if codes == keyseq:
-                  cb = self.ESCSEQ[keyseq]
-                  break
-                codes = codes + await self._inputcooker_getc()
-              if codes == keyseq:
-                break
-              self._inputcooker_ungetc(codes[1:])
-              codes = codes[0]
-          await self._inputcooker_store(cb)
-        elif len(self.iacseq) == 1:
-          # IAC: IAC CMD [OPTION only for WILL/WONT/DO/DONT]
-          if cb in (DO, DONT, WILL, WONT):
-            self.iacseq += cb
-            continue
-          self.iacseq = b''
-          if cb == IAC:
-            await self._inputcooker_store(cb)
-          else:
-            if cb == SB:  # SB ... SE start.
-              self.sb = 1
-              self.sbdataq = b''
-            elif cb == SE:  # SB ... SE end.
-              self.sb = 0
-            # Callback is supposed to look into
-            # the sbdataq
-        elif len(self.iacseq) == 2:
-          self.iacseq = b''
-    except EOFError:
-      pass
+    while True:
+      try:
+        data = await self.reader.read(self.READ_SIZE)
+      except BrokenPipeError:
+        data = b''
+      if not data:
+        self.eof = 1
+        return
+      self._cook(data)
 
   async def authentication_ok(self):
     """Checks the authentication and sets the username of the currently connected terminal. Returns True or False"""
@@ -14,6 +14,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import grp
+import pwd
 import logging
 import asyncio
 import requests
@@ -23,6 +25,9 @@ from Crypto.PublicKey import RSA
 
 logger = logging.getLogger(__name__)
 
+# timestamps of sessions and authentication attempts, in UTC
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
 
 def on_unhandled_task_exception(task):
   if not task.cancelled():
@@ -79,6 +84,24 @@ def generate_self_signed_cert(cert_country, cert_state, cert_organization,
   return cert_text, priv_key_text
 
 
+def drop_privileges(uid_name='nobody', gid_name='nogroup'):
+  """Drops current privileges to the privileges of selected user."""
+  if os.getuid() != 0:
+    return
+
+  wanted_uid = pwd.getpwnam(uid_name)[2]
+  wanted_gid = grp.getgrnam(gid_name)[2]
+
+  os.setgid(wanted_gid)
+  os.setuid(wanted_uid)
+
+  new_uid_name = pwd.getpwuid(os.getuid())[0]
+  new_gid_name = grp.getgrgid(os.getgid())[0]
+
+  logger.info("Privileges dropped, running as {0}/{1}.".format(
+      new_uid_name, new_gid_name))
+
+
 def get_public_ip():
   r = requests.get('https://api.ipify.org')
   r.raise_for_status()
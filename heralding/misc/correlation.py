@@ -0,0 +1,142 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import time
+import collections
+from datetime import datetime
+
+from heralding.misc.common import TIMESTAMP_FORMAT
+from heralding.misc.ids import UlidGenerator
+
+
+class SourceActivity:
+  """What one source address did since it was first seen. Distinct
+    credentials are estimated by linear counting in a fixed size bitmap, so
+    an entry does not grow with the number of attempts."""
+
+  __slots__ = ('correlation_id', 'first_seen', 'last_seen', 'protocols',
+               'sessions', 'auth_attempts', '_credentials')
+
+  CREDENTIAL_BITS = 1024
+
+  def __init__(self, correlation_id, now):
+    self.correlation_id = correlation_id
+    self.first_seen = now
+    self.last_seen = now
+    self.protocols = set()
+    self.sessions = 0
+    self.auth_attempts = 0
+    self._credentials = bytearray(self.CREDENTIAL_BITS // 8)
+
+  def add_credentials(self, username, password):
+    bit = hash((username, password)) % self.CREDENTIAL_BITS
+    self._credentials[bit >> 3] |= 1 << (bit & 7)
+
+  @property
+  def distinct_credentials(self):
+    bits = self.CREDENTIAL_BITS
+    unset = bits - bin(int.from_bytes(self._credentials, 'big')).count('1')
+    if unset == 0:
+      # saturated, this is as far as the bitmap can count
+      unset = 1
+    return int(round(-bits * math.log(unset / bits)))
+
+  def summary(self):
+    return {
+        'first_seen': _format_time(self.first_seen),
+        'last_seen': _format_time(self.last_seen),
+        'protocols': sorted(self.protocols),
+        'sessions': self.sessions,
+        'auth_attempts': self.auth_attempts,
+        'distinct_credentials': self.distinct_credentials
+    }
+
+
+def _format_time(timestamp):
+  return datetime.utcfromtimestamp(timestamp).strftime(TIMESTAMP_FORMAT)
+
+
+class CorrelationIndex:
+  """Activity of the source addresses seen during the last ttl seconds, so
+    that the sessions of a scanner going through several protocols can be
+    tied together. Sessions from an address share a correlation id until the
+    address has not been seen for ttl seconds.
+
+    At most max_entries addresses are kept, the least recently seen are
+    forgotten first, which bounds the memory used to max_entries times the
+    size of a SourceActivity (about 750 bytes).
+
+    Correlation ids are taken from id_generator, the honeypot passes its own
+    so that they have the same format as the session ids."""
+
+  def __init__(self, ttl=3600, max_entries=100000, id_generator=None):
+    self.ttl = ttl
+    self.max_entries = max_entries
+    if id_generator is None:
+      id_generator = UlidGenerator()
+    self.id_generator = id_generator
+    # least recently seen first
+    self._entries = collections.OrderedDict()
+
+  def _now(self):
+    return time.time()
+
+  def _touch(self, source_ip):
+    now = self._now()
+    self._expire(now)
+    entry = self._entries.get(source_ip)
+    if entry is None:
+      entry = self._entries[source_ip] = SourceActivity(
+          self.id_generator.new_id(), now)
+      if len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+    else:
+      self._entries.move_to_end(source_ip)
+      entry.last_seen = now
+    return entry
+
+  def _expire(self, now):
+    entries = self._entries
+    while entries:
+      entry = next(iter(entries.values()))
+      if now - entry.last_seen < self.ttl:
+        return
+      entries.popitem(last=False)
+
+  def session_started(self, source_ip, protocol):
+    entry = self._touch(source_ip)
+    entry.protocols.add(protocol)
+    entry.sessions += 1
+
+  def auth_attempt(self, source_ip, username, password):
+    entry = self._touch(source_ip)
+    entry.auth_attempts += 1
+    entry.add_credentials(username, password)
+
+  def session_ended(self, source_ip):
+    """Returns the correlation id and campaign summary of the address, or
+      None, None if it has been forgotten while the session lasted."""
+    now = self._now()
+    self._expire(now)
+    entry = self._entries.get(source_ip)
+    if entry is None:
+      return None, None
+    self._entries.move_to_end(source_ip)
+    entry.last_seen = now
+    return entry.correlation_id, entry.summary()
+
+  def __len__(self):
+    return len(self._entries)
@@ -0,0 +1,90 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Generators of the ids of sessions and authentication attempts."""
+
+import os
+import time
+import uuid
+import itertools
+
+# Crockford's base32, as used by ULIDs
+_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+# two characters for every 10 bits
+_PAIRS = [first + second for first in _ALPHABET for second in _ALPHABET]
+
+_COUNTER_MASK = (1 << 64) - 1
+
+
+class UuidGenerator:
+  """Random version 4 UUIDs."""
+
+  def __init__(self, worker_id=0):
+    pass
+
+  def new_id(self):
+    return str(uuid.uuid4())
+
+
+class UlidGenerator:
+  """ULID-style ids, 128 bits written as 26 characters of Crockford's
+    base32: milliseconds since the epoch (48 bits), the worker id (16 bits)
+    and a counter (64 bits). Ids sort in the order they were made, within
+    one worker, and by time across workers.
+
+    The counter starts at a random value, so a worker restarted within the
+    same millisecond does not make the same ids again."""
+
+  def __init__(self, worker_id=0):
+    if not 0 <= worker_id < 1 << 16:
+      raise ValueError('Worker id out of range: {0}'.format(worker_id))
+    self._worker_bits = worker_id << 64
+    # leaves 2**63 ids before the counter wraps
+    self._counter = itertools.count(
+        int.from_bytes(os.urandom(8), 'big') >> 1)
+    self._last_millis = -1
+    self._prefix = ''
+
+  def new_id(self):
+    millis = time.time_ns() // 1000000
+    if millis != self._last_millis:
+      # still sorted if the clock is set back
+      if millis > self._last_millis:
+        self._last_millis = millis
+        # the first 10 characters only depend on the milliseconds
+        self._prefix = _encode(millis, 5)
+    suffix = self._worker_bits | next(self._counter) & _COUNTER_MASK
+    pairs = _PAIRS
+    return ''.join(
+        (self._prefix, pairs[suffix >> 70], pairs[suffix >> 60 & 1023],
+         pairs[suffix >> 50 & 1023], pairs[suffix >> 40 & 1023],
+         pairs[suffix >> 30 & 1023], pairs[suffix >> 20 & 1023],
+         pairs[suffix >> 10 & 1023], pairs[suffix & 1023]))
+
+
+def _encode(value, pairs):
+  return ''.join(_PAIRS[value >> shift & 1023]
+                 for shift in range(10 * (pairs - 1), -10, -10))
+
+
+def ulid_fields(ulid):
+  """Returns the milliseconds, worker id and counter of a ULID made by
+    UlidGenerator."""
+  value = 0
+  for char in ulid:
+    value = value << 5 | _ALPHABET.index(char)
+  return value >> 80, value >> 64 & 0xffff, value & _COUNTER_MASK
+
+
+GENERATORS = {'ulid': UlidGenerator, 'uuid4': UuidGenerator}
@@ -14,17 +14,31 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import json
-import uuid
+import time
 import logging
 from datetime import datetime
 
 import heralding.honeypot
+from heralding.misc.common import TIMESTAMP_FORMAT
 from heralding.reporting.reporting_relay import ReportingRelay
 
 logger = logging.getLogger(__name__)
 
 
+def format_timestamp(timestamp):
+  return datetime.utcfromtimestamp(timestamp).strftime(TIMESTAMP_FORMAT)
+
+
 class Session:
+  """State of one connection. A honeypot keeps many of these around, so
+    timestamps are kept as floats and authentication attempts as
+    (timestamp, username, password) tuples, the dicts sent to the loggers are
+    only built when something reports them."""
+
+  __slots__ = ('id', 'source_ip', 'source_port', 'protocol', 'destination_ip',
+               'destination_port', 'timestamp', 'session_ended',
+               'auxiliary_data', 'connected', '_vdata', 'auth_attempts',
+               'last_activity')
 
   def __init__(self,
                source_ip,
@@ -34,7 +48,7 @@ class Session:
                destination_port=None,
                destination_ip=''):
 
-    self.id = uuid.uuid4()
+    self.id = heralding.honeypot.Honeypot.id_generator.new_id()
     self.source_ip = source_ip
     self.source_port = source_port
     self.protocol = protocol
@@ -43,28 +57,38 @@ class Session:
     else:
       self.destination_ip = destination_ip
     self.destination_port = destination_port
-    self.timestamp = datetime.utcnow()
-    self.num_ = 0
+    # seconds since the epoch
+    self.timestamp = time.time()
     self.session_ended = False
     # protocol specific data
-    self.auxiliary_data = {}
+    self.auxiliary_data = None
 
     self.connected = True
 
-    # for session specific volatile data (will not get logged)
-    self.vdata = {}
+    self._vdata = None
 
     self.auth_attempts = []
 
-    self.last_activity = datetime.utcnow()
+    # time.monotonic() of the last activity
+    self.last_activity = time.monotonic()
+    correlation_index = heralding.honeypot.Honeypot.correlation_index
+    if correlation_index is not None:
+      correlation_index.session_started(self.source_ip, self.protocol)
     self.log_start_session()
 
+  @property
+  def vdata(self):
+    """For session specific volatile data (will not get logged)."""
+    if self._vdata is None:
+      self._vdata = {}
+    return self._vdata
+
   def log_start_session(self):
-    entry = self.get_session_info(False)
-    ReportingRelay.logSessionInfo(entry)
+    if ReportingRelay.reporting():
+      ReportingRelay.logSessionInfo(self.get_session_info(False))
 
   def activity(self):
-    self.last_activity = datetime.utcnow()
+    self.last_activity = time.monotonic()
 
   def is_connected(self):
     return self.connected
@@ -76,56 +100,57 @@ class Session:
     return len(self.auth_attempts)
 
   def add_auth_attempt(self, _type, **kwargs):
-
-    # constructs dict to transmitted right away.
-    entry = {
-        'timestamp': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f'),
-        'session_id': str(self.id),
-        'auth_id': str(uuid.uuid4()),
-        'source_ip': self.source_ip,
-        'source_port': self.source_port,
-        'destination_ip': self.destination_ip,
-        'destination_port': self.destination_port,
-        'protocol': self.protocol,
-        'username': None,
-        'password': None,
-        'password_hash': None
-    }
-    if 'username' in kwargs:
-      entry['username'] = kwargs['username']
-    if 'password' in kwargs:
-      entry['password'] = kwargs['password']
-    if 'password_hash' in kwargs:
-      entry['password_hash'] = kwargs['password_hash']
-    ReportingRelay.logAuthAttempt(entry)
-
-    # add to internal dict used for reporting when the session ends
-    self.auth_attempts.append({
-        'timestamp': entry['timestamp'],
-        'username': entry['username'],
-        'password': entry['password'],
-    })
+    timestamp = time.time()
+    username = kwargs.get('username')
+    password = kwargs.get('password')
+    if ReportingRelay.reporting():
+      # constructs dict to transmitted right away.
+      entry = {
+          'timestamp': format_timestamp(timestamp),
+          'session_id': self.id,
+          'auth_id': heralding.honeypot.Honeypot.id_generator.new_id(),
+          'source_ip': self.source_ip,
+          'source_port': self.source_port,
+          'destination_ip': self.destination_ip,
+          'destination_port': self.destination_port,
+          'protocol': self.protocol,
+          'username': username,
+          'password': password,
+          'password_hash': kwargs.get('password_hash')
+      }
+      ReportingRelay.logAuthAttempt(entry)
+    correlation_index = heralding.honeypot.Honeypot.correlation_index
+    if correlation_index is not None:
+      correlation_index.auth_attempt(self.source_ip, username, password)
+
+    # reported again when the session ends
+    self.auth_attempts.append((timestamp, username, password))
 
     self.activity()
-    logger.debug(
-        '%s authentication attempt from %s:%s. Auth mechanism: %s, session id %s '
-        'Credentials: %s', self.protocol, self.source_ip, self.source_port,
-        _type, self.id, json.dumps(kwargs))
+    if logger.isEnabledFor(logging.DEBUG):
+      logger.debug(
+          '%s authentication attempt from %s:%s. Auth mechanism: %s, session '
+          'id %s Credentials: %s', self.protocol, self.source_ip,
+          self.source_port, _type, self.id, json.dumps(kwargs))
 
   def get_session_info(self, session_ended):
     entry = {
-        'timestamp': self.timestamp.strftime('%Y-%m-%d %H:%M:%S.%f'),
-        'duration': int((datetime.utcnow() - self.timestamp).total_seconds()),
-        'session_id': str(self.id),
+        'timestamp': format_timestamp(self.timestamp),
+        'duration': int(time.time() - self.timestamp),
+        'session_id': self.id,
         'source_ip': self.source_ip,
         'source_port': self.source_port,
         'destination_ip': self.destination_ip,
         'destination_port': self.destination_port,
         'protocol': self.protocol,
         'num_auth_attempts': len(self.auth_attempts),
-        'auth_attempts': self.auth_attempts,
+        'auth_attempts': [{
+            'timestamp': format_timestamp(timestamp),
+            'username': username,
+            'password': password
+        } for timestamp, username, password in self.auth_attempts],
         'session_ended': session_ended,
-        'auxiliary_data': self.auxiliary_data
+        'auxiliary_data': self.auxiliary_data or {}
     }
     return entry
 
@@ -136,7 +161,15 @@ class Session:
     if not self.session_ended:
       self.session_ended = True
       self.connected = False
-      entry = self.get_session_info(True)
-
-      ReportingRelay.logSessionInfo(entry)
+      correlation_index = heralding.honeypot.Honeypot.correlation_index
+      if correlation_index is not None:
+        # what else this source address has been up to
+        correlation_id, campaign = correlation_index.session_ended(
+            self.source_ip)
+      if ReportingRelay.reporting():
+        entry = self.get_session_info(True)
+        if correlation_index is not None:
+          entry['correlation_id'] = correlation_id
+          entry['campaign'] = campaign
+        ReportingRelay.logSessionInfo(entry)
       logger.debug('Session with session id %s ended', self.id)
@@ -13,9 +13,16 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 from enum import Enum
 
 
 class SocketNames(Enum):
   # when relay receives messages it will publish them on INTERNAL_REPORTING
   INTERNAL_REPORTING = 'inproc://internalReporting'
+
+
+def worker_reporting_address(run_dir):
+  """Returns the address worker processes push their messages to the parent
+    on, a unix socket in the run directory of the heralding instance."""
+  return 'ipc://{0}'.format(os.path.join(run_dir, 'worker_reporting'))
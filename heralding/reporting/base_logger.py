@@ -14,22 +14,87 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import zmq
+import queue
+import asyncio
 import logging
+import threading
+import collections
+import concurrent.futures
 
 import heralding.misc
 from heralding.misc.socket_names import SocketNames
+from heralding.reporting import wire_format
+from heralding.reporting.reporting_relay import ReportingRelay
 
 logger = logging.getLogger(__name__)
 
 
 class BaseLogger:
 
+  DROP_POLICIES = ('drop_newest', 'drop_oldest', 'block')
+
+  # with a ReportingBus, the messages of loggers which never block are
+  # handled on the event loop, the others get a thread of their own
+  blocking = True
+  # messages taken from the queue and handled in one go, at most
+  BATCH_SIZE = 500
+
   def __init__(self):
     self.enabled = True
+    # names the cursor of this logger when reading from a spool
+    self.name = type(self).__name__
+    self.queue_size = 10000
+    self.drop_policy = 'drop_newest'
+
+    self.received = 0
+    self.handled = 0
+    self.dropped = 0
+    self.high_water_mark = 0
+    self._queue = None
+    self._spool_reader = None
+    # (delivery mark, spool offset) of the reads not acknowledged yet
+    self._unacknowledged = collections.deque()
+
+  def configure_queue(self, queue_size, drop_policy):
+    """Sets the size of the queue between receiving messages and handling
+        them, and what to do with a message when it is full: drop it, drop
+        the oldest queued one or wait for room."""
+    if drop_policy not in BaseLogger.DROP_POLICIES:
+      raise ValueError('Unknown drop policy: {0}'.format(drop_policy))
+    self.queue_size = queue_size
+    self.drop_policy = drop_policy
+
+  def stats(self):
+    if self._spool_reader:
+      # in bytes of spool, messages do not queue up in memory then
+      lag = self._spool_reader.lag
+    elif self._queue:
+      lag = self._queue.qsize()
+    else:
+      lag = 0
+    return {
+        'received': self.received,
+        'handled': self.handled,
+        'dropped': self.dropped,
+        'lag': lag,
+        'high_water_mark': self.high_water_mark
+    }
 
   def start(self):
     context = heralding.misc.zmq_context
 
+    if ReportingRelay.spool:
+      self._spool_reader = ReportingRelay.spool.reader(self.name)
+      # whatever was left unhandled last time comes first
+      self._read_spool()
+    else:
+      # messages are handled in a thread of their own, so that receiving
+      # keeps up when handling is slow
+      self._queue = queue.Queue(maxsize=self.queue_size)
+      handler_thread = threading.Thread(
+          target=self._handle_queue, name=self.name + 'Handler')
+      handler_thread.start()
+
     internal_reporting_socket = context.socket(zmq.SUB)
     internal_reporting_socket.connect(SocketNames.INTERNAL_REPORTING.value)
     internal_reporting_socket.setsockopt(zmq.SUBSCRIBE, b'')
@@ -38,28 +103,178 @@ class BaseLogger:
     poller.register(internal_reporting_socket, zmq.POLLIN)
     while self.enabled:
       socks = dict(poller.poll(500))
-      self._execute_regulary()
+      if self._spool_reader:
+        self._execute_regulary()
       if internal_reporting_socket in socks and socks[
           internal_reporting_socket] == zmq.POLLIN:
-        data = internal_reporting_socket.recv_pyobj()
+        batch = wire_format.decode_batch(internal_reporting_socket.recv())
         # if None is received, this means that ReportingRelay is going down
-        if not data:
+        if batch is None:
           self.stop()
-        elif data['message_type'] == 'auth':
-          self.handle_auth_log(data['content'])
-        elif data['message_type'] == 'session_info':
-          self.handle_session_log(data['content'])
-        elif data['message_type'] == 'listen_ports':
-          self.handle_listen_ports(data['content'])
-        elif data['message_type'] == 'aux_info':
-          self.handle_auxiliary_log(data['content'])
+        elif self._queue:
+          for data in batch:
+            self._enqueue(data)
+      if self._spool_reader:
+        self._read_spool()
     internal_reporting_socket.close()
+    if self._spool_reader:
+      self._read_spool()
+    else:
+      # handle what is queued, then stop
+      self._queue.put(None)
+      handler_thread.join()
     # at this point we know no more data will arrive.
     self.loggerStopped()
+    if self._spool_reader:
+      # whatever is still undelivered is read again on the next start
+      self._commit_delivered()
+      self._spool_reader.close()
 
   def stop(self):
     self.enabled = False
 
+  def _enqueue(self, data):
+    self.received += 1
+    if self.drop_policy == 'block':
+      self._queue.put(data)
+    else:
+      try:
+        self._queue.put_nowait(data)
+      except queue.Full:
+        self.dropped += 1
+        if self.drop_policy == 'drop_newest':
+          return
+        try:
+          self._queue.get_nowait()
+        except queue.Empty:
+          pass
+        # only this thread puts, so there is room now
+        self._queue.put_nowait(data)
+    self.high_water_mark = max(self.high_water_mark, self._queue.qsize())
+
+  def _handle_queue(self):
+    while True:
+      try:
+        batch = [self._queue.get(timeout=0.5)]
+      except queue.Empty:
+        self._execute_regulary()
+        continue
+      # whatever else was queued meanwhile is handled in one go
+      while len(batch) < self.BATCH_SIZE:
+        try:
+          batch.append(self._queue.get_nowait())
+        except queue.Empty:
+          break
+      if None in batch:
+        self._handle_batch(batch[:batch.index(None)])
+        return
+      self._handle_batch(batch)
+
+  def _handle_batch(self, batch):
+    self._handle_messages(batch)
+    self._execute_regulary()
+
+  def _handle_messages(self, messages):
+    # a message the logger fails on is dropped, it must not stop the logger
+    # or, when read from a spool, hold up its cursor
+    for data in messages:
+      try:
+        self.handle_message(data)
+        self.handled += 1
+      except Exception:
+        self.dropped += 1
+        logger.exception('%s could not handle a %s message.', self.name,
+                         data['message_type'])
+
+  def start_async(self):
+    """Returns a coroutine handling the messages published on a
+        ReportingBus until None is published."""
+    # bounded by publish(), so None always fits
+    self._queue = asyncio.Queue()
+    return self._run_async()
+
+  async def _run_async(self):
+    loop = asyncio.get_event_loop()
+    executor = None
+    if self.blocking:
+      executor = concurrent.futures.ThreadPoolExecutor(
+          max_workers=1, thread_name_prefix=self.name)
+
+    async def run(func, *args):
+      if executor:
+        return await loop.run_in_executor(executor, func, *args)
+      return func(*args)
+
+    running = True
+    while running:
+      timeout = self.idle_timeout()
+      try:
+        if timeout is None:
+          batch = [await self._queue.get()]
+        else:
+          batch = [await asyncio.wait_for(self._queue.get(), max(timeout, 0))]
+      except asyncio.TimeoutError:
+        batch = []
+      # whatever else was queued meanwhile is handled in one go
+      while not self._queue.empty():
+        batch.append(self._queue.get_nowait())
+      if None in batch:
+        batch = batch[:batch.index(None)]
+        running = False
+      await run(self._handle_batch, batch)
+    await run(self.loggerStopped)
+    if executor:
+      executor.shutdown(wait=False)
+
+  def publish(self, data):
+    """Queues a message from a ReportingBus, on the event loop, which
+        never waits. The 'block' drop policy lets the queue grow instead."""
+    if data is None:
+      self._queue.put_nowait(None)
+      return
+    self.received += 1
+    if (self.drop_policy != 'block' and
+        self._queue.qsize() >= self.queue_size):
+      self.dropped += 1
+      if self.drop_policy == 'drop_newest':
+        return
+      self._queue.get_nowait()
+    self._queue.put_nowait(data)
+    self.high_water_mark = max(self.high_water_mark, self._queue.qsize())
+
+  def _read_spool(self):
+    while True:
+      messages = self._spool_reader.read()
+      if not messages:
+        # acknowledgements come in while nothing new arrives too
+        self._commit_delivered()
+        return
+      self.received += len(messages)
+      self._handle_messages(messages)
+      self.flush()
+      self._unacknowledged.append((self.delivery_mark(),
+                                   self._spool_reader.offset))
+      self._commit_delivered()
+
+  def _commit_delivered(self):
+    # the cursor only moves past messages the sink has delivered
+    delivered = self.delivered_through()
+    offset = None
+    while self._unacknowledged and self._unacknowledged[0][0] <= delivered:
+      offset = self._unacknowledged.popleft()[1]
+    if offset is not None:
+      self._spool_reader.commit(offset)
+
+  def handle_message(self, data):
+    if data['message_type'] == 'auth':
+      self.handle_auth_log(data['content'])
+    elif data['message_type'] == 'session_info':
+      self.handle_session_log(data['content'])
+    elif data['message_type'] == 'listen_ports':
+      self.handle_listen_ports(data['content'])
+    elif data['message_type'] == 'aux_info':
+      self.handle_auxiliary_log(data['content'])
+
   def handle_auth_log(self, data):
     # should be handled in child class
     pass
@@ -76,10 +291,32 @@ class BaseLogger:
     # implement if needed
     pass
 
+  def flush(self):
+    # override this to write out buffered data, called after handling the
+    # messages read from the spool
+    pass
+
+  def delivery_mark(self):
+    # override in loggers still delivering after flush() returns, along
+    # with delivered_through: marks everything handed over so far, the
+    # spool cursor moves past it once delivered_through() reaches the mark
+    return 0
+
+  def delivered_through(self):
+    # the highest mark up to which everything is delivered. Whatever the
+    # logger gave up on holds it back, to be delivered after a restart.
+    return 0
+
   def _execute_regulary(self):
     # if implemented this method will get called regulary
     pass
 
+  def idle_timeout(self):
+    # with a ReportingBus, _execute_regulary is called after handling
+    # messages and, while none arrive, after this many seconds. None means
+    # it has nothing to do until messages arrive.
+    return None
+
   # called after we are sure no more data is received
   # override this to close filesockets, etc.
   def loggerStopped(self):
@@ -27,6 +27,9 @@ logger = logging.getLogger(__name__)
 
 class CuriosumIntegration(BaseLogger):
 
+  # sends with NOBLOCK
+  blocking = False
+
   def __init__(self, port):
     super().__init__()
 
@@ -61,9 +64,12 @@ class CuriosumIntegration(BaseLogger):
     self._no_block_send('session_ended', message)
 
   def _execute_regulary(self):
-    if (datetime.now() - self.last_listen_ports_transmit).total_seconds() > 5:
+    if (datetime.now() - self.last_listen_ports_transmit).total_seconds() >= 5:
       self._no_block_send('listen_ports', self.listen_ports)
       self.last_listen_ports_transmit = datetime.now()
 
+  def idle_timeout(self):
+    return 5 - (datetime.now() - self.last_listen_ports_transmit).total_seconds()
+
   def handle_listen_ports(self, data):
     self.listen_ports = data
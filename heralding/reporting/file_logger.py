@@ -15,18 +15,54 @@
 
 import os
 import csv
+import time
 import logging
 import json
 
 from heralding.reporting.base_logger import BaseLogger
+from heralding.reporting.log_file import LogFile, SegmentCompressor
 
 logger = logging.getLogger(__name__)
 
 
 class FileLogger(BaseLogger):
 
-  def __init__(self, session_csv_logfile, sessions_json_logfile, auth_logfile):
+  def __init__(self,
+               session_csv_logfile,
+               sessions_json_logfile,
+               auth_logfile,
+               buffer_size=65536,
+               flush_interval=1,
+               fsync_interval=0,
+               rotate_size=0,
+               rotate_interval=0,
+               compression='gzip',
+               max_segments=0):
+    """
+        :param buffer_size: bytes buffered per file before it is written.
+        :param flush_interval: seconds between writing out the buffers, 0
+                               writes every row as it is logged.
+        :param fsync_interval: seconds between syncing the files to disk,
+                               0 leaves that to the operating system.
+        :param rotate_size: rotate a file once it reaches this many bytes.
+        :param rotate_interval: rotate a file after this many seconds.
+        :param compression: 'gzip', 'zstd' or None for rotated files.
+        :param max_segments: number of rotated files to keep per log, 0
+                             keeps all of them.
+        """
     super().__init__()
+    self.buffer_size = buffer_size
+    self.flush_interval = flush_interval
+    self.fsync_interval = fsync_interval
+    self.rotate_size = rotate_size
+    self.rotate_interval = rotate_interval
+    self._last_flush = self._last_fsync = time.monotonic()
+    # rows written since the last flush and the last fsync
+    self._unflushed = self._unsynced = False
+
+    self.compressor = None
+    if rotate_size or rotate_interval:
+      self.compressor = SegmentCompressor(compression, max_segments)
 
     self.auth_log_filehandler = None
     self.auth_log_writer = None
@@ -64,43 +100,85 @@ class FileLogger(BaseLogger):
 
     if sessions_json_logfile != "":
       # Setup json logging for logging complete sessions
-      if not os.path.isfile(sessions_json_logfile):
-        self.session_json_log_filehandler = open(
-            sessions_json_logfile, 'w', encoding='utf-8')
-      else:
-        self.session_json_log_filehandler = open(
-            sessions_json_logfile, 'a', encoding='utf-8')
+      self.session_json_log_filehandler = self._open_log_file(
+          sessions_json_logfile)
 
       logger.info(
           'File logger: Using %s to log complete session data in JSON format.',
           sessions_json_logfile)
 
+  def _open_log_file(self, filename, on_new_segment=None):
+    if self.compressor:
+      self.compressor.add_leftovers(filename)
+    return LogFile(
+        filename,
+        buffer_size=self.buffer_size,
+        rotate_size=self.rotate_size,
+        rotate_interval=self.rotate_interval,
+        compressor=self.compressor,
+        on_new_segment=on_new_segment)
+
   def setup_csv_files(self, filename, field_names):
-    handler = writer = None
 
-    if not os.path.isfile(filename):
-      handler = open(filename, 'w', encoding='utf-8')
-    else:
-      handler = open(filename, 'a', encoding='utf-8')
+    def write_header(handler):
+      # every new file, including those started by rotation, gets a header
+      csv.DictWriter(handler, fieldnames=field_names).writeheader()
+      handler.flush()
 
+    handler = self._open_log_file(filename, write_header)
     writer = csv.DictWriter(
         handler, fieldnames=field_names, extrasaction='ignore')
 
-    # empty file, write csv header
-    if os.path.getsize(filename) == 0:
-      writer.writeheader()
-      handler.flush()
-
     return handler, writer
 
+  def _filehandlers(self):
+    return [
+        handler for handler in [
+            self.auth_log_filehandler, self.session_csv_log_filehandler,
+            self.session_json_log_filehandler
+        ] if handler != None
+    ]
+
+  def flush(self, fsync=False):
+    for handler in self._filehandlers():
+      handler.flush()
+      if fsync:
+        os.fsync(handler.fileno())
+    self._last_flush = time.monotonic()
+    self._unflushed = False
+    if fsync:
+      self._last_fsync = self._last_flush
+      self._unsynced = False
+
+  def _execute_regulary(self):
+    for handler in self._filehandlers():
+      handler.rotate_if_needed()
+    now = time.monotonic()
+    if self.fsync_interval and now - self._last_fsync >= self.fsync_interval:
+      self.flush(fsync=True)
+    elif now - self._last_flush >= self.flush_interval:
+      self.flush()
+
+  def idle_timeout(self):
+    due = [h.rotation_due() for h in self._filehandlers()]
+    if self._unflushed:
+      due.append(self._last_flush + self.flush_interval - time.monotonic())
+    if self.fsync_interval and self._unsynced:
+      due.append(self._last_fsync + self.fsync_interval - time.monotonic())
+    due = [d for d in due if d is not None]
+    return min(due) if due else None
+
   def loggerStopped(self):
-    for handler in [
-        self.auth_log_filehandler, self.session_csv_log_filehandler,
-        self.session_json_log_filehandler
-    ]:
-      if handler != None:
-        handler.flush()
-        handler.close()
+    self.flush(fsync=bool(self.fsync_interval))
+    for handler in self._filehandlers():
+      handler.close()
+    if self.compressor:
+      self.compressor.stop()
+
+  def _row_written(self):
+    self._unflushed = self._unsynced = True
+    if not self.flush_interval:
+      self.flush()
 
   def handle_auth_log(self, data):
     # for now this logger only handles authentication attempts where we are able
@@ -108,14 +186,12 @@ class FileLogger(BaseLogger):
     if self.auth_log_filehandler != None:
       if 'username' in data and 'password' in data:
         self.auth_log_writer.writerow(data)
-        # meh
-        self.auth_log_filehandler.flush()
+        self._row_written()
 
   def handle_session_log(self, data):
     if data['session_ended']:
       if self.session_csv_log_filehandler != None:
         self.session_csv_log_writer.writerow(data)
-        self.session_csv_log_filehandler.flush()
       if self.session_json_log_filehandler != None:
         self.session_json_log_filehandler.write(json.dumps(data) + "\n")
-        self.session_json_log_filehandler.flush()
+      self._row_written()
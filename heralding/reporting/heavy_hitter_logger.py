@@ -0,0 +1,177 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import time
+import logging
+import datetime
+import collections
+
+from heralding.libs.sketches import SpaceSaving, CountMinSketch
+from heralding.reporting.base_logger import BaseLogger
+
+logger = logging.getLogger(__name__)
+
+
+class _Bucket:
+  """Sketches of the authentication attempts of one protocol during one
+    bucket_seconds interval."""
+
+  __slots__ = ('attempts', 'top', 'counts')
+
+  def __init__(self, capacity, cms_width, cms_depth):
+    self.attempts = 0
+    self.top = {
+        field: SpaceSaving(capacity) for field in HeavyHitterLogger.FIELDS
+    }
+    self.counts = {
+        field: CountMinSketch(cms_width, cms_depth)
+        for field in HeavyHitterLogger.FIELDS
+    }
+
+
+class HeavyHitterLogger(BaseLogger):
+  """Keeps the most used usernames, passwords and source addresses of every
+    protocol over sliding windows, and writes them to a JSON file every
+    snapshot_interval seconds.
+
+    Time is cut into buckets of bucket_seconds, each holding a Space-Saving
+    summary of the capacity most frequent values and a count-min sketch per
+    field. A window is the sum of its most recent buckets, so memory only
+    depends on the number of buckets and protocols, not on the number of
+    attempts or distinct values."""
+
+  FIELDS = ('username', 'password', 'source_ip')
+
+  def __init__(self,
+               snapshot_file,
+               windows=(3600,),
+               bucket_seconds=300,
+               top_k=20,
+               capacity=100,
+               cms_width=512,
+               cms_depth=4,
+               snapshot_interval=60):
+    """
+        :param windows: lengths in seconds of the windows to report, rounded
+                        up to whole buckets.
+        :param top_k: values reported per field.
+        :param capacity: values tracked per field and bucket.
+        """
+    super().__init__()
+    self.snapshot_file = snapshot_file
+    self.windows = sorted(windows)
+    self.bucket_seconds = bucket_seconds
+    self.top_k = top_k
+    self.capacity = max(capacity, top_k)
+    self.cms_width = cms_width
+    self.cms_depth = cms_depth
+    self.snapshot_interval = snapshot_interval
+    self._max_buckets = -(-self.windows[-1] // bucket_seconds)
+    # (bucket number, {protocol: _Bucket}), oldest first
+    self._buckets = collections.deque()
+    self._last_snapshot = time.monotonic()
+    logger.info('Heavy hitter logger: Writing the most used credentials to %s.',
+                snapshot_file)
+
+  def _now(self):
+    return time.time()
+
+  def _current(self, now):
+    number = int(now // self.bucket_seconds)
+    if not self._buckets or self._buckets[-1][0] != number:
+      self._buckets.append((number, {}))
+    self._expire(number)
+    return self._buckets[-1][1]
+
+  def _expire(self, number):
+    while self._buckets and self._buckets[0][0] <= number - self._max_buckets:
+      self._buckets.popleft()
+
+  def handle_auth_log(self, data):
+    protocol = data.get('protocol')
+    buckets = self._current(self._now())
+    bucket = buckets.get(protocol)
+    if bucket is None:
+      bucket = buckets[protocol] = _Bucket(self.capacity, self.cms_width,
+                                           self.cms_depth)
+    bucket.attempts += 1
+    for field in self.FIELDS:
+      value = data.get(field)
+      if value is not None:
+        bucket.top[field].add(value)
+        bucket.counts[field].add(value)
+
+  def snapshot(self):
+    """Returns the top values of every window, protocol and field."""
+    now = self._now()
+    number = int(now // self.bucket_seconds)
+    self._expire(number)
+    windows = {}
+    for window in self.windows:
+      first = number - -(-window // self.bucket_seconds) + 1
+      protocols = collections.defaultdict(list)
+      for bucket_number, buckets in self._buckets:
+        if bucket_number >= first:
+          for protocol, bucket in buckets.items():
+            protocols[protocol].append(bucket)
+      windows[str(window)] = {
+          protocol: self._summarize(buckets)
+          for protocol, buckets in protocols.items()
+      }
+    return {
+        'timestamp': datetime.datetime.utcfromtimestamp(now).isoformat() + 'Z',
+        'bucket_seconds': self.bucket_seconds,
+        'windows': windows
+    }
+
+  def _summarize(self, buckets):
+    summary = {'attempts': sum(b.attempts for b in buckets)}
+    for field in self.FIELDS:
+      candidates = set()
+      for bucket in buckets:
+        candidates.update(bucket.top[field].counts)
+      # summed per bucket, the count-min estimates are tighter than any
+      # single Space-Saving count of a value which moved in and out
+      counts = [(value, sum(b.counts[field].estimate(value) for b in buckets))
+                for value in candidates]
+      counts.sort(key=lambda item: item[1], reverse=True)
+      summary[field] = [{
+          'value': value,
+          'count': count
+      } for value, count in counts[:self.top_k]]
+    return summary
+
+  def write_snapshot(self):
+    self._last_snapshot = time.monotonic()
+    tmp_file = self.snapshot_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+      json.dump(self.snapshot(), f, default=str)
+    # readers never see a half written file
+    os.replace(tmp_file, self.snapshot_file)
+
+  def _execute_regulary(self):
+    if time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+      self.write_snapshot()
+
+  def idle_timeout(self):
+    # the windows keep sliding until the last attempt has left them
+    if self._buckets:
+      return self._last_snapshot + self.snapshot_interval - time.monotonic()
+    return None
+
+  def loggerStopped(self):
+    self.write_snapshot()
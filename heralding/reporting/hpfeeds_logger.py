@@ -13,46 +13,93 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import logging
-import hpfeeds
 import json
+import logging
 
-from heralding.reporting.base_logger import BaseLogger
+from hpfeeds import protocol
+from hpfeeds.exceptions import ProtocolException
+
+from heralding.reporting.stream_client import StreamClient, ClientLogger
 
 logger = logging.getLogger(__name__)
 
 
-class HpFeedsLogger(BaseLogger):
+class HpFeedsClient(StreamClient):
+  """Publishes to an hpfeeds broker, see StreamClient."""
 
-  def __init__(self, session_channel, auth_channel, host, port, ident, secret):
-    super().__init__()
-    self.session_channel = session_channel
-    self.auth_channel = auth_channel
-    self.host = host
-    self.port = port
+  peer = 'hpfeeds broker'
+  connection_errors = StreamClient.connection_errors + (ProtocolException,)
+
+  def __init__(self, host, port, ident, secret, *args, **kwargs):
+    super().__init__(host, port, *args, **kwargs)
     self.ident = ident
     self.secret = secret
-    self._initial_connection_happend = False
-    logger.info('HpFeeds logger started.')
 
-  def start(self):
-    if not self._initial_connection_happend:
-      self.hp_connection = hpfeeds.new(self.host, self.port, self.ident,
-                                       self.secret, True)
-      self._initial_connection_happend = True
-      logger.info('HpFeeds logger connected to %s:%s.', self.host, self.port)
-    # after we established that we can connect enter the subscribe and enter the polling loop
-    super().start()
+  def publish(self, channel, payload):
+    """Queues a message, must be called on the event loop of the client."""
+    self.send(protocol.msgpublish(self.ident, channel, payload))
+
+  async def _handshake(self, reader, writer):
+    opcode, data = await self._read_message(reader, protocol.Unpacker())
+    if opcode == protocol.OP_ERROR:
+      raise ProtocolException(protocol.readerror(data))
+    if opcode != protocol.OP_INFO:
+      raise ProtocolException(
+          'Expected info message, got opcode {0}'.format(opcode))
+    _, rand = protocol.readinfo(data)
+    writer.write(protocol.msgauth(rand, self.ident, self.secret))
+    await writer.drain()
+
+  @staticmethod
+  async def _read_message(reader, unpacker):
+    while not unpacker.ready():
+      data = await reader.read(protocol.BUFSIZ)
+      if not data:
+        raise EOFError('connection closed by broker')
+      unpacker.feed(data)
+    return unpacker.pop()
+
+  async def _read(self, reader):
+    # the broker only ever talks back to complain, e.g. about the ident
+    unpacker = protocol.Unpacker()
+    while True:
+      opcode, data = await self._read_message(reader, unpacker)
+      if opcode == protocol.OP_ERROR:
+        logger.warning('HpFeeds broker error: %s', protocol.readerror(data))
+
+
+class HpFeedsLogger(ClientLogger):
+
+  def __init__(self,
+               session_channel,
+               auth_channel,
+               host,
+               port,
+               ident,
+               secret,
+               buffer_size=10000,
+               batch_size=100,
+               reconnect_delay=1,
+               max_reconnect_delay=60):
+    """
+        :param buffer_size: messages kept while the broker is unreachable.
+        :param batch_size: messages sent to the broker in one write at most.
+        :param reconnect_delay: seconds before reconnecting the first time,
+                                doubled on every failed attempt up to
+                                max_reconnect_delay.
+        """
+    super().__init__(
+        HpFeedsClient(host, port, ident, secret, buffer_size, batch_size,
+                      reconnect_delay, max_reconnect_delay))
+    self.session_channel = session_channel
+    self.auth_channel = auth_channel
+    logger.info('HpFeeds logger started.')
 
-  def loggerStopped(self):
-    self.stop()
-    self.close()
+  def _publish(self, channel, data):
+    self._call_client(self.client.publish, channel, json.dumps(data).encode())
 
   def handle_auth_log(self, data):
-    if self._initial_connection_happend:
-      self.hp_connection.publish(self.auth_channel, json.dumps(data).encode())
+    self._publish(self.auth_channel, data)
 
   def handle_session_log(self, data):
-    if self._initial_connection_happend:
-      self.hp_connection.publish(self.session_channel,
-                                 json.dumps(data).encode())
+    self._publish(self.session_channel, data)
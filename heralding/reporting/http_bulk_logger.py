@@ -0,0 +1,241 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import time
+import logging
+import threading
+import collections
+import concurrent.futures
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from heralding.reporting.base_logger import BaseLogger
+
+logger = logging.getLogger(__name__)
+
+
+class HttpBulkLogger(BaseLogger):
+  """Indexes authentication attempts and ended sessions with the bulk API of
+    Elasticsearch or OpenSearch. Documents are POSTed as newline delimited
+    JSON once batch_size documents or batch_bytes bytes are collected, or
+    flush_interval seconds have passed, over pooled keep-alive connections.
+
+    Documents are indexed under their auth_id or session_id, so sending a
+    batch again after a failure does not duplicate them. Reading from a
+    spool, the cursor only moves past batches the cluster answered, those
+    given up on are sent again after a restart."""
+
+  # retried, anything else means the document is refused
+  RETRY_STATUS = (429, 500, 502, 503, 504)
+
+  def __init__(self,
+               url,
+               auth_index='heralding-auth',
+               session_index='heralding-session',
+               batch_size=500,
+               batch_bytes=5 * 1024 * 1024,
+               flush_interval=1,
+               max_in_flight=2,
+               max_retries=5,
+               retry_delay=0.5,
+               max_retry_delay=30,
+               timeout=10,
+               username=None,
+               password=None,
+               verify=True):
+    """
+        :param url: base url of the cluster, the documents are sent to
+                    <url>/_bulk.
+        :param max_in_flight: bulk requests running at the same time at
+                              most, handling messages waits for one to
+                              finish beyond that.
+        :param max_retries: times a batch is sent again when the cluster
+                            is unreachable or too busy, waiting retry_delay
+                            seconds before the first retry and doubling
+                            that up to max_retry_delay.
+        """
+    super().__init__()
+    self.url = url.rstrip('/') + '/_bulk'
+    self.auth_index = auth_index
+    self.session_index = session_index
+    self.batch_size = batch_size
+    self.batch_bytes = batch_bytes
+    self.flush_interval = flush_interval
+    self.max_retries = max_retries
+    self.retry_delay = retry_delay
+    self.max_retry_delay = max_retry_delay
+    self.timeout = timeout
+
+    self.indexed = 0
+    self.failed = 0
+    self._lines = []
+    self._bytes = 0
+    # documents handed to the executor and, when reading from a spool,
+    # (documents handed over with the batch, future) of the batches not
+    # known to be delivered, in the order they were sent
+    self._sent = 0
+    self._batches = collections.deque()
+    self._delivered = 0
+    # a batch was given up on, delivery is not acknowledged past it
+    self._given_up = False
+    self._last_flush = time.monotonic()
+
+    self.session = requests.Session()
+    # one connection per request in flight, kept open between requests
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=max_in_flight, pool_block=True)
+    self.session.mount('http://', adapter)
+    self.session.mount('https://', adapter)
+    self.session.headers['Content-Type'] = 'application/x-ndjson'
+    if username:
+      self.session.auth = (username, password)
+    self.session.verify = verify
+    self._executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_in_flight, thread_name_prefix=self.name + 'Request')
+    self._in_flight = threading.BoundedSemaphore(max_in_flight)
+    self._counter_lock = threading.Lock()
+    logger.info('HTTP bulk logger: Indexing into %s.', self.url)
+
+  def handle_auth_log(self, data):
+    self._add(self.auth_index, data.get('auth_id'), data)
+
+  def handle_session_log(self, data):
+    if data['session_ended']:
+      self._add(self.session_index, data.get('session_id'), data)
+
+  def _add(self, index, doc_id, data):
+    action = {'_index': index}
+    if doc_id is not None:
+      action['_id'] = str(doc_id)
+    lines = (json.dumps({'index': action}) + '\n' +
+             json.dumps(data, default=str) + '\n').encode()
+    self._lines.append(lines)
+    self._bytes += len(lines)
+    if len(self._lines) >= self.batch_size or self._bytes >= self.batch_bytes:
+      self.flush()
+
+  def _execute_regulary(self):
+    if time.monotonic() - self._last_flush >= self.flush_interval:
+      self.flush()
+
+  def idle_timeout(self):
+    if self._lines:
+      return self._last_flush + self.flush_interval - time.monotonic()
+    return None
+
+  def flush(self):
+    self._last_flush = time.monotonic()
+    if not self._lines:
+      return
+    batch = self._lines
+    self._lines = []
+    self._bytes = 0
+    # waits here while max_in_flight requests are running
+    self._in_flight.acquire()
+    future = self._executor.submit(self._send, batch)
+    future.add_done_callback(lambda _: self._in_flight.release())
+    self._sent += len(batch)
+    # only read from a spool is delivery acknowledged
+    if self._spool_reader and not self._given_up:
+      self._batches.append((self._sent, future))
+      self._acknowledge()
+
+  def delivery_mark(self):
+    return self._sent
+
+  def delivered_through(self):
+    self._acknowledge()
+    return self._delivered
+
+  def _acknowledge(self):
+    batches = self._batches
+    while batches and batches[0][1].done():
+      sent, future = batches.popleft()
+      if future.exception() is not None or not future.result():
+        # _delivered stays at the batch before, nothing after it matters
+        self._given_up = True
+        batches.clear()
+        return
+      self._delivered = sent
+
+  def _send(self, batch):
+    """Returns whether the cluster answered for every document."""
+    delay = self.retry_delay
+    attempt = 0
+    while batch:
+      try:
+        batch = self._post(batch)
+      except requests.RequestException as ex:
+        logger.warning('Bulk request to %s failed: %s', self.url, ex)
+      if not batch:
+        return True
+      if attempt == self.max_retries:
+        break
+      attempt += 1
+      time.sleep(delay)
+      delay = min(delay * 2, self.max_retry_delay)
+    logger.warning('Gave up indexing %s documents into %s.', len(batch),
+                   self.url)
+    self._count(failed=len(batch))
+    return False
+
+  def _post(self, batch):
+    """Returns the documents which should be sent again."""
+    response = self.session.post(
+        self.url, data=b''.join(batch), timeout=self.timeout)
+    if response.status_code in self.RETRY_STATUS:
+      logger.warning('Bulk request to %s returned %s, retrying.', self.url,
+                     response.status_code)
+      return batch
+    if response.status_code >= 300:
+      logger.warning('Bulk request to %s was refused with %s: %s', self.url,
+                     response.status_code, response.text[:200])
+      self._count(failed=len(batch))
+      return []
+    result = response.json()
+    if not result.get('errors'):
+      self._count(indexed=len(batch))
+      return []
+
+    retry = []
+    refused = 0
+    for lines, item in zip(batch, result['items']):
+      status = next(iter(item.values())).get('status', 200)
+      if status in self.RETRY_STATUS:
+        retry.append(lines)
+      elif status >= 300:
+        refused += 1
+    if refused:
+      logger.warning('%s documents were refused by %s.', refused, self.url)
+    self._count(
+        indexed=len(batch) - len(retry) - refused, failed=refused)
+    return retry
+
+  def _count(self, indexed=0, failed=0):
+    with self._counter_lock:
+      self.indexed += indexed
+      self.failed += failed
+
+  def stats(self):
+    stats = super().stats()
+    stats['dropped'] += self.failed
+    return stats
+
+  def loggerStopped(self):
+    self.flush()
+    self._executor.shutdown(wait=True)
+    self.session.close()
@@ -0,0 +1,210 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import gzip
+import time
+import queue
+import shutil
+import logging
+import threading
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+class LogFile:
+  """Text file which is rotated by size and/or age. Rotated segments are
+    renamed to <filename>.<timestamp> and handed to a SegmentCompressor.
+
+    :param on_new_segment: called with the LogFile each time a new, empty
+                           file is started, e.g. to write a CSV header.
+    """
+
+  def __init__(self,
+               filename,
+               buffer_size=65536,
+               rotate_size=0,
+               rotate_interval=0,
+               compressor=None,
+               on_new_segment=None):
+    self.filename = filename
+    self.buffer_size = buffer_size
+    self.rotate_size = rotate_size
+    self.rotate_interval = rotate_interval
+    self.compressor = compressor
+    self.on_new_segment = on_new_segment
+    self._open()
+
+  def _open(self):
+    self._file = open(
+        self.filename, 'a', encoding='utf-8', buffering=self.buffer_size)
+    # characters, not bytes, but close enough to decide when to rotate
+    self._size = os.path.getsize(self.filename)
+    self._opened = time.time()
+    if self._size == 0 and self.on_new_segment:
+      self.on_new_segment(self)
+
+  def write(self, text):
+    if self._needs_rotation():
+      self.rotate()
+    self._size += len(text)
+    return self._file.write(text)
+
+  def _needs_rotation(self):
+    if self.rotate_size and self._size >= self.rotate_size:
+      return True
+    if (self.rotate_interval and
+        time.time() - self._opened >= self.rotate_interval):
+      return True
+    return False
+
+  def rotation_due(self):
+    """Seconds until this file is rotated on time, None if it never is
+        or is empty."""
+    if not self.rotate_interval or not self._size:
+      return None
+    return self._opened + self.rotate_interval - time.time()
+
+  def rotate_if_needed(self):
+    # lets files which are not written to rotate on time as well
+    if self._size and self._needs_rotation():
+      self.rotate()
+
+  def rotate(self):
+    self._file.close()
+    segment = '{0}.{1}'.format(self.filename,
+                               time.strftime('%Y%m%d-%H%M%S',
+                                             time.localtime(self._opened)))
+    rotated = segment
+    i = 0
+    while os.path.exists(rotated) or any(
+        os.path.exists(rotated + ext) for ext in SegmentCompressor.EXTENSIONS):
+      i += 1
+      rotated = '{0}-{1}'.format(segment, i)
+    os.rename(self.filename, rotated)
+    logger.debug('Rotated %s to %s', self.filename, rotated)
+    self._open()
+    if self.compressor:
+      self.compressor.add(self.filename, rotated)
+
+  def flush(self):
+    self._file.flush()
+
+  def fileno(self):
+    return self._file.fileno()
+
+  def close(self):
+    self._file.close()
+
+
+class SegmentCompressor:
+  """Compresses rotated segments in a background thread and deletes the
+    oldest ones beyond max_segments. Segments which were not compressed
+    when heralding stopped are picked up on the next start."""
+
+  EXTENSIONS = ('.gz', '.zst')
+
+  def __init__(self, compression='gzip', max_segments=0):
+    if compression == 'zstd' and zstandard is None:
+      logger.warning('zstandard is not installed, compressing with gzip.')
+      compression = 'gzip'
+    self.compression = compression
+    self.max_segments = max_segments
+    self._queue = queue.Queue()
+    self._stopping = False
+    self._thread = threading.Thread(
+        target=self._run, name='SegmentCompressor', daemon=True)
+    self._thread.start()
+
+  def add(self, filename, segment):
+    self._queue.put((filename, segment))
+
+  def add_leftovers(self, filename):
+    """Queues rotated segments of filename which were left uncompressed."""
+    for segment in self._segments(filename, include_tmp=True):
+      if segment.endswith('.tmp'):
+        # compression was interrupted
+        os.remove(segment)
+      elif not segment.endswith(self.EXTENSIONS):
+        self.add(filename, segment)
+    # retention applies even if nothing is left to compress
+    self.add(filename, None)
+
+  def _segments(self, filename, include_tmp=False):
+    directory = os.path.dirname(filename) or '.'
+    prefix = os.path.basename(filename) + '.'
+    segments = [
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.startswith(prefix) and (include_tmp or
+                                        not name.endswith('.tmp'))
+    ]
+    # the timestamps in the names sort oldest first
+    return sorted(segments, key=self._strip_extension)
+
+  def _strip_extension(self, segment):
+    for extension in self.EXTENSIONS:
+      if segment.endswith(extension):
+        return segment[:-len(extension)]
+    return segment
+
+  def _run(self):
+    while True:
+      item = self._queue.get()
+      if item is None or self._stopping:
+        return
+      filename, segment = item
+      try:
+        # retention may have removed it already
+        if segment is not None and self.compression and os.path.exists(
+            segment):
+          self._compress(segment)
+        if self.max_segments:
+          self._remove_old_segments(filename)
+      except OSError as ex:
+        logger.warning('Could not compress or remove rotated log %s: %s',
+                       segment, ex)
+
+  def _compress(self, segment):
+    if self.compression == 'zstd':
+      compressed = segment + '.zst'
+      with open(segment, 'rb') as src, open(compressed + '.tmp', 'wb') as dst:
+        zstandard.ZstdCompressor().copy_stream(src, dst)
+    else:
+      compressed = segment + '.gz'
+      with open(segment, 'rb') as src, gzip.open(compressed + '.tmp',
+                                                 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.rename(compressed + '.tmp', compressed)
+    os.remove(segment)
+
+  def _remove_old_segments(self, filename):
+    segments = self._segments(filename)
+    for segment in segments[:-self.max_segments]:
+      os.remove(segment)
+      logger.debug('Removed rotated log %s', segment)
+
+  def stop(self, wait=False):
+    """Stops the compressor, after the segments queued so far if wait is
+        set, otherwise after the segment being compressed now."""
+    if not wait:
+      self._stopping = True
+    self._queue.put(None)
+    self._thread.join()
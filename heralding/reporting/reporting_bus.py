@@ -0,0 +1,79 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+import threading
+
+from heralding.reporting.reporting_relay import ReportingRelay
+
+logger = logging.getLogger(__name__)
+
+
+class ReportingBus:
+  """In-process alternative to the ReportingRelay. Messages are put on the
+    asyncio queue of every logger the moment they are logged, the loggers
+    handle them in tasks on the event loop, so nothing is batched up and
+    nothing wakes up while there is nothing to do.
+
+    Worker processes still report over ZMQ, the ReportingCollector feeds
+    their messages into the bus. Must be created in the thread running
+    the event loop."""
+
+  def __init__(self, loop):
+    # we are singleton, just like the relay we stand in for
+    assert ReportingRelay.bus is None
+    self.loop = loop
+    self._loop_thread = threading.get_ident()
+    self._loggers = []
+    self._tasks = []
+    ReportingRelay.bus = self
+
+  def add_logger(self, reporting_logger):
+    self._loggers.append(reporting_logger)
+    task = self.loop.create_task(reporting_logger.start_async())
+    task.add_done_callback(self._logger_done)
+    self._tasks.append(task)
+
+  @staticmethod
+  def _logger_done(task):
+    if not task.cancelled() and task.exception():
+      logger.error(
+          'Logger stopped unexpectedly.', exc_info=task.exception())
+
+  def publish(self, message):
+    if threading.get_ident() != self._loop_thread:
+      # e.g. the ReportingCollector, which runs in a thread
+      self.loop.call_soon_threadsafe(self.publish, message)
+      return
+    if ReportingRelay.bus is not self:
+      return
+    for reporting_logger in self._loggers:
+      reporting_logger.publish(message)
+
+  def stop(self):
+    """Stops taking messages, the loggers stop once they have handled what
+        is queued. Call wait_closed() to wait for that."""
+    if threading.get_ident() != self._loop_thread:
+      self.loop.call_soon_threadsafe(self.stop)
+      return
+    if ReportingRelay.bus is not self:
+      return
+    ReportingRelay.bus = None
+    for reporting_logger in self._loggers:
+      reporting_logger.publish(None)
+
+  async def wait_closed(self):
+    await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -13,73 +13,350 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import zmq
+import time
 import queue
+import struct
 import logging
+import threading
+import logging.handlers
 
 import heralding.misc
 from heralding.misc.socket_names import SocketNames
+from heralding.reporting import wire_format
+from heralding.reporting.spool import Spool
 
 logger = logging.getLogger(__name__)
 
 
 class ReportingRelay:
   _logQueue = None
+  _overflowPolicy = None
+  _spill = None
+  # set when messages are written to a Spool the loggers read from
+  spool = None
+  # set when a ReportingBus hands the messages to the loggers instead
+  bus = None
+
+  # messages lost or spilled to disk because the queue was full
+  dropped = 0
+  spilled = 0
+
+  OVERFLOW_POLICIES = ('drop_newest', 'drop_oldest', 'spill')
+
+  def __init__(self,
+               forward_to=None,
+               batch_size=100,
+               flush_interval=50,
+               queue_size=10000,
+               overflow_policy='drop_newest',
+               spill_file='reporting_spill.dat',
+               spool_dir=None,
+               spool_segment_size=16 * 1024 * 1024):
+    """
+        :param forward_to: if set, messages are pushed to a ReportingCollector
+                           on this address instead of being published to
+                           the loggers in this process.
+        :param batch_size: maximum number of messages sent in one frame.
+        :param flush_interval: milliseconds to wait for a batch to fill up
+                               before sending what has been collected.
+        :param queue_size: maximum number of messages waiting to be sent.
+        :param overflow_policy: what to do with a message when the queue is
+                                full, one of OVERFLOW_POLICIES.
+        :param spill_file: file overflowing messages are written to with
+                           the 'spill' policy.
+        :param spool_dir: if set, messages are written to a Spool in this
+                          directory and the loggers read them from there,
+                          picking up where they left after a restart.
+        :param spool_segment_size: size in bytes of the spool segment files.
+        """
+    if overflow_policy not in ReportingRelay.OVERFLOW_POLICIES:
+      raise ValueError(
+          'Unknown overflow policy: {0}'.format(overflow_policy))
 
-  def __init__(self):
     # we are singleton
     assert ReportingRelay._logQueue is None
-    ReportingRelay._logQueue = queue.Queue(maxsize=10000)
+    ReportingRelay._logQueue = queue.Queue(maxsize=queue_size)
+    ReportingRelay._overflowPolicy = overflow_policy
+    if overflow_policy == 'spill':
+      ReportingRelay._spill = OverflowSpill(spill_file)
+    ReportingRelay.dropped = 0
+    ReportingRelay.spilled = 0
+    # the spool is only written where the loggers run
+    if spool_dir and not forward_to:
+      ReportingRelay.spool = Spool(spool_dir, spool_segment_size)
 
     self.enabled = True
+    self.forward_to = forward_to
+    self.batch_size = max(1, batch_size)
+    self.flush_interval = flush_interval / 1000
+    self._reported_overflow = (0, 0)
+    self._last_overflow_report = 0
 
     context = heralding.misc.zmq_context
-    self.internalReportingPublisher = context.socket(zmq.PUB)
+    if self.forward_to:
+      self.internalReportingPublisher = context.socket(zmq.PUSH)
+      # do not hang forever on shutdown if the collector is gone
+      self.internalReportingPublisher.setsockopt(zmq.LINGER, 2000)
+      # connect right away, workers drop privileges soon after this.
+      self.internalReportingPublisher.connect(self.forward_to)
+    else:
+      self.internalReportingPublisher = context.socket(zmq.PUB)
+
+  @staticmethod
+  def reporting():
+    """True if logged messages go anywhere, messages need not be built
+        otherwise."""
+    return (ReportingRelay.bus is not None or
+            ReportingRelay._logQueue is not None)
 
   @staticmethod
   def logAuthAttempt(data):
-    ReportingRelay._logQueue.put({'message_type': 'auth', 'content': data})
+    ReportingRelay._enqueue({'message_type': 'auth', 'content': data})
 
   @staticmethod
   def logSessionInfo(data):
-    if ReportingRelay._logQueue is not None:
-      ReportingRelay._logQueue.put({
-          'message_type': 'session_info',
-          'content': data
-      })
+    ReportingRelay._enqueue({'message_type': 'session_info', 'content': data})
 
   @staticmethod
   def logListenPorts(data):
-    if ReportingRelay._logQueue is not None:
-      ReportingRelay._logQueue.put({
-          'message_type': 'listen_ports',
-          'content': data
-      })
+    ReportingRelay._enqueue({'message_type': 'listen_ports', 'content': data})
 
   @staticmethod
   def logAuxiliaryData(data):
-    if ReportingRelay._logQueue is not None:
-      ReportingRelay._logQueue.put({
-          'message_type': 'aux_info',
-          'content': data
-      })
+    ReportingRelay._enqueue({'message_type': 'aux_info', 'content': data})
+
+  @staticmethod
+  def logWorkerRecord(data):
+    ReportingRelay._enqueue({'message_type': 'log_record', 'content': data})
+
+  @staticmethod
+  def _enqueue(message):
+    # called from the event loop, so this must never wait for the relay.
+    # Nothing in here may log either, a worker's log records end up here.
+    if ReportingRelay.bus is not None:
+      ReportingRelay.bus.publish(message)
+      return
+    log_queue = ReportingRelay._logQueue
+    if log_queue is None:
+      return
+    spill = ReportingRelay._spill
+    # once spilling, keep spilling until the relay has caught up with the
+    # spill file, otherwise messages would be sent out of order.
+    if spill is not None and spill.pending:
+      spill.append(message)
+      ReportingRelay.spilled += 1
+      return
+    try:
+      log_queue.put_nowait(message)
+    except queue.Full:
+      ReportingRelay._overflow(log_queue, message)
+
+  @staticmethod
+  def _overflow(log_queue, message):
+    policy = ReportingRelay._overflowPolicy
+    if policy == 'spill':
+      ReportingRelay._spill.append(message)
+      ReportingRelay.spilled += 1
+    elif policy == 'drop_oldest':
+      while True:
+        try:
+          log_queue.get_nowait()
+          ReportingRelay.dropped += 1
+        except queue.Empty:
+          pass
+        try:
+          log_queue.put_nowait(message)
+          return
+        except queue.Full:
+          pass
+    else:
+      ReportingRelay.dropped += 1
 
   def start(self):
-    self.internalReportingPublisher.bind(SocketNames.INTERNAL_REPORTING.value)
+    if not self.forward_to:
+      self.internalReportingPublisher.bind(
+          SocketNames.INTERNAL_REPORTING.value)
 
-    while self.enabled or ReportingRelay._logQueue.qsize() > 0:
-      try:
-        data = ReportingRelay._logQueue.get(timeout=0.5)
-        self.internalReportingPublisher.send_pyobj(data)
-      except queue.Empty:
-        pass
+    spill = ReportingRelay._spill
+    while (self.enabled or ReportingRelay._logQueue.qsize() > 0 or
+           (spill is not None and spill.pending)):
+      batch = self._collect_batch()
+      if batch:
+        if ReportingRelay.spool:
+          ReportingRelay.spool.append(batch)
+          # the loggers read the messages from the spool, this wakes them up
+          batch = []
+        # a batch is a list of messages in the order they were logged
+        self.internalReportingPublisher.send(wire_format.encode_batch(batch))
+      self._report_overflow()
 
-    # None signals 'going down' to listeners
-    self.internalReportingPublisher.send_pyobj(None)
+    # None signals 'going down' to listeners, the collector decides this
+    # for itself when forwarding.
+    if not self.forward_to:
+      self.internalReportingPublisher.send(wire_format.encode_batch(None))
     self.internalReportingPublisher.close()
 
+    self._report_overflow(force=True)
+    if ReportingRelay.spool:
+      ReportingRelay.spool.close()
+      ReportingRelay.spool = None
+    if spill is not None:
+      spill.close()
+      ReportingRelay._spill = None
+
     # None is also used to signal we are all done
     ReportingRelay._logQueue = None
 
+  def _collect_batch(self):
+    log_queue = ReportingRelay._logQueue
+    spill = ReportingRelay._spill
+    # the spill only holds messages newer than those in the queue
+    if spill is not None and spill.pending and log_queue.empty():
+      return spill.read(self.batch_size)
+
+    try:
+      batch = [log_queue.get(timeout=0.5)]
+    except queue.Empty:
+      return None
+
+    deadline = time.monotonic() + self.flush_interval
+    while len(batch) < self.batch_size:
+      try:
+        batch.append(log_queue.get_nowait())
+        continue
+      except queue.Empty:
+        pass
+      remaining = deadline - time.monotonic()
+      if remaining <= 0 or not self.enabled:
+        break
+      try:
+        batch.append(log_queue.get(timeout=remaining))
+      except queue.Empty:
+        break
+    return batch
+
+  def _report_overflow(self, force=False):
+    counters = (ReportingRelay.dropped, ReportingRelay.spilled)
+    if counters == self._reported_overflow:
+      return
+    now = time.monotonic()
+    if force or now - self._last_overflow_report > 10:
+      logger.warning(
+          'Reporting queue overflowed, %s messages dropped and %s spilled '
+          'to disk so far.', *counters)
+      self._reported_overflow = counters
+      self._last_overflow_report = now
+
   def stop(self):
     self.enabled = False
+
+
+class OverflowSpill:
+  """Messages which did not fit in the queue, appended to a file and read
+    back by the relay in the same order once it has caught up."""
+
+  _header = struct.Struct('!I')
+
+  def __init__(self, path):
+    self._lock = threading.Lock()
+    # unbuffered, appends go straight to the end of the file and reads use
+    # pread, so neither disturbs the other.
+    self._file = open(path, 'a+b', buffering=0)
+    # anything left over from an earlier run is sent first
+    self._read_offset = 0
+    self._end = self._complete_records_end()
+    self._file.truncate(self._end)
+
+  def _complete_records_end(self):
+    # a record may have been cut short when an earlier run died
+    end = 0
+    size = os.fstat(self._file.fileno()).st_size
+    while end + self._header.size <= size:
+      length, = self._header.unpack(self._pread(self._header.size, end))
+      if end + self._header.size + length > size:
+        break
+      end += self._header.size + length
+    return end
+
+  def _pread(self, size, offset):
+    return os.pread(self._file.fileno(), size, offset)
+
+  @property
+  def pending(self):
+    return self._read_offset < self._end
+
+  def append(self, message):
+    data = wire_format.encode_message(message)
+    with self._lock:
+      self._file.write(self._header.pack(len(data)) + data)
+      self._end += self._header.size + len(data)
+
+  def read(self, count):
+    messages = []
+    with self._lock:
+      while len(messages) < count and self._read_offset < self._end:
+        size, = self._header.unpack(
+            self._pread(self._header.size, self._read_offset))
+        data = self._pread(size, self._read_offset + self._header.size)
+        messages.append(wire_format.decode_message(data))
+        self._read_offset += self._header.size + size
+      if self._read_offset == self._end:
+        self._file.truncate(0)
+        self._read_offset = self._end = 0
+    return messages
+
+  def close(self):
+    self._file.close()
+
+
+class ReportingCollector:
+  """Receives messages from the ReportingRelay of each worker process and
+    feeds them into the ReportingRelay of this process, so that all workers
+    share one set of loggers."""
+
+  def __init__(self, address):
+    self.enabled = True
+
+    context = heralding.misc.zmq_context
+    self.socket = context.socket(zmq.PULL)
+    self.socket.bind(address)
+
+  def start(self):
+    poller = zmq.Poller()
+    poller.register(self.socket, zmq.POLLIN)
+    while self.enabled:
+      socks = dict(poller.poll(500))
+      if self.socket in socks and socks[self.socket] == zmq.POLLIN:
+        self._drain()
+    # workers are stopped before us, so pick up whatever they sent last
+    self._drain()
+    self.socket.close()
+
+  def _drain(self):
+    while True:
+      try:
+        batch = wire_format.decode_batch(self.socket.recv(zmq.NOBLOCK))
+      except zmq.Again:
+        return
+      for data in batch:
+        if data['message_type'] == 'log_record':
+          record = logging.makeLogRecord(data['content'])
+          logging.getLogger(record.name).handle(record)
+        else:
+          ReportingRelay._enqueue(data)
+
+  def stop(self):
+    self.enabled = False
+
+
+class WorkerLogHandler(logging.handlers.QueueHandler):
+  """Sends the log records of a worker process along with its other
+    messages, the ReportingCollector hands them to the main process' handlers."""
+
+  def __init__(self):
+    logging.Handler.__init__(self)
+
+  def enqueue(self, record):
+    ReportingRelay.logWorkerRecord(record.__dict__)
@@ -0,0 +1,221 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import mmap
+import bisect
+import struct
+import logging
+import threading
+
+from heralding.reporting import wire_format
+
+logger = logging.getLogger(__name__)
+
+
+class Spool:
+  """Append-only log of reporting messages on disk.
+
+    Messages are stored as length prefixed records in segment files, each
+    named after the offset of its first byte in the spool. Every consumer
+    has a cursor, the offset up to which it has handled messages, kept in
+    <name>.cursor next to the segments. Segments are removed once every
+    cursor is past them."""
+
+  _header = struct.Struct('!I')
+  _segment_suffix = '.seg'
+  _cursor_suffix = '.cursor'
+
+  def __init__(self, directory, segment_size=16 * 1024 * 1024):
+    os.makedirs(directory, exist_ok=True)
+    self.directory = directory
+    self.segment_size = segment_size
+    self._lock = threading.Lock()
+
+    self._segments = sorted(
+        int(name[:-len(self._segment_suffix)])
+        for name in os.listdir(directory)
+        if name.endswith(self._segment_suffix))
+    if not self._segments:
+      self._segments.append(0)
+    base = self._segments[-1]
+    path = self._segment_path(base)
+    self._file = open(path, 'ab', buffering=0)
+    # a batch may have been cut short when an earlier run died
+    size = self._complete_records_size(path)
+    self._file.truncate(size)
+    self._segment_end = size
+    # offset right after the last complete record
+    self.end_offset = base + size
+
+  def _segment_path(self, base):
+    return os.path.join(self.directory,
+                        '{0:020d}{1}'.format(base, self._segment_suffix))
+
+  def _cursor_path(self, name):
+    return os.path.join(self.directory, name + self._cursor_suffix)
+
+  def _complete_records_size(self, path):
+    with open(path, 'rb') as f:
+      data = f.read()
+    pos = 0
+    while pos + self._header.size <= len(data):
+      size, = self._header.unpack_from(data, pos)
+      if pos + self._header.size + size > len(data):
+        break
+      pos += self._header.size + size
+    return pos
+
+  @property
+  def start_offset(self):
+    return self._segments[0]
+
+  def append(self, messages):
+    """Appends a batch of messages, which becomes visible to the readers
+        as a whole."""
+    records = []
+    for message in messages:
+      data = wire_format.encode_message(message)
+      records.append(self._header.pack(len(data)))
+      records.append(data)
+    data = b''.join(records)
+
+    with self._lock:
+      # batches never span two segments
+      if (self._segment_end and
+          self._segment_end + len(data) > self.segment_size):
+        self._file.close()
+        self._segments.append(self.end_offset)
+        self._file = open(
+            self._segment_path(self.end_offset), 'ab', buffering=0)
+        self._segment_end = 0
+      self._file.write(data)
+      self._segment_end += len(data)
+      self.end_offset += len(data)
+
+  def reader(self, name):
+    return SpoolReader(self, name)
+
+  def segment_containing(self, offset):
+    """Returns the base offset of the segment holding offset. A segment
+        starts where the previous one ends."""
+    with self._lock:
+      i = bisect.bisect_right(self._segments, offset) - 1
+      return self._segments[max(i, 0)]
+
+  def _cursors(self):
+    for name in os.listdir(self.directory):
+      if name.endswith(self._cursor_suffix):
+        try:
+          with open(os.path.join(self.directory, name), 'r') as f:
+            yield int(f.read())
+        except (OSError, ValueError):
+          continue
+
+  def compact(self):
+    """Removes the segments which every consumer is done with. A consumer
+        which is not used anymore holds back compaction until its cursor
+        file is removed."""
+    if len(self._segments) < 2:
+      return
+    done = min(self._cursors(), default=0)
+    with self._lock:
+      while len(self._segments) > 1 and self._segments[1] <= done:
+        base = self._segments.pop(0)
+        os.remove(self._segment_path(base))
+        logger.debug('Removed spool segment starting at %s', base)
+
+  def close(self):
+    self._file.close()
+
+
+class SpoolReader:
+  """Reads the messages of a Spool from the cursor of one consumer."""
+
+  def __init__(self, spool, name):
+    self._spool = spool
+    self._cursor_path = spool._cursor_path(name)
+    self._map = None
+    self._map_base = None
+
+    try:
+      with open(self._cursor_path, 'r') as f:
+        self.committed = int(f.read())
+    except (OSError, ValueError):
+      # a new consumer starts with the messages logged from now on
+      self.committed = spool.end_offset
+      self._write_cursor()
+    if self.committed < spool.start_offset:
+      self.committed = spool.start_offset
+    # offset of the next message to read, committed once handled
+    self.offset = self.committed
+
+  def _mapping(self, base, length):
+    # the segment being written to grows, map it again when needed
+    if self._map_base != base or len(self._map) < length:
+      self._close_map()
+    if self._map is None:
+      with open(self._spool._segment_path(base), 'rb') as f:
+        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      self._map_base = base
+    return self._map
+
+  def _close_map(self):
+    if self._map is not None:
+      self._map.close()
+      self._map = None
+      self._map_base = None
+
+  @property
+  def lag(self):
+    """Bytes of messages in the spool this reader has not handled yet."""
+    return self._spool.end_offset - self.committed
+
+  def read(self, max_messages=1000):
+    """Returns the next messages after the cursor, but does not commit."""
+    header = Spool._header
+    messages = []
+    end = self._spool.end_offset
+    while self.offset < end and len(messages) < max_messages:
+      base = self._spool.segment_containing(self.offset)
+      pos = self.offset - base
+      size, = header.unpack_from(self._mapping(base, pos + header.size), pos)
+      start = pos + header.size
+      mapped = self._mapping(base, start + size)
+      messages.append(wire_format.decode_message(mapped[start:start + size]))
+      self.offset = base + start + size
+    return messages
+
+  def commit(self, offset=None):
+    """Records that all messages read so far, or up to offset, have been
+        handled."""
+    if offset is None:
+      offset = self.offset
+    if offset <= self.committed:
+      return
+    previous_base = self._spool.segment_containing(self.committed)
+    self.committed = offset
+    self._write_cursor()
+    if self._spool.segment_containing(self.committed) != previous_base:
+      self._spool.compact()
+
+  def _write_cursor(self):
+    tmp_path = self._cursor_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+      f.write(str(self.committed))
+    os.replace(tmp_path, self._cursor_path)
+
+  def close(self):
+    self._close_map()
@@ -0,0 +1,181 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import time
+import sqlite3
+import logging
+
+from heralding.reporting.base_logger import BaseLogger
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS auth_attempts (
+  auth_id TEXT PRIMARY KEY,
+  timestamp TEXT,
+  session_id TEXT,
+  source_ip TEXT,
+  source_port INTEGER,
+  destination_ip TEXT,
+  destination_port INTEGER,
+  protocol TEXT,
+  username TEXT,
+  password TEXT,
+  password_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS auth_attempts_source_ip ON auth_attempts (source_ip);
+CREATE INDEX IF NOT EXISTS auth_attempts_username ON auth_attempts (username);
+CREATE INDEX IF NOT EXISTS auth_attempts_password ON auth_attempts (password);
+CREATE INDEX IF NOT EXISTS auth_attempts_protocol ON auth_attempts (protocol);
+CREATE INDEX IF NOT EXISTS auth_attempts_timestamp ON auth_attempts (timestamp);
+CREATE INDEX IF NOT EXISTS auth_attempts_session_id ON auth_attempts (session_id);
+
+CREATE TABLE IF NOT EXISTS sessions (
+  session_id TEXT PRIMARY KEY,
+  timestamp TEXT,
+  duration INTEGER,
+  source_ip TEXT,
+  source_port INTEGER,
+  destination_ip TEXT,
+  destination_port INTEGER,
+  protocol TEXT,
+  num_auth_attempts INTEGER,
+  session_ended INTEGER,
+  auxiliary_data TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_source_ip ON sessions (source_ip);
+CREATE INDEX IF NOT EXISTS sessions_protocol ON sessions (protocol);
+CREATE INDEX IF NOT EXISTS sessions_timestamp ON sessions (timestamp);
+"""
+
+# replayed messages are ignored
+INSERT_AUTH_ATTEMPT = """
+INSERT OR IGNORE INTO auth_attempts (auth_id, timestamp, session_id,
+  source_ip, source_port, destination_ip, destination_port, protocol,
+  username, password, password_hash)
+VALUES (:auth_id, :timestamp, :session_id, :source_ip, :source_port,
+  :destination_ip, :destination_port, :protocol, :username, :password,
+  :password_hash)
+"""
+
+# the start and the end of a session end up in the same row, a replayed
+# start does not undo the end
+UPSERT_SESSION = """
+INSERT INTO sessions (session_id, timestamp, duration, source_ip,
+  source_port, destination_ip, destination_port, protocol,
+  num_auth_attempts, session_ended, auxiliary_data)
+VALUES (:session_id, :timestamp, :duration, :source_ip, :source_port,
+  :destination_ip, :destination_port, :protocol, :num_auth_attempts,
+  :session_ended, :auxiliary_data)
+ON CONFLICT (session_id) DO UPDATE SET
+  duration = excluded.duration,
+  num_auth_attempts = excluded.num_auth_attempts,
+  session_ended = excluded.session_ended,
+  auxiliary_data = excluded.auxiliary_data
+WHERE NOT sessions.session_ended
+"""
+
+AUTH_FIELDS = ('auth_id', 'timestamp', 'session_id', 'source_ip',
+               'source_port', 'destination_ip', 'destination_port', 'protocol',
+               'username', 'password', 'password_hash')
+
+
+def _column_value(value):
+  # e.g. the password_hash of VNC is a dict
+  if isinstance(value, (dict, list, tuple)):
+    return json.dumps(value, default=str)
+  return value
+
+
+class SqliteLogger(BaseLogger):
+
+  def __init__(self, database_file, batch_size=500, flush_interval=1):
+    """
+        :param batch_size: rows inserted in one transaction at most.
+        :param flush_interval: seconds between committing buffered rows.
+        """
+    super().__init__()
+    self.batch_size = batch_size
+    self.flush_interval = flush_interval
+    self._auth_attempts = []
+    self._sessions = []
+    self._last_flush = time.monotonic()
+
+    # only used from the logger thread once started
+    self.connection = sqlite3.connect(
+        database_file, isolation_level=None, check_same_thread=False)
+    self.connection.execute('PRAGMA journal_mode=WAL')
+    # with WAL this is safe against corruption, a power loss may only
+    # cost the last transactions
+    self.connection.execute('PRAGMA synchronous=NORMAL')
+    self.connection.executescript(SCHEMA)
+    logger.info('SQLite logger: Using %s to log sessions and '
+                'authentication attempts.', database_file)
+
+  def handle_auth_log(self, data):
+    self._auth_attempts.append(
+        {field: _column_value(data.get(field)) for field in AUTH_FIELDS})
+    self._maybe_flush()
+
+  def handle_session_log(self, data):
+    self._sessions.append({
+        'session_id': data['session_id'],
+        'timestamp': data['timestamp'],
+        'duration': data['duration'],
+        'source_ip': data['source_ip'],
+        'source_port': data['source_port'],
+        'destination_ip': data['destination_ip'],
+        'destination_port': data['destination_port'],
+        'protocol': data['protocol'],
+        'num_auth_attempts': data['num_auth_attempts'],
+        'session_ended': data['session_ended'],
+        'auxiliary_data': json.dumps(data.get('auxiliary_data', {}))
+    })
+    self._maybe_flush()
+
+  def _maybe_flush(self):
+    if len(self._auth_attempts) + len(self._sessions) >= self.batch_size:
+      self.flush()
+
+  def _execute_regulary(self):
+    if time.monotonic() - self._last_flush >= self.flush_interval:
+      self.flush()
+
+  def idle_timeout(self):
+    if self._auth_attempts or self._sessions:
+      return self._last_flush + self.flush_interval - time.monotonic()
+    return None
+
+  def flush(self):
+    self._last_flush = time.monotonic()
+    if not self._auth_attempts and not self._sessions:
+      return
+    # taken out first, a batch which cannot be written is not tried again
+    auth_attempts, self._auth_attempts = self._auth_attempts, []
+    sessions, self._sessions = self._sessions, []
+    try:
+      with self.connection:
+        self.connection.execute('BEGIN')
+        self.connection.executemany(INSERT_AUTH_ATTEMPT, auth_attempts)
+        self.connection.executemany(UPSERT_SESSION, sessions)
+    except sqlite3.Error:
+      self.dropped += len(auth_attempts) + len(sessions)
+      logger.exception('SQLite logger could not write %s rows, dropping them.',
+                       len(auth_attempts) + len(sessions))
+
+  def loggerStopped(self):
+    self.flush()
+    self.connection.close()
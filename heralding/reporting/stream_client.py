@@ -0,0 +1,265 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+import threading
+import collections
+
+from heralding.reporting.base_logger import BaseLogger
+
+logger = logging.getLogger(__name__)
+
+
+class StreamClient:
+  """Sends messages over a TCP (or TLS) connection from an event loop
+    without ever waiting for the other end. Messages are buffered while it
+    is unreachable, dropping the oldest beyond buffer_size, and the
+    connection is retried with exponential backoff. Whatever is buffered
+    goes out in one write of up to batch_size messages.
+
+    Messages are numbered in the order they are sent, delivered_through()
+    is the number up to which all were written to the connection."""
+
+  # names the other end in log messages
+  peer = 'server'
+  # errors which cost the connection, and are retried
+  connection_errors = (OSError, EOFError)
+
+  def __init__(self,
+               host,
+               port,
+               buffer_size=10000,
+               batch_size=100,
+               reconnect_delay=1,
+               max_reconnect_delay=60,
+               ssl=None):
+    self.host = host
+    self.port = port
+    self.buffer_size = buffer_size
+    self.batch_size = max(1, batch_size)
+    self.reconnect_delay = reconnect_delay
+    self.max_reconnect_delay = max_reconnect_delay
+    self.ssl = ssl
+
+    self.connected = False
+    self.published = 0
+    self.dropped = 0
+    self.sent = 0
+    self._delivery = Delivery()
+    # (number, encoded message)
+    self._buffer = collections.deque()
+    self._task = None
+    self._wakeup = None
+    self._closing = None
+
+  def start(self, loop):
+    self._wakeup = asyncio.Event()
+    self._closing = asyncio.Event()
+    self._task = loop.create_task(self._run())
+
+  def send(self, data):
+    """Queues an encoded message, must be called on the event loop of the
+        client."""
+    if len(self._buffer) >= self.buffer_size:
+      self._delivery.lost(self._buffer.popleft()[0])
+      self.dropped += 1
+    self.sent += 1
+    self._buffer.append((self.sent, data))
+    self._wakeup.set()
+
+  def delivered_through(self):
+    return self._delivery.through
+
+  async def close(self, timeout=5):
+    """Sends what is buffered if connected, giving up after timeout
+        seconds."""
+    self._closing.set()
+    self._wakeup.set()
+    try:
+      await asyncio.wait_for(asyncio.shield(self._task), timeout)
+    except asyncio.TimeoutError:
+      self._task.cancel()
+    if self._buffer:
+      logger.warning('Stopped with %s messages unsent to %s %s:%s.',
+                     len(self._buffer), self.peer, self.host, self.port)
+
+  async def _run(self):
+    delay = self.reconnect_delay
+    while True:
+      try:
+        reader, writer = await self._connect()
+      except self.connection_errors as ex:
+        if self._closing.is_set():
+          return
+        logger.warning('Could not connect to %s %s:%s (%s), retrying in '
+                       '%s seconds.', self.peer, self.host, self.port, ex,
+                       delay)
+        try:
+          await asyncio.wait_for(self._closing.wait(), delay)
+        except asyncio.TimeoutError:
+          pass
+        delay = min(delay * 2, self.max_reconnect_delay)
+        continue
+
+      delay = self.reconnect_delay
+      self.connected = True
+      logger.info('Connected to %s %s:%s.', self.peer, self.host, self.port)
+      try:
+        # only returns once closing and everything is sent
+        await self._send(reader, writer)
+        return
+      except self.connection_errors as ex:
+        logger.warning('Lost connection to %s %s:%s: %s', self.peer,
+                       self.host, self.port, ex)
+      finally:
+        self.connected = False
+        writer.close()
+
+  async def _connect(self):
+    reader, writer = await asyncio.open_connection(
+        self.host, self.port, ssl=self.ssl)
+    try:
+      await self._handshake(reader, writer)
+    except BaseException:
+      writer.close()
+      raise
+    return reader, writer
+
+  async def _handshake(self, reader, writer):
+    # override if the other end expects something before the messages
+    pass
+
+  async def _read(self, reader):
+    # override to handle what the other end sends, must raise once the
+    # connection is gone
+    while True:
+      data = await reader.read(65536)
+      if not data:
+        raise EOFError('connection closed by {0}'.format(self.peer))
+
+  async def _send(self, reader, writer):
+    read_task = asyncio.ensure_future(self._read(reader))
+    try:
+      while True:
+        if not self._buffer:
+          if self._closing.is_set():
+            return
+          self._wakeup.clear()
+          wakeup_task = asyncio.ensure_future(self._wakeup.wait())
+          await asyncio.wait((wakeup_task, read_task),
+                             return_when=asyncio.FIRST_COMPLETED)
+          wakeup_task.cancel()
+          if read_task.done():
+            # raises why the connection went away
+            read_task.result()
+          continue
+
+        batch = [
+            self._buffer.popleft()
+            for _ in range(min(self.batch_size, len(self._buffer)))
+        ]
+        try:
+          writer.write(b''.join(data for _, data in batch))
+          await writer.drain()
+        except BaseException:
+          # sent again after reconnecting, unless newer messages pushed
+          # them out meanwhile
+          self._buffer.extendleft(reversed(batch))
+          while len(self._buffer) > self.buffer_size:
+            self._delivery.lost(self._buffer.popleft()[0])
+            self.dropped += 1
+          raise
+        self.published += len(batch)
+        self._delivery.delivered(batch[-1][0])
+    finally:
+      read_task.cancel()
+
+
+class Delivery:
+  """Tracks up to which number messages, delivered in order, were all
+    delivered. A message which is lost holds it back for good."""
+
+  def __init__(self):
+    self.through = 0
+    self._lost = None
+
+  def delivered(self, number):
+    if self._lost is None:
+      self.through = number
+    else:
+      self.through = min(number, self._lost - 1)
+
+  def lost(self, number):
+    if self._lost is None:
+      self._lost = number
+
+
+class ClientLogger(BaseLogger):
+  """Logger handing its messages to an asyncio client, self.client. With a
+    ReportingBus the client shares the event loop, otherwise it runs on an
+    event loop of its own next to the logger thread."""
+
+  # only hands messages to the client
+  blocking = False
+
+  def __init__(self, client):
+    super().__init__()
+    self.client = client
+    # messages handed to the client, numbered as the client numbers them
+    self._handed = 0
+    self._loop = None
+    # set when the client runs on an event loop of its own
+    self._loop_thread = None
+
+  def start(self):
+    self._loop = asyncio.new_event_loop()
+    self._loop_thread = threading.Thread(
+        target=self._loop.run_forever, name=self.name + 'Client')
+    self._loop_thread.start()
+    self._loop.call_soon_threadsafe(self.client.start, self._loop)
+    super().start()
+
+  async def _run_async(self):
+    self.client.start(asyncio.get_event_loop())
+    await super()._run_async()
+    await self.client.close()
+
+  def stats(self):
+    stats = super().stats()
+    stats['dropped'] += self.client.dropped
+    return stats
+
+  def loggerStopped(self):
+    if self._loop_thread:
+      asyncio.run_coroutine_threadsafe(self.client.close(),
+                                       self._loop).result()
+      self._loop.call_soon_threadsafe(self._loop.stop)
+      self._loop_thread.join()
+      self._loop.close()
+
+  def delivery_mark(self):
+    return self._handed
+
+  def delivered_through(self):
+    return self.client.delivered_through()
+
+  def _call_client(self, func, *args):
+    """Hands one message to the client with func."""
+    self._handed += 1
+    if self._loop_thread:
+      self._loop.call_soon_threadsafe(func, *args)
+    else:
+      func(*args)
@@ -13,25 +13,303 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+import ssl
+import socket
 import syslog
+import asyncio
 import logging
+import datetime
+import collections
 
+from heralding.misc.common import TIMESTAMP_FORMAT
 from heralding.reporting.base_logger import BaseLogger
+from heralding.reporting.stream_client import StreamClient, ClientLogger, \
+  Delivery
 
 logger = logging.getLogger(__name__)
 
+# RFC 5424, section 6.2.1
+FACILITIES = {
+    'kern': 0,
+    'user': 1,
+    'mail': 2,
+    'daemon': 3,
+    'auth': 4,
+    'syslog': 5,
+    'lpr': 6,
+    'news': 7,
+    'uucp': 8,
+    'cron': 9,
+    'authpriv': 10,
+    'ftp': 11,
+    'local0': 16,
+    'local1': 17,
+    'local2': 18,
+    'local3': 19,
+    'local4': 20,
+    'local5': 21,
+    'local6': 22,
+    'local7': 23
+}
+SEVERITIES = {
+    'emerg': 0,
+    'alert': 1,
+    'crit': 2,
+    'err': 3,
+    'warning': 4,
+    'notice': 5,
+    'info': 6,
+    'debug': 7
+}
+
+AUTH_PARAMS = ('auth_id', 'session_id', 'source_ip', 'source_port',
+               'destination_ip', 'destination_port', 'protocol', 'username',
+               'password', 'password_hash')
+SESSION_PARAMS = ('session_id', 'source_ip', 'source_port', 'destination_ip',
+                  'destination_port', 'protocol', 'duration',
+                  'num_auth_attempts')
+
+
+def auth_text(data):
+  return 'Authentication from {0}:{1}, with username: {2} and password: ' \
+         '{3}.'.format(data['source_ip'], data['source_port'],
+                       data['username'], data['password'])
+
+
+def session_text(data):
+  return 'Session {0} from {1}:{2} to port {3} ({4}) ended after {5} ' \
+         'seconds with {6} authentication attempts.'.format(
+             data['session_id'], data['source_ip'], data['source_port'],
+             data['destination_port'], data['protocol'], data['duration'],
+             data['num_auth_attempts'])
+
 
 class SyslogLogger(BaseLogger):
+  """Logs to the local syslog daemon."""
 
-  def __init__(self):
+  def __init__(self,
+               facility='user',
+               auth_severity='alert',
+               session_severity='info'):
     super().__init__()
+    facility = self._priority(facility)
+    self.auth_priority = facility | self._priority(auth_severity)
+    self.session_priority = facility | self._priority(session_severity)
     logger.debug('Syslog logger started')
 
+  @staticmethod
+  def _priority(name):
+    return getattr(syslog, 'LOG_' + name.upper())
+
   def handle_auth_log(self, data):
     # for now this logger only handles authentication attempts where we are able
     # to log both username and password
     if 'username' in data and 'password' in data:
-      message = "Authentication from {0}:{1}, with username: {2} " \
-              "and password: {3}.".format(data['source_ip'], data['source_port'],
-                                          data['username'], data['password'])
-      syslog.syslog(syslog.LOG_ALERT, message)
+      syslog.syslog(self.auth_priority, auth_text(data))
+
+  def handle_session_log(self, data):
+    if data['session_ended']:
+      syslog.syslog(self.session_priority, session_text(data))
+
+
+class Rfc5424Formatter:
+  """Formats RFC 5424 messages, the details of the event go in a
+    structured data element as well as in the text."""
+
+  _escapes = str.maketrans({'"': '\\"', '\\': '\\\\', ']': '\\]'})
+
+  def __init__(self,
+               facility='user',
+               sd_id='heralding@32473',
+               hostname=None,
+               app_name='heralding'):
+    self.facility = FACILITIES[facility]
+    self.sd_id = sd_id
+    # everything from HOSTNAME up to MSGID is the same in every message
+    self._header_middle = ' {0} {1} {2} '.format(
+        hostname or socket.gethostname() or '-', app_name, os.getpid())
+
+  def format(self, severity, msgid, data, params, text, seconds_after=0):
+    """
+        :param seconds_after: the event happened this many seconds after the
+                              timestamp of data.
+        """
+    timestamp = data.get('timestamp')
+    if isinstance(timestamp, str):
+      # the sessions log UTC as TIMESTAMP_FORMAT
+      if seconds_after:
+        timestamp = (datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT) +
+                     datetime.timedelta(seconds=seconds_after)).strftime(
+                         TIMESTAMP_FORMAT)
+      timestamp = timestamp.replace(' ', 'T', 1) + 'Z'
+    else:
+      timestamp = datetime.datetime.utcnow().isoformat() + 'Z'
+    structured_data = ''.join(
+        ' {0}="{1}"'.format(name,
+                            str(data[name]).translate(self._escapes))
+        for name in params
+        if data.get(name) is not None)
+    message = '<{0}>1 {1}{2}{3} [{4}{5}] \ufeff{6}'.format(
+        self.facility * 8 + severity, timestamp, self._header_middle, msgid,
+        self.sd_id, structured_data, text)
+    return message.encode('utf-8')
+
+
+class SyslogClient(StreamClient):
+  """Sends to a syslog server over TCP or TLS, framed by octet counting as
+    in RFC 6587."""
+
+  peer = 'syslog server'
+
+  def send(self, message):
+    super().send(b'%d %s' % (len(message), message))
+
+
+class DatagramClient:
+  """Sends every message in a datagram of its own, as in RFC 5426. Messages
+    sent while the address is being resolved are kept, up to buffer_size.
+    Messages longer than max_message_size are truncated, rather than
+    dropped on the way for not fitting in a datagram."""
+
+  def __init__(self, host, port, buffer_size=10000, reconnect_delay=1,
+               max_reconnect_delay=60, max_message_size=2048):
+    self.host = host
+    self.port = port
+    self.max_message_size = max_message_size
+    self.buffer_size = buffer_size
+    self.reconnect_delay = reconnect_delay
+    self.max_reconnect_delay = max_reconnect_delay
+    self.published = 0
+    self.dropped = 0
+    self.sent = 0
+    self._delivery = Delivery()
+    # (number, message) sent once the address is resolved
+    self._pending = collections.deque()
+    self._transport = None
+    self._task = None
+
+  def start(self, loop):
+    self._task = loop.create_task(self._open(loop))
+
+  async def _open(self, loop):
+    delay = self.reconnect_delay
+    while True:
+      try:
+        self._transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=(self.host, self.port))
+        break
+      except OSError as ex:
+        logger.warning('Could not resolve syslog server %s:%s (%s), '
+                       'retrying in %s seconds.', self.host, self.port, ex,
+                       delay)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, self.max_reconnect_delay)
+    while self._pending:
+      self._sendto(*self._pending.popleft())
+
+  def send(self, message):
+    self.sent += 1
+    if len(message) > self.max_message_size:
+      # without cutting a character in two
+      message = message[:self.max_message_size].decode(
+          'utf-8', 'ignore').encode('utf-8')
+    if self._transport is None:
+      if len(self._pending) >= self.buffer_size:
+        self._delivery.lost(self._pending.popleft()[0])
+        self.dropped += 1
+      self._pending.append((self.sent, message))
+      return
+    self._sendto(self.sent, message)
+
+  def _sendto(self, number, message):
+    # buffered by the transport if the socket is not ready. Nothing is
+    # acknowledged over UDP, sent counts as delivered.
+    self._transport.sendto(message)
+    self.published += 1
+    self._delivery.delivered(number)
+
+  def delivered_through(self):
+    return self._delivery.through
+
+  async def close(self, timeout=5):
+    if self._transport is None:
+      self._task.cancel()
+    else:
+      self._transport.close()
+
+
+class RemoteSyslogLogger(ClientLogger):
+  """Sends RFC 5424 messages to a remote syslog server."""
+
+  TRANSPORTS = ('udp', 'tcp', 'tls')
+
+  def __init__(self,
+               host,
+               port=514,
+               transport='udp',
+               facility='user',
+               auth_severity='alert',
+               session_severity='info',
+               ca_file=None,
+               verify=True,
+               buffer_size=10000,
+               batch_size=100,
+               reconnect_delay=1,
+               max_reconnect_delay=60,
+               max_message_size=2048,
+               sd_id='heralding@32473'):
+    """
+        :param transport: 'udp', 'tcp' or 'tls'.
+        :param ca_file: CA certificates to verify the server with over TLS,
+                        the system's if not set.
+        :param verify: verify the certificate of the server over TLS.
+        :param buffer_size: messages kept while the server is unreachable.
+        :param batch_size: messages sent in one write at most over TCP.
+        :param reconnect_delay: seconds before reconnecting the first time,
+                                doubled on every failed attempt up to
+                                max_reconnect_delay.
+        :param max_message_size: bytes of a message sent over UDP at most,
+                                 longer ones are truncated. RFC 5426 only
+                                 requires receivers to take 480 bytes over
+                                 IPv4, and should take 2048.
+        :param sd_id: SD-ID of the structured data, name@<private enterprise
+                      number>. 32473 is the example number of RFC 5612 and
+                      only a placeholder.
+        """
+    if transport not in RemoteSyslogLogger.TRANSPORTS:
+      raise ValueError('Unknown syslog transport: {0}'.format(transport))
+    if facility not in FACILITIES:
+      raise ValueError('Unknown syslog facility: {0}'.format(facility))
+    if transport == 'udp':
+      client = DatagramClient(host, port, buffer_size, reconnect_delay,
+                              max_reconnect_delay, max_message_size)
+    else:
+      ssl_context = None
+      if transport == 'tls':
+        ssl_context = ssl.create_default_context(cafile=ca_file or None)
+        if not verify:
+          ssl_context.check_hostname = False
+          ssl_context.verify_mode = ssl.CERT_NONE
+      client = SyslogClient(host, port, buffer_size, batch_size,
+                            reconnect_delay, max_reconnect_delay, ssl_context)
+    super().__init__(client)
+    self.formatter = Rfc5424Formatter(facility, sd_id)
+    self.auth_severity = SEVERITIES[auth_severity]
+    self.session_severity = SEVERITIES[session_severity]
+    logger.info('Syslog logger: Sending to %s:%s over %s.', host, port,
+                transport)
+
+  def handle_auth_log(self, data):
+    if 'username' in data and 'password' in data:
+      message = self.formatter.format(self.auth_severity, 'auth', data,
+                                      AUTH_PARAMS, auth_text(data))
+      self._call_client(self.client.send, message)
+
+  def handle_session_log(self, data):
+    if data['session_ended']:
+      # dated when the session ended, not when it started
+      message = self.formatter.format(self.session_severity, 'session', data,
+                                      SESSION_PARAMS, session_text(data),
+                                      data.get('duration', 0))
+      self._call_client(self.client.send, message)
@@ -0,0 +1,117 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Encoding of the reporting messages passed between the relay, the spool
+and the loggers.
+
+Messages are msgpack encoded. For message types with a known layout the
+content is sent as a list of values in a fixed field order instead of a
+map, so the field names are not repeated in every message. Fields a
+message has beyond its layout are sent along in a map. Messages are never
+unpickled, so the transport can be exposed without a deserialization risk.
+"""
+
+import operator
+
+import msgpack
+
+VERSION = 1
+
+MESSAGE_TYPES = ('auth', 'session_info', 'listen_ports', 'aux_info',
+                 'log_record')
+_TYPE_IDS = {name: i for i, name in enumerate(MESSAGE_TYPES)}
+
+# field order of the message types with a known layout, must only ever be
+# appended to.
+FIELDS = {
+    'auth': ('timestamp', 'session_id', 'auth_id', 'source_ip', 'source_port',
+             'destination_ip', 'destination_port', 'protocol', 'username',
+             'password', 'password_hash'),
+    'session_info': ('timestamp', 'duration', 'session_id', 'source_ip',
+                     'source_port', 'destination_ip', 'destination_port',
+                     'protocol', 'num_auth_attempts', 'auth_attempts',
+                     'session_ended', 'auxiliary_data'),
+}
+
+# indexed by type id, None for the types sent as they are
+_LAYOUTS = [FIELDS.get(name) for name in MESSAGE_TYPES]
+_GETTERS = [
+    operator.itemgetter(*fields) if fields else None for fields in _LAYOUTS
+]
+
+
+def _pack(obj):
+  # anything msgpack does not know, e.g. in a log record, is sent as text
+  return msgpack.packb(obj, use_bin_type=True, default=str)
+
+
+def _unpack(data):
+  return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def _encode(message):
+  type_id = _TYPE_IDS[message['message_type']]
+  content = message['content']
+  fields = _LAYOUTS[type_id]
+  if fields is None:
+    return (type_id, content)
+  try:
+    values = _GETTERS[type_id](content)
+    if len(content) == len(fields):
+      return (type_id, values)
+  except KeyError:
+    # decodes with None for the missing fields
+    values = tuple(content.get(field) for field in fields)
+  extra = {k: v for k, v in content.items() if k not in fields}
+  if extra:
+    return (type_id, values, extra)
+  return (type_id, values)
+
+
+def _decode(encoded):
+  type_id = encoded[0]
+  message_type = MESSAGE_TYPES[type_id]
+  fields = _LAYOUTS[type_id]
+  if fields is None:
+    content = encoded[1]
+  else:
+    content = dict(zip(fields, encoded[1]))
+    if len(encoded) > 2:
+      content.update(encoded[2])
+  return {'message_type': message_type, 'content': content}
+
+
+def encode_batch(messages):
+  """Encodes a list of messages as one frame. None, which tells the loggers
+    that the relay is going down, is encoded as an empty frame."""
+  if messages is None:
+    return b''
+  return _pack((VERSION, [_encode(message) for message in messages]))
+
+
+def decode_batch(frame):
+  if not frame:
+    return None
+  version, encoded = _unpack(frame)
+  if version != VERSION:
+    raise ValueError('Unsupported wire format version: {0}'.format(version))
+  return [_decode(e) for e in encoded]
+
+
+def encode_message(message):
+  return _pack(_encode(message))
+
+
+def decode_message(data):
+  return _decode(_unpack(data))
@@ -0,0 +1,262 @@
+# license: LGPL
+# Thanks a lot to the author of original telnetsrvlib - Ian Epperson (https://github.com/ianepperson)!
+# Original repository - https://github.com/ianepperson/telnetsrvlib
+"""The telnet input path as it was before the input cooker of
+heralding.libs.telnetsrv.telnetsrvlib worked a chunk at a time.
+test_telnetsrv checks the new cooker against this, and
+benchmarks/bench_telnet_cooker.py compares their speed."""
+
+import curses
+import asyncio
+import curses.ascii
+
+from heralding.libs.telnetsrv.telnetsrvlib import (
+    IAC, DONT, DO, WONT, WILL, theNULL, SE, SB, BELL, log, convert_to_bytes)
+
+
+class ReferenceInput:
+  """Mixin replacing the input functions and the input cooker of a
+    TelnetHandlerBase."""
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.rawq = b''  # Raw input string
+    self.iacseq = b''  # Buffer for IAC sequence.
+
+  def setup(self):
+    self.setterm(self.TERM)
+    for k in self.DOACK.keys():
+      self.sendcommand(self.DOACK[k], k)
+    for k in self.WILLACK.keys():
+      self.sendcommand(self.WILLACK[k], k)
+
+    self.inputcooker_task = asyncio.ensure_future(
+        self.inputcooker(), loop=self.loop)
+
+  async def readline(self, echo=None, prompt=b'', use_history=True):
+    """Return a line of bytes, including the terminating LF
+           If echo is true always echo, if echo is false never echo
+           If echo is None follow the negotiated setting.
+           prompt is the current prompt to write (and rewrite if needed)
+           use_history controls if this current line uses (and adds to) the command history.
+        """
+
+    line = []
+    insptr = 0
+    histptr = len(self.history)
+
+    if self.DOECHO:
+      self.write(prompt)
+      self._current_prompt = prompt
+    else:
+      self._current_prompt = b''
+
+    self._current_line = b''
+
+    while True:
+      c = await self.getc()
+      c = await self.ansi_to_curses(c)
+      cb = convert_to_bytes(c)
+
+      if cb == theNULL:
+        continue
+
+      elif c == curses.KEY_LEFT:
+        if insptr > 0:
+          insptr -= 1
+          self._readline_echo(self.CODES['CSRLEFT'], echo)
+        else:
+          self._readline_echo(BELL, echo)
+        continue
+      elif c == curses.KEY_RIGHT:
+        if insptr < len(line):
+          insptr += 1
+          self._readline_echo(self.CODES['CSRRIGHT'], echo)
+        else:
+          self._readline_echo(BELL, echo)
+        continue
+      elif c == curses.KEY_UP or c == curses.KEY_DOWN:
+        if not use_history:
+          self._readline_echo(BELL, echo)
+          continue
+        if c == curses.KEY_UP:
+          if histptr > 0:
+            histptr -= 1
+          else:
+            self._readline_echo(BELL, echo)
+            continue
+        elif c == curses.KEY_DOWN:
+          if histptr < len(self.history):
+            histptr += 1
+          else:
+            self._readline_echo(BELL, echo)
+            continue
+        line = []
+        if histptr < len(self.history):
+          line.extend(self.history[histptr])
+        for _ in range(insptr):
+          self._readline_echo(self.CODES['CSRLEFT'], echo)
+        self._readline_echo(self.CODES['DEOL'], echo)
+        self._readline_echo(b''.join(line), echo)
+        insptr = len(line)
+        continue
+      elif cb == bytes([3]):
+        self._readline_echo(
+            b'\n' + convert_to_bytes(curses.ascii.unctrl(c)) + b' ABORT\n',
+            echo)
+        return b''
+      elif cb == bytes([4]):
+        if len(line) > 0:
+          self._readline_echo(
+              b'\n' + convert_to_bytes(curses.ascii.unctrl(c)) +
+              b' ABORT (QUIT)\n', echo)
+          return b''
+        self._readline_echo(
+            b'\n' + convert_to_bytes(curses.ascii.unctrl(c)) + b' QUIT\n', echo)
+        return b'QUIT'
+      elif cb == bytes([10]):
+        self._readline_echo(cb, echo)
+        result = b''.join(convert_to_bytes(elem) for elem in line)
+        if use_history:
+          self.history.append(result)
+        if echo is False:
+          if prompt:
+            self.write(bytes([10]))
+          log.debug('readline: %s(hidden text)', prompt)
+        else:
+          log.debug('readline: %s%r', prompt, result)
+        return result
+      elif c == curses.KEY_BACKSPACE or cb == bytes([127]) or cb == bytes([8]):
+        if insptr > 0:
+          self._readline_echo(self.CODES['CSRLEFT'] + self.CODES['DEL'], echo)
+          insptr -= 1
+          del line[insptr]
+        else:
+          self._readline_echo(BELL, echo)
+        continue
+      elif c == curses.KEY_DC:
+        if insptr < len(line):
+          self._readline_echo(self.CODES['DEL'], echo)
+          del line[insptr]
+        else:
+          self._readline_echo(BELL, echo)
+        continue
+      else:
+        if c < 32:
+          c = curses.ascii.unctrl(c)
+          cb = convert_to_bytes(c)
+        if len(line) > insptr:
+          self._readline_insert(cb, echo, insptr, line)
+        else:
+          self._readline_echo(cb, echo)
+      line[insptr:insptr] = cb
+      insptr += len(cb)
+      if self._readline_do_echo(echo):
+        self._current_line = line
+
+  async def getc(self):
+    """Return one character from the input queue"""
+    try:
+      return await self.cookedq.get()
+    except asyncio.QueueEmpty:
+      return b''
+
+
+  # ------------------------------- Input Cooker -----------------------------
+  async def _inputcooker_getc(self):
+    """Get one character from the raw queue.
+        Raise EOFError on end of stream. SHOULD ONLY BE CALLED FROM THE
+        INPUT COOKER."""
+    if self.rawq:
+      ret = self.rawq[0]
+      self.rawq = self.rawq[1:]
+      return bytes([ret]) if ret else b''
+    try:
+      ret = await self.reader.read(20)
+    except BrokenPipeError:
+      ret = b''
+
+    self.eof = not ret
+    self.rawq = self.rawq + ret
+    if self.eof:
+      raise EOFError
+    return await self._inputcooker_getc()
+
+  def _inputcooker_ungetc(self, char):
+    """Put characters back onto the head of the rawq. SHOULD ONLY
+        BE CALLED FROM THE INPUT COOKER."""
+    self.rawq = char + self.rawq
+
+  async def _inputcooker_store(self, char):
+    """Put the cooked data in the correct queue"""
+    if self.sb:
+      self.sbdataq = self.sbdataq + char
+    else:
+      await self.inputcooker_store_queue(char)
+
+  async def inputcooker_store_queue(self, char):
+    """Put the cooked data in the input queue (no locking needed)"""
+    if isinstance(char, list) or isinstance(char, tuple) \
+            or isinstance(char, str) or isinstance(char, bytes):
+      for v in char:
+        await self.cookedq.put(v)
+    else:
+      await self.cookedq.put(char)
+
+  async def inputcooker(self):
+    """Input Cooker - Transfer from raw queue to cooked queue.
+
+        Set self.eof when connection is closed.
+        """
+    try:
+      while True:
+        cb = await self._inputcooker_getc()
+        if not self.iacseq:
+          if cb == IAC:
+            self.iacseq += cb
+            continue
+          elif cb == bytes([13]) and not self.sb:
+            c2b = await self._inputcooker_getc()
+            if c2b == theNULL or c2b == b'':
+              cb = bytes([10])
+            elif c2b == bytes([10]):
+              cb = c2b
+            else:
+              self._inputcooker_ungetc(c2b)
+              cb = bytes([10])
+          elif cb in [x[0] for x in self.ESCSEQ.keys()]:
+            # Looks like the begining of a key sequence
+            codes = cb
+            for keyseq in self.ESCSEQ.keys():
+              if len(keyseq) == 0:
+                continue
+              while codes == keyseq[:len(codes)] and len(codes) <= keyseq:
+                if codes == keyseq:
+                  cb = self.ESCSEQ[keyseq]
+                  break
+                codes = codes + await self._inputcooker_getc()
+              if codes == keyseq:
+                break
+              self._inputcooker_ungetc(codes[1:])
+              codes = codes[0]
+          await self._inputcooker_store(cb)
+        elif len(self.iacseq) == 1:
+          # IAC: IAC CMD [OPTION only for WILL/WONT/DO/DONT]
+          if cb in (DO, DONT, WILL, WONT):
+            self.iacseq += cb
+            continue
+          self.iacseq = b''
+          if cb == IAC:
+            await self._inputcooker_store(cb)
+          else:
+            if cb == SB:  # SB ... SE start.
+              self.sb = 1
+              self.sbdataq = b''
+            elif cb == SE:  # SB ... SE end.
+              self.sb = 0
+            # Callback is supposed to look into
+            # the sbdataq
+        elif len(self.iacseq) == 2:
+          self.iacseq = b''
+    except EOFError:
+      pass
@@ -0,0 +1,139 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import uuid
+import unittest
+
+from heralding.honeypot import Honeypot
+from heralding.misc.correlation import CorrelationIndex
+from heralding.misc.ids import UuidGenerator
+from heralding.misc.session import Session
+from heralding.reporting.reporting_relay import ReportingRelay
+
+
+class CorrelationIndexTests(unittest.TestCase):
+
+  def setUp(self):
+    self.now = 1000000.0
+
+  def _index(self, **kwargs):
+    index = CorrelationIndex(**kwargs)
+    index._now = lambda: self.now
+    return index
+
+  def test_campaign(self):
+    """Tests that sessions of an address across protocols are tied
+        together"""
+    index = self._index()
+    index.session_started('192.0.2.1', 'ssh')
+    for i in range(10):
+      index.auth_attempt('192.0.2.1', 'root', str(i % 5))
+    self.now += 5
+    index.session_started('192.0.2.1', 'telnet')
+    index.session_started('192.0.2.2', 'ftp')
+
+    correlation_id, campaign = index.session_ended('192.0.2.1')
+    self.assertEqual(campaign['protocols'], ['ssh', 'telnet'])
+    self.assertEqual(campaign['sessions'], 2)
+    self.assertEqual(campaign['auth_attempts'], 10)
+    self.assertEqual(campaign['distinct_credentials'], 5)
+    self.assertEqual(campaign['first_seen'], '1970-01-12 13:46:40.000000')
+    self.assertEqual(campaign['last_seen'], '1970-01-12 13:46:45.000000')
+    self.assertEqual(index.session_ended('192.0.2.1')[0], correlation_id)
+    self.assertNotEqual(index.session_ended('192.0.2.2')[0], correlation_id)
+
+  def test_ttl(self):
+    """Tests that an address not seen for ttl seconds starts over"""
+    index = self._index(ttl=60)
+    index.session_started('192.0.2.1', 'ssh')
+    correlation_id, _ = index.session_ended('192.0.2.1')
+    self.now += 59
+    index.session_started('192.0.2.2', 'ssh')
+    self.assertEqual(len(index), 2)
+    self.now += 1
+    index.session_started('192.0.2.3', 'ssh')
+    self.assertEqual(len(index), 2)
+    # the session outlived the entry of its address
+    self.assertEqual(index.session_ended('192.0.2.1'), (None, None))
+    self.assertEqual(len(index), 2)
+    index.session_started('192.0.2.1', 'ssh')
+    new_id, campaign = index.session_ended('192.0.2.1')
+    self.assertNotEqual(new_id, correlation_id)
+    self.assertEqual(campaign['sessions'], 1)
+
+  def test_id_generator(self):
+    """Tests that correlation ids come from the id generator"""
+    index = self._index(id_generator=UuidGenerator())
+    index.session_started('192.0.2.1', 'ssh')
+    correlation_id, _ = index.session_ended('192.0.2.1')
+    self.assertEqual(str(uuid.UUID(correlation_id)), correlation_id)
+
+  def test_max_entries(self):
+    """Tests that the least recently seen addresses are forgotten first"""
+    index = self._index(max_entries=100)
+    for i in range(1000):
+      index.session_started('10.0.{0}.{1}'.format(i // 256, i % 256), 'ssh')
+      # keeps being seen
+      index.session_started('192.0.2.1', 'ssh')
+    self.assertEqual(len(index), 100)
+    self.assertEqual(index.session_ended('192.0.2.1')[1]['sessions'], 1000)
+
+  def test_distinct_credentials(self):
+    """Tests the estimate of distinct credentials of many attempts"""
+    index = self._index()
+    for i in range(20000):
+      index.auth_attempt('192.0.2.1', 'user{0}'.format(i % 500), 'pass')
+    campaign = index.session_ended('192.0.2.1')[1]
+    self.assertEqual(campaign['auth_attempts'], 20000)
+    self.assertAlmostEqual(campaign['distinct_credentials'], 500, delta=50)
+
+
+class SessionCorrelationTests(unittest.TestCase):
+
+  def setUp(self):
+    Honeypot.correlation_index = CorrelationIndex()
+    ReportingRelay(queue_size=100)
+
+  def tearDown(self):
+    Honeypot.correlation_index = None
+    ReportingRelay._logQueue = None
+
+  def test_session_end(self):
+    """Tests that ended sessions are logged with their campaign"""
+    ssh_session = Session('192.0.2.1', 1234, 'ssh', None, 22)
+    ssh_session.add_auth_attempt('plaintext', username='root', password='x')
+    telnet_session = Session('192.0.2.1', 1235, 'telnet', None, 23)
+    ssh_session.end_session()
+    telnet_session.end_session()
+
+    messages = []
+    while not ReportingRelay._logQueue.empty():
+      messages.append(ReportingRelay._logQueue.get_nowait())
+    ended = [
+        m['content']
+        for m in messages
+        if m['message_type'] == 'session_info' and m['content']['session_ended']
+    ]
+    self.assertEqual(len(ended), 2)
+    self.assertEqual(ended[0]['correlation_id'], ended[1]['correlation_id'])
+    self.assertEqual(ended[0]['campaign']['protocols'], ['ssh', 'telnet'])
+    self.assertEqual(ended[1]['campaign']['auth_attempts'], 1)
+    started = [
+        m['content']
+        for m in messages
+        if m['message_type'] == 'session_info' and
+        not m['content']['session_ended']
+    ]
+    self.assertNotIn('campaign', started[0])
@@ -0,0 +1,113 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+
+from heralding.reporting.file_logger import FileLogger
+
+
+class FileLoggerTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.auth_log = os.path.join(self.tmpdir, 'log_auth.csv')
+    self.session_csv_log = os.path.join(self.tmpdir, 'log_session.csv')
+    self.session_json_log = os.path.join(self.tmpdir, 'log_session.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _file_logger(self, **kwargs):
+    return FileLogger(self.session_csv_log, self.session_json_log,
+                      self.auth_log, **kwargs)
+
+  def _lines(self, filename):
+    with open(filename, 'r') as f:
+      return f.read().splitlines()
+
+  def test_idle_timeout(self):
+    """Tests that a file logger is only woken up while rows are waiting to
+        be written out"""
+    file_logger = self._file_logger(flush_interval=5)
+    self.assertIsNone(file_logger.idle_timeout())
+    file_logger.handle_auth_log({'username': 'user', 'password': 'pass'})
+    self.assertAlmostEqual(file_logger.idle_timeout(), 5, delta=1)
+    file_logger._last_flush -= 5
+    file_logger._execute_regulary()
+    self.assertIsNone(file_logger.idle_timeout())
+    file_logger.loggerStopped()
+
+  def test_group_commit(self):
+    """Tests that rows are written out together, and all of them on stop"""
+    file_logger = self._file_logger(flush_interval=3600, fsync_interval=3600)
+    for i in range(10):
+      file_logger.handle_auth_log({'username': 'user', 'password': str(i)})
+    file_logger.handle_session_log({'session_ended': True, 'session_id': 'a'})
+    # only the csv header so far
+    self.assertEqual(len(self._lines(self.auth_log)), 1)
+    self.assertEqual(self._lines(self.session_json_log), [])
+
+    file_logger._last_flush -= 3600
+    file_logger._execute_regulary()
+    self.assertEqual(len(self._lines(self.auth_log)), 11)
+
+    file_logger.handle_auth_log({'username': 'user', 'password': 'last'})
+    file_logger.loggerStopped()
+    self.assertEqual(len(self._lines(self.auth_log)), 12)
+    self.assertEqual(len(self._lines(self.session_json_log)), 1)
+    self.assertEqual(len(self._lines(self.session_csv_log)), 2)
+
+  def test_flush_every_row(self):
+    file_logger = self._file_logger(flush_interval=0)
+    file_logger.handle_auth_log({'username': 'user', 'password': 'pass'})
+    self.assertEqual(len(self._lines(self.auth_log)), 2)
+    file_logger.loggerStopped()
+
+  def test_rotation(self):
+    """Tests that rotated files are compressed, get a header and are
+        removed beyond max_segments"""
+    file_logger = self._file_logger(
+        flush_interval=0, rotate_size=200, max_segments=2)
+    for i in range(30):
+      file_logger.handle_auth_log({'username': 'user', 'password': str(i)})
+    file_logger.compressor.stop(wait=True)
+    file_logger.loggerStopped()
+
+    rotated = sorted(n for n in os.listdir(self.tmpdir)
+                     if n.startswith('log_auth.csv.'))
+    self.assertEqual(len(rotated), 2)
+    for name in rotated:
+      self.assertTrue(name.endswith('.gz'))
+      with gzip.open(os.path.join(self.tmpdir, name), 'rt') as f:
+        lines = f.read().splitlines()
+      self.assertTrue(lines[0].startswith('timestamp,auth_id'))
+      self.assertGreater(len(lines), 1)
+    lines = self._lines(self.auth_log)
+    self.assertTrue(lines[0].startswith('timestamp,auth_id'))
+    self.assertTrue(lines[-1].endswith(',29,'))
+
+  def test_rotation_leftovers(self):
+    """Tests that segments left uncompressed are compressed on start"""
+    with open(self.session_json_log + '.20170101-000000', 'w') as f:
+      f.write('{}\n')
+    file_logger = self._file_logger(rotate_interval=3600)
+    file_logger.compressor.stop(wait=True)
+    file_logger.loggerStopped()
+    self.assertTrue(
+        os.path.isfile(self.session_json_log + '.20170101-000000.gz'))
@@ -0,0 +1,45 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import multiprocessing
+
+from heralding.capabilities.handlerbase import HandlerBase
+
+
+class HandlerBaseTests(unittest.TestCase):
+
+  def tearDown(self):
+    HandlerBase.worker_sessions = None
+    HandlerBase.worker_slot = 0
+    HandlerBase.global_sessions = 0
+
+  def test_session_limit_across_workers(self):
+    """Tests that sessions of all workers count towards the global limit"""
+    worker_sessions = multiprocessing.get_context('spawn').RawArray('i', 2)
+    HandlerBase.worker_sessions = worker_sessions
+    HandlerBase.worker_slot = 1
+
+    # sessions held by the other worker
+    worker_sessions[0] = HandlerBase.MAX_GLOBAL_SESSIONS
+    self.assertFalse(HandlerBase.session_limit_reached())
+
+    HandlerBase._adjust_global_sessions(1)
+    self.assertEqual(worker_sessions[1], 1)
+    self.assertTrue(HandlerBase.session_limit_reached())
+
+    HandlerBase._adjust_global_sessions(-1)
+    self.assertEqual(worker_sessions[1], 0)
+    self.assertFalse(HandlerBase.session_limit_reached())
@@ -0,0 +1,147 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import random
+import shutil
+import tempfile
+import unittest
+import collections
+
+from heralding.libs.sketches import SpaceSaving, CountMinSketch
+from heralding.reporting.heavy_hitter_logger import HeavyHitterLogger
+
+
+def skewed_stream(length, seed=1):
+  """Ten frequent values among a long tail of values seen once."""
+  rng = random.Random(seed)
+  for i in range(length):
+    if rng.random() < 0.3:
+      yield 'frequent{0}'.format(rng.randrange(10))
+    else:
+      yield 'rare{0}'.format(i)
+
+
+class SketchTests(unittest.TestCase):
+
+  def test_space_saving(self):
+    """Tests that the frequent values are found in bounded memory"""
+    summary = SpaceSaving(50)
+    exact = collections.Counter()
+    for value in skewed_stream(20000):
+      summary.add(value)
+      exact[value] += 1
+    self.assertEqual(len(summary), 50)
+    top = summary.top(10)
+    self.assertEqual({value for value, _ in top},
+                     {value for value, _ in exact.most_common(10)})
+    for value, count in top:
+      # never underestimated
+      self.assertGreaterEqual(count, exact[value])
+
+  def test_count_min(self):
+    """Tests that estimates are never too low and close for frequent
+        values"""
+    sketch = CountMinSketch(512, 4)
+    exact = collections.Counter()
+    for value in skewed_stream(20000):
+      sketch.add(value)
+      exact[value] += 1
+    for value, count in exact.items():
+      self.assertGreaterEqual(sketch.estimate(value), count)
+    for value, count in exact.most_common(10):
+      self.assertLess(sketch.estimate(value), count + 2 * 20000 / 512)
+
+
+class HeavyHitterLoggerTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.snapshot_file = os.path.join(self.tmpdir, 'heavy_hitters.json')
+    self.now = 1000000
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _logger(self, **kwargs):
+    heavy_hitter_logger = HeavyHitterLogger(self.snapshot_file, **kwargs)
+    heavy_hitter_logger._now = lambda: self.now
+    return heavy_hitter_logger
+
+  def _attempt(self, heavy_hitter_logger, username, protocol='ssh'):
+    heavy_hitter_logger.handle_auth_log({
+        'protocol': protocol,
+        'username': username,
+        'password': 'pass',
+        'source_ip': '192.0.2.1'
+    })
+
+  def test_windows(self):
+    """Tests that attempts leave the windows as time passes"""
+    heavy_hitter_logger = self._logger(windows=(600, 3600), bucket_seconds=300)
+    for _ in range(3):
+      self._attempt(heavy_hitter_logger, 'old')
+    self.now += 1800
+    for _ in range(2):
+      self._attempt(heavy_hitter_logger, 'new')
+    self._attempt(heavy_hitter_logger, 'root', protocol='telnet')
+
+    windows = heavy_hitter_logger.snapshot()['windows']
+    self.assertEqual(windows['600']['ssh']['username'], [{
+        'value': 'new',
+        'count': 2
+    }])
+    self.assertEqual(windows['3600']['ssh']['username'], [{
+        'value': 'old',
+        'count': 3
+    }, {
+        'value': 'new',
+        'count': 2
+    }])
+    self.assertEqual(windows['3600']['ssh']['attempts'], 5)
+    self.assertEqual(windows['3600']['ssh']['password'], [{
+        'value': 'pass',
+        'count': 5
+    }])
+    self.assertEqual(windows['600']['telnet']['attempts'], 1)
+
+    self.now += 3600
+    self.assertEqual(heavy_hitter_logger.snapshot()['windows']['3600'], {})
+    self.assertIsNone(heavy_hitter_logger.idle_timeout())
+
+  def test_bounded_memory(self):
+    """Tests that memory does not grow with the number of distinct values"""
+    heavy_hitter_logger = self._logger(capacity=20, bucket_seconds=60)
+    for value in skewed_stream(10000):
+      self.now += 1
+      self._attempt(heavy_hitter_logger, value)
+    self.assertLessEqual(len(heavy_hitter_logger._buckets), 60)
+    for _, buckets in heavy_hitter_logger._buckets:
+      self.assertLessEqual(len(buckets['ssh'].top['username']), 20)
+      self.assertLessEqual(len(buckets['ssh'].top['username']._heap), 80)
+
+  def test_snapshot_file(self):
+    """Tests that snapshots are written to the file"""
+    heavy_hitter_logger = self._logger(snapshot_interval=0)
+    self._attempt(heavy_hitter_logger, 'root')
+    heavy_hitter_logger._execute_regulary()
+    with open(self.snapshot_file) as f:
+      snapshot = json.load(f)
+    self.assertEqual(snapshot['windows']['3600']['ssh']['username'], [{
+        'value': 'root',
+        'count': 1
+    }])
+    self.assertFalse(os.path.exists(self.snapshot_file + '.tmp'))
@@ -13,9 +13,18 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+import json
+import socket
+import asyncio
+import threading
 import unittest
 
-from heralding.reporting.hpfeeds_logger import HpFeedsLogger
+from hpfeeds import protocol
+
+from heralding.reporting.hpfeeds_logger import HpFeedsLogger, HpFeedsClient
+from heralding.reporting.reporting_bus import ReportingBus
+from heralding.reporting.reporting_relay import ReportingRelay
 
 
 class FtpTests(unittest.TestCase):
@@ -31,3 +40,171 @@ class FtpTests(unittest.TestCase):
     secret = "toosecret"
 
     HpFeedsLogger(session_channel, auth_channel, host, port, ident, secret)
+
+
+class StandInBroker:
+  """Just enough of an hpfeeds broker to receive published messages."""
+
+  def __init__(self, secret):
+    self.secret = secret
+    self.messages = []
+    self.authenticated = []
+    self._server = None
+    self._writers = []
+
+  async def start(self, port):
+    self._server = await asyncio.start_server(self._handle, '127.0.0.1', port)
+
+  async def stop(self):
+    self._server.close()
+    for writer in self._writers:
+      writer.close()
+    await self._server.wait_closed()
+
+  async def _handle(self, reader, writer):
+    self._writers.append(writer)
+    rand = os.urandom(4)
+    writer.write(protocol.msginfo('standin', rand))
+    unpacker = protocol.Unpacker()
+    while True:
+      data = await reader.read(protocol.BUFSIZ)
+      if not data:
+        return
+      unpacker.feed(data)
+      for opcode, body in unpacker:
+        if opcode == protocol.OP_AUTH:
+          _, secret_hash = protocol.readauth(body)
+          self.authenticated.append(
+              secret_hash == protocol.hashsecret(rand, self.secret))
+        elif opcode == protocol.OP_PUBLISH:
+          _, channel, payload = protocol.readpublish(body)
+          self.messages.append((channel, json.loads(payload)))
+
+
+def unused_port():
+  with socket.socket() as s:
+    s.bind(('127.0.0.1', 0))
+    return s.getsockname()[1]
+
+
+class HpFeedsLoggerTests(unittest.TestCase):
+
+  def setUp(self):
+    self.loop = asyncio.new_event_loop()
+    self.port = unused_port()
+    self.broker = StandInBroker('secret')
+
+  def tearDown(self):
+    self.loop.run_until_complete(self.broker.stop())
+    self.loop.close()
+
+  def _wait_for(self, condition, timeout=5):
+
+    async def wait():
+      while not condition():
+        await asyncio.sleep(0.01)
+
+    self.loop.run_until_complete(asyncio.wait_for(wait(), timeout))
+
+  def _client(self, **kwargs):
+    client = HpFeedsClient(
+        '127.0.0.1', self.port, 'ident', 'secret', reconnect_delay=0.05,
+        **kwargs)
+    client.start(self.loop)
+    return client
+
+  def test_publish_through_bus(self):
+    """Tests that logged messages reach the broker, also those logged right
+        before stopping"""
+    self.loop.run_until_complete(self.broker.start(self.port))
+    bus = ReportingBus(self.loop)
+    hpfeeds_logger = HpFeedsLogger('heralding.session', 'heralding.auth',
+                                   '127.0.0.1', self.port, 'ident', 'secret')
+    bus.add_logger(hpfeeds_logger)
+    try:
+      ReportingRelay.logAuthAttempt({'number': 0})
+      self._wait_for(lambda: self.broker.messages)
+      for i in range(1, 100):
+        ReportingRelay.logAuthAttempt({'number': i})
+      ReportingRelay.logSessionInfo({'number': 100})
+    finally:
+      bus.stop()
+      self.loop.run_until_complete(bus.wait_closed())
+
+    self._wait_for(lambda: len(self.broker.messages) == 101)
+    self.assertEqual(self.broker.authenticated, [True])
+    self.assertEqual(self.broker.messages[:100],
+                     [('heralding.auth', {
+                         'number': i
+                     }) for i in range(100)])
+    self.assertEqual(self.broker.messages[100], ('heralding.session', {
+        'number': 100
+    }))
+
+  def test_logger_thread(self):
+    """Tests the logger in a thread of its own, fed by the relay"""
+    self.loop.run_until_complete(self.broker.start(self.port))
+    relay = ReportingRelay(flush_interval=0)
+    hpfeeds_logger = HpFeedsLogger('heralding.session', 'heralding.auth',
+                                   '127.0.0.1', self.port, 'ident', 'secret')
+    threads = [
+        threading.Thread(target=relay.start),
+        threading.Thread(target=hpfeeds_logger.start)
+    ]
+    try:
+      threads[0].start()
+      # the relay binds the socket the logger connects to
+      self.loop.run_until_complete(asyncio.sleep(0.2))
+      threads[1].start()
+      self.loop.run_until_complete(asyncio.sleep(0.2))
+      for i in range(10):
+        ReportingRelay.logAuthAttempt({'number': i})
+      self._wait_for(lambda: len(self.broker.messages) == 10)
+    finally:
+      relay.stop()
+      for thread in threads:
+        thread.join(5)
+    self.assertEqual([m['number'] for _, m in self.broker.messages],
+                     list(range(10)))
+    self.assertFalse(hpfeeds_logger._loop_thread.is_alive())
+
+  def test_reconnect(self):
+    """Tests that messages are kept while the broker is gone, and sent once
+        it is back"""
+    client = self._client()
+    for i in range(5):
+      client.publish('channel', json.dumps(i).encode())
+    self.loop.run_until_complete(asyncio.sleep(0.2))
+    self.assertFalse(client.connected)
+
+    self.loop.run_until_complete(self.broker.start(self.port))
+    self._wait_for(lambda: len(self.broker.messages) == 5)
+
+    # the broker goes away and comes back
+    self.loop.run_until_complete(self.broker.stop())
+    self._wait_for(lambda: not client.connected)
+    for i in range(5, 8):
+      client.publish('channel', json.dumps(i).encode())
+    self.broker = StandInBroker('secret')
+    self.loop.run_until_complete(self.broker.start(self.port))
+    self._wait_for(lambda: len(self.broker.messages) == 3)
+    self.assertEqual([m for _, m in self.broker.messages], [5, 6, 7])
+    self.assertEqual(client.published, 8)
+    self.assertEqual(client.dropped, 0)
+    self.assertEqual(client.delivered_through(), 8)
+    self.loop.run_until_complete(client.close())
+
+  def test_buffer_size(self):
+    """Tests that the oldest messages are dropped while the broker is gone
+        and the buffer is full"""
+    client = self._client(buffer_size=3)
+    for i in range(5):
+      client.publish('channel', json.dumps(i).encode())
+    self.assertEqual(client.dropped, 2)
+
+    self.loop.run_until_complete(self.broker.start(self.port))
+    self._wait_for(lambda: len(self.broker.messages) == 3)
+    self.assertEqual([m for _, m in self.broker.messages], [2, 3, 4])
+    # the lost messages are never acknowledged, nor what came after them
+    self.assertEqual(client.delivered_through(), 0)
+    self.loop.run_until_complete(client.close())
@@ -0,0 +1,230 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import queue
+import unittest
+from unittest import mock
+import threading
+import http.server
+
+from heralding.reporting.http_bulk_logger import HttpBulkLogger
+
+
+class MockBulkServer(http.server.ThreadingHTTPServer):
+  """Records the documents indexed by bulk requests. As long as there are
+    any, requests are answered with the next of responses: a status for the
+    whole request or a list with a status for every document. After that
+    everything is indexed."""
+
+  def __init__(self):
+    super().__init__(('127.0.0.1', 0), MockBulkHandler)
+    self.requests = []
+    self.connections = set()
+    self.responses = []
+    self.lock = threading.Lock()
+    self.thread = threading.Thread(target=self.serve_forever)
+    self.thread.start()
+
+  @property
+  def url(self):
+    return 'http://127.0.0.1:{0}'.format(self.server_address[1])
+
+  def documents(self):
+    documents = []
+    for _, lines in self.requests:
+      documents.extend(lines[1::2])
+    return documents
+
+  def stop(self):
+    self.shutdown()
+    self.server_close()
+    self.thread.join()
+
+
+class MockBulkHandler(http.server.BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def do_POST(self):
+    body = self.rfile.read(int(self.headers['Content-Length']))
+    lines = [json.loads(line) for line in body.splitlines()]
+    with self.server.lock:
+      self.server.connections.add(self.client_address)
+      response = self.server.responses.pop(0) if self.server.responses else None
+
+    if isinstance(response, int):
+      self._reply(response, {'error': 'busy'})
+      return
+    statuses = response or [201] * (len(lines) // 2)
+    # the action and document lines of what was indexed
+    indexed = []
+    for i, status in enumerate(statuses):
+      if status < 300:
+        indexed.extend(lines[2 * i:2 * i + 2])
+    with self.server.lock:
+      self.server.requests.append((self.path, indexed))
+    items = [{'index': {'status': status}} for status in statuses]
+    self._reply(200, {
+        'errors': any(s >= 300 for s in statuses),
+        'items': items
+    })
+
+  def _reply(self, status, body):
+    data = json.dumps(body).encode()
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def log_message(self, *args):
+    pass
+
+
+class HttpBulkLoggerTests(unittest.TestCase):
+
+  def setUp(self):
+    self.server = MockBulkServer()
+
+  def tearDown(self):
+    self.server.stop()
+
+  def _logger(self, **kwargs):
+    return HttpBulkLogger(self.server.url, retry_delay=0.01, **kwargs)
+
+  def test_batches(self):
+    """Tests that documents are sent in batches over kept-alive
+        connections"""
+    bulk_logger = self._logger(batch_size=10, max_in_flight=1)
+    for i in range(25):
+      bulk_logger.handle_auth_log({'auth_id': i, 'number': i})
+    bulk_logger.handle_session_log({'session_id': 's', 'session_ended': False})
+    bulk_logger.handle_session_log({'session_id': 's', 'session_ended': True})
+    bulk_logger.loggerStopped()
+
+    self.assertEqual([len(lines) // 2 for _, lines in self.server.requests],
+                     [10, 10, 6])
+    self.assertEqual({path for path, _ in self.server.requests}, {'/_bulk'})
+    self.assertEqual(self.server.requests[0][1][0],
+                     {'index': {
+                         '_index': 'heralding-auth',
+                         '_id': '0'
+                     }})
+    self.assertEqual(self.server.requests[2][1][-2],
+                     {'index': {
+                         '_index': 'heralding-session',
+                         '_id': 's'
+                     }})
+    self.assertEqual([d.get('number') for d in self.server.documents()[:25]],
+                     list(range(25)))
+    self.assertEqual(len(self.server.connections), 1)
+    self.assertEqual(bulk_logger.indexed, 26)
+
+  def test_delivery(self):
+    """Tests that delivery is acknowledged in order, up to the first batch
+        given up on"""
+    self.server.responses = [[201, 201], 503]
+    bulk_logger = self._logger(batch_size=2, max_in_flight=1, max_retries=0)
+    # as if reading from a spool
+    bulk_logger._spool_reader = mock.sentinel.spool_reader
+    for i in range(6):
+      bulk_logger.handle_auth_log({'auth_id': i, 'number': i})
+    self.assertEqual(bulk_logger.delivery_mark(), 6)
+    # with max_in_flight=1, waits for the last batch to be answered
+    bulk_logger._in_flight.acquire()
+    self.assertEqual(bulk_logger.indexed, 4)
+    self.assertEqual(bulk_logger.delivered_through(), 2)
+    bulk_logger._in_flight.release()
+
+    # nothing is kept for the batches after the one given up on
+    for i in range(6, 106):
+      bulk_logger.handle_auth_log({'auth_id': i, 'number': i})
+    bulk_logger.loggerStopped()
+    self.assertEqual(bulk_logger.indexed, 104)
+    self.assertEqual(len(bulk_logger._batches), 0)
+    self.assertEqual(bulk_logger.delivered_through(), 2)
+
+  def test_no_spool(self):
+    """Tests that without a spool no batches are kept for acknowledging"""
+    bulk_logger = self._logger(batch_size=2)
+    for i in range(600):
+      bulk_logger.handle_auth_log({'auth_id': i, 'number': i})
+    bulk_logger.loggerStopped()
+    self.assertEqual(bulk_logger.indexed, 600)
+    self.assertEqual(len(bulk_logger._batches), 0)
+
+  def test_long_run(self):
+    """Tests a long run through the logger queue, as without a spool"""
+    bulk_logger = self._logger(batch_size=50, flush_interval=3600)
+    bulk_logger._queue = queue.Queue()
+    for i in range(2000):
+      bulk_logger._enqueue({
+          'message_type': 'auth',
+          'content': {
+              'auth_id': i,
+              'number': i
+          }
+      })
+    bulk_logger._queue.put(None)
+    bulk_logger._handle_queue()
+    bulk_logger.loggerStopped()
+
+    # two requests in flight, batches may arrive in any order
+    self.assertEqual(sorted(d['number'] for d in self.server.documents()),
+                     list(range(2000)))
+    self.assertEqual(bulk_logger.indexed, 2000)
+    self.assertEqual(bulk_logger.failed, 0)
+    self.assertEqual(len(bulk_logger._batches), 0)
+    stats = bulk_logger.stats()
+    self.assertEqual((stats['handled'], stats['dropped']), (2000, 0))
+    self.assertIsNone(bulk_logger.idle_timeout())
+
+  def test_flush_interval(self):
+    """Tests that a batch which is not full is sent after flush_interval"""
+    bulk_logger = self._logger(batch_size=100, flush_interval=3600)
+    for i in range(3):
+      bulk_logger.handle_auth_log({'auth_id': i, 'number': i})
+    bulk_logger._execute_regulary()
+    self.assertGreater(bulk_logger.idle_timeout(), 0)
+    bulk_logger._last_flush -= 3600
+    self.assertLessEqual(bulk_logger.idle_timeout(), 0)
+    bulk_logger._execute_regulary()
+    self.assertIsNone(bulk_logger.idle_timeout())
+    bulk_logger.loggerStopped()
+    self.assertEqual(len(self.server.requests), 1)
+    self.assertEqual(bulk_logger.indexed, 3)
+
+  def test_retries(self):
+    """Tests that busy responses and documents refused for the time being
+        are sent again, and others are given up on"""
+    self.server.responses = [503, [201, 429, 400], [201]]
+    bulk_logger = self._logger(batch_size=3)
+    for i in range(3):
+      bulk_logger.handle_auth_log({'auth_id': i, 'number': i})
+    bulk_logger.loggerStopped()
+
+    self.assertEqual([d['number'] for d in self.server.documents()], [0, 1])
+    self.assertEqual(bulk_logger.indexed, 2)
+    self.assertEqual(bulk_logger.failed, 1)
+    self.assertEqual(bulk_logger.stats()['dropped'], 1)
+
+  def test_gives_up(self):
+    """Tests that a batch is dropped after max_retries"""
+    self.server.responses = [503] * 3
+    bulk_logger = self._logger(max_retries=2)
+    bulk_logger.handle_auth_log({'auth_id': 0})
+    bulk_logger.loggerStopped()
+    self.assertEqual(bulk_logger.failed, 1)
+    self.assertEqual(self.server.responses, [])
@@ -0,0 +1,70 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import uuid
+import unittest
+from unittest import mock
+
+from heralding.misc.ids import UlidGenerator, UuidGenerator, ulid_fields
+
+
+class UlidGeneratorTests(unittest.TestCase):
+
+  def test_format(self):
+    """Tests that ids hold the time, worker id and counter"""
+    generator = UlidGenerator(worker_id=3)
+    with mock.patch('time.time_ns', return_value=1469918176385123456):
+      first = generator.new_id()
+      second = generator.new_id()
+    self.assertRegex(first, re.compile('^[0-9A-HJKMNP-TV-Z]{26}$'))
+    millis, worker_id, counter = ulid_fields(first)
+    self.assertEqual(millis, 1469918176385)
+    self.assertEqual(worker_id, 3)
+    self.assertEqual(ulid_fields(second), (millis, 3, counter + 1))
+    # the example of the ULID spec
+    self.assertEqual(first[:10], '01ARYZ6S41')
+
+  def test_sorted(self):
+    """Tests that ids sort in the order they were made"""
+    generator = UlidGenerator(worker_id=1)
+    times = [1500000000000000000 + i * 999999 for i in range(2000)]
+    # the clock going back a little
+    times[1000:1010] = [times[900]] * 10
+    ids = []
+    for now in times:
+      with mock.patch('time.time_ns', return_value=now):
+        ids.append(generator.new_id())
+    self.assertEqual(ids, sorted(ids))
+    self.assertEqual(len(set(ids)), len(ids))
+
+  def test_workers(self):
+    """Tests that workers make different ids at the same time"""
+    with mock.patch('time.time_ns', return_value=1500000000000000000):
+      ids = {
+          UlidGenerator(worker_id).new_id()
+          for worker_id in range(100)
+          for _ in range(10)
+      }
+    self.assertEqual(len(ids), 1000)
+    with self.assertRaises(ValueError):
+      UlidGenerator(1 << 16)
+
+
+class UuidGeneratorTests(unittest.TestCase):
+
+  def test_uuid(self):
+    new_id = UuidGenerator().new_id()
+    self.assertEqual(uuid.UUID(new_id).version, 4)
@@ -2,9 +2,13 @@ import asyncio
 import unittest
 import socket
 import ssl
+import warnings
 import os
+import shutil
+import tempfile
 
 from heralding.capabilities import rdp
+from heralding.libs.msrdp.tls import TLS, ServerContext, TLSHandshakeError
 from heralding.misc.common import cancel_all_pending_tasks, generate_self_signed_cert
 from heralding.reporting.reporting_relay import ReportingRelay
 
@@ -150,3 +154,148 @@ class RDPTests(unittest.TestCase):
     login_res = self.loop.run_until_complete(rdp_task)
 
     self.assertEqual(True, login_res)
+
+
+class ServerContextTests(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.pem_file = os.path.join(self.directory, 'rdp.pem')
+    self.write_cert()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def write_cert(self, data=None):
+    if data is None:
+      cert, key = generate_self_signed_cert("US", "None", "None", "None",
+                                            "None", "*", 365, 0)
+      data = cert + key
+    with open(self.pem_file, 'wb') as _pem_file:
+      _pem_file.write(data)
+
+  def test_shared(self):
+    """Tests that connections share one context until the pem file changes"""
+    server_context = ServerContext(self.pem_file)
+    context = server_context.get()
+    self.assertIs(server_context.get(), context)
+    self.assertFalse(context.options & ssl.OP_NO_TICKET)
+
+    self.write_cert()
+    # on file systems with coarse timestamps
+    stat = os.stat(self.pem_file)
+    os.utime(self.pem_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    reloaded = server_context.get()
+    self.assertIsNot(reloaded, context)
+    self.assertIs(server_context.get(), reloaded)
+
+  def test_broken_pem(self):
+    """Tests that the previous context is kept if the pem file is broken"""
+    server_context = ServerContext(self.pem_file)
+    context = server_context.get()
+    self.write_cert(b'garbage')
+    self.assertIs(server_context.get(), context)
+    os.remove(self.pem_file)
+    self.assertIs(server_context.get(), context)
+
+    with self.assertRaises(OSError):
+      ServerContext(self.pem_file).get()
+
+
+class BufferWriter:
+
+  def __init__(self):
+    self.data = bytearray()
+
+  def write(self, data):
+    self.data += data
+
+  async def drain(self):
+    pass
+
+  def take(self):
+    data = bytes(self.data)
+    self.data.clear()
+    return data
+
+
+class TLSTests(unittest.TestCase):
+
+  def setUp(self):
+    self.loop = asyncio.new_event_loop()
+    self.directory = tempfile.mkdtemp()
+    pem_file = os.path.join(self.directory, 'rdp.pem')
+    cert, key = generate_self_signed_cert("US", "None", "None", "None",
+                                          "None", "*", 365, 0)
+    with open(pem_file, 'wb') as _pem_file:
+      _pem_file.write(cert + key)
+    server_context = ServerContext(pem_file).get()
+    # OpenSSL 3 refuses the signature algorithms of TLS 1.1 otherwise
+    server_context.set_ciphers('RSA:!aNULL:@SECLEVEL=0')
+    with warnings.catch_warnings():
+      warnings.simplefilter('ignore', DeprecationWarning)
+      client_context = ssl.SSLContext(ssl.PROTOCOL_TLSv1_1)
+    client_context.check_hostname = False
+    client_context.verify_mode = ssl.CERT_NONE
+    client_context.set_ciphers('ALL:@SECLEVEL=0')
+
+    self.reader = asyncio.StreamReader(loop=self.loop)
+    self.writer = BufferWriter()
+    self.tls = TLS(self.writer, self.reader, server_context)
+    self.client_in = ssl.MemoryBIO()
+    self.client_out = ssl.MemoryBIO()
+    self.client = client_context.wrap_bio(self.client_in, self.client_out)
+
+  def tearDown(self):
+    self.loop.close()
+    shutil.rmtree(self.directory)
+
+  async def feed(self, chunk_size):
+    """Sends what the client wrote to the server in chunks of chunk_size"""
+    data = self.client_out.read()
+    for i in range(0, len(data), chunk_size):
+      self.reader.feed_data(data[i:i + chunk_size])
+      await asyncio.sleep(0)
+
+  async def handshake(self, chunk_size):
+    handshake = asyncio.ensure_future(self.tls.do_tls_handshake())
+    while not handshake.done():
+      try:
+        self.client.do_handshake()
+      except ssl.SSLWantReadError:
+        pass
+      await self.feed(chunk_size)
+      await asyncio.sleep(0)
+      self.client_in.write(self.writer.take())
+    await handshake
+    self.client.do_handshake()
+
+  def test_fragmented(self):
+    """Tests a handshake and reads with ciphertext trickling in"""
+
+    async def run():
+      await self.handshake(chunk_size=7)
+      message = bytes(range(256)) * 200
+      self.client.write(message)
+      await self.feed(chunk_size=1000)
+      self.assertEqual(await self.tls.read_tls(4), message[:4])
+      self.assertEqual(await self.tls.read_tls(len(message) - 4), message[4:])
+
+      self.client.write(b'last')
+      await self.feed(chunk_size=3)
+      self.reader.feed_eof()
+      # less than asked for once the connection is closed
+      self.assertEqual(await self.tls.read_tls(10), b'last')
+      self.assertEqual(await self.tls.read_tls(10), b'')
+
+    self.loop.run_until_complete(run())
+
+  def test_closed_during_handshake(self):
+
+    async def run():
+      self.reader.feed_data(b'\x16\x03\x02')
+      self.reader.feed_eof()
+      with self.assertRaises(TLSHandshakeError):
+        await self.tls.do_tls_handshake()
+
+    self.loop.run_until_complete(run())
@@ -0,0 +1,121 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import struct
+import unittest
+
+from heralding.libs.msrdp import parser
+from heralding.libs.msrdp.parser import InvalidExpectedData
+from heralding.tests import rdp_reference_parser as reference
+from heralding.tests.test_rdp import RDPClient
+
+ITERATIONS = 3000
+
+
+def tpkt(module, data):
+  pdu = module.tpktPDUParser()
+  return pdu.parse(data), pdu.length
+
+
+def connection_request(module, data):
+  pdu = module.x224ConnectionRequestPDU()
+  pos = pdu.parse(data)
+  return pos, pdu.pduType, pdu.cookie, pdu.reqProtocols
+
+
+def channel_join_request(module, data):
+  pdu = module.MCSChannelJoinRequestPDU()
+  # the reference returned the position before the channel id
+  joined = pdu.parse(data) >= 0
+  return joined, pdu.header, pdu.initiator, pdu.channelID
+
+
+def erect_domain_request(module, data):
+  return module.ErectDomainRequestPDU.checkPDU(data)
+
+
+def client_info(module, data):
+  pdu = module.ClientInfoPDU()
+  pos = pdu.parseTLS(data)
+  return pos, pdu.infoLen, pdu.rdpUsername, pdu.rdpPassword
+
+
+class ParserTests(unittest.TestCase):
+
+  def assertSameResult(self, parse, data):
+    try:
+      expected = parse(reference, data)
+    except Exception:
+      # the reference also failed with IndexError or negative lengths
+      with self.assertRaises(InvalidExpectedData, msg=repr(data)):
+        parse(parser, data)
+    else:
+      self.assertEqual(parse(parser, data), expected, repr(data))
+
+  def mutations(self, data, rng):
+    yield data
+    for size in range(len(data)):
+      yield data[:size]
+    for _ in range(ITERATIONS):
+      mutated = bytearray(data)
+      for _ in range(rng.randint(1, 4)):
+        choice = rng.random()
+        pos = rng.randrange(len(mutated) + 1)
+        if choice < 0.5 and pos < len(mutated):
+          mutated[pos] = rng.randrange(256)
+        elif choice < 0.7:
+          mutated[pos:pos] = bytes(
+              rng.randrange(256) for _ in range(rng.randint(1, 8)))
+        elif choice < 0.9:
+          del mutated[pos:pos + rng.randint(1, 8)]
+        elif pos + 2 <= len(mutated):
+          # lengths are where it gets interesting
+          struct.pack_into('<H', mutated, pos, rng.choice((0, 1, 0xffff)))
+      yield bytes(mutated)
+
+  def fuzz(self, parse, samples):
+    rng = random.Random(3389)
+    for sample in samples:
+      for data in self.mutations(sample, rng):
+        self.assertSameResult(parse, data)
+
+  def test_tpkt(self):
+    self.fuzz(tpkt, [RDPClient.ErectDomainRequest()])
+
+  def test_connection_request(self):
+    without_cookie = b'\x03\x00\x00\x13\x0e\xe0\x00\x00\x00\x00\x00' \
+                     b'\x01\x00\x08\x00\x03\x00\x00\x00'
+    self.fuzz(connection_request,
+              [RDPClient.ConnectionRequestPDU(), without_cookie])
+
+  def test_channel_join_request(self):
+    self.fuzz(channel_join_request, [
+        RDPClient.ChannelJoinRequest(1007),
+        RDPClient.ChannelJoinRequest(1003)
+    ])
+
+  def test_erect_domain_request(self):
+    self.fuzz(erect_domain_request, [RDPClient.ErectDomainRequest()])
+
+  def test_client_info(self):
+    self.fuzz(client_info, [RDPClient.ClientInfoPDU()])
+
+  def test_memoryview(self):
+    """Tests that the parsers take bytearrays as well"""
+    data = bytearray(RDPClient.ConnectionRequestPDU())
+    self.assertEqual(
+        connection_request(parser, data),
+        connection_request(parser, bytes(data)))
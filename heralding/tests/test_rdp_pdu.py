@@ -0,0 +1,58 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from heralding.libs.msrdp.pdu import (
+    tpktPDU, x224DataPDU, x224ConnectionConfirmPDU, MCSConnectResponsePDU,
+    MCSAttachUserConfirmPDU, MCSChannelJoinConfirmPDU)
+from heralding.libs.msrdp.security import ServerSecurity
+
+
+def generated(pdu):
+  """The packet built field by field, without the templates"""
+  return tpktPDU(x224DataPDU.generate() + pdu.generate()).generate()
+
+
+class TemplateTests(unittest.TestCase):
+
+  def test_connection_confirm(self):
+    for reqProto in (None, 0, 1, 2, 3, 8, 11, 0xffffffff):
+      pdu = x224ConnectionConfirmPDU(reqProto)
+      # twice, the second comes from the template
+      for _ in range(2):
+        packet = pdu.getFullPacket()
+        expected = x224ConnectionConfirmPDU(reqProto)
+        self.assertEqual(packet, tpktPDU(expected.generate()).generate())
+        self.assertEqual(pdu.sentNegoFail, expected.sentNegoFail)
+
+  def test_connect_response(self):
+    for reqProto in (0, 1, 3, 11, 0xffffffff, 1):
+      packet = MCSConnectResponsePDU(reqProto).getFullPacket()
+      self.assertEqual(
+          packet, generated(MCSConnectResponsePDU(reqProto,
+                                                  ServerSecurity())))
+
+  def test_attach_user_confirm(self):
+    for _ in range(2):
+      self.assertEqual(MCSAttachUserConfirmPDU().getFullPacket(),
+                       generated(MCSAttachUserConfirmPDU()))
+
+  def test_channel_join_confirm(self):
+    for initiator, channelID in ((6, 1007), (6, 1003), (0, 0),
+                                 (0xffff, 0x1234)):
+      packet = MCSChannelJoinConfirmPDU(initiator, channelID).getFullPacket()
+      self.assertEqual(
+          packet, generated(MCSChannelJoinConfirmPDU(initiator, channelID)))
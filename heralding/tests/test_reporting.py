@@ -0,0 +1,595 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import queue
+import shutil
+import tempfile
+import asyncio
+import unittest
+import threading
+
+import zmq
+
+import heralding.misc
+from heralding.reporting.base_logger import BaseLogger
+from heralding.misc.socket_names import worker_reporting_address
+from heralding.reporting.reporting_relay import ReportingRelay, ReportingCollector, \
+  OverflowSpill
+from heralding.reporting.reporting_bus import ReportingBus
+from heralding.reporting.spool import Spool
+from heralding.reporting import wire_format
+
+
+class CollectingLogger(BaseLogger):
+
+  def __init__(self):
+    super().__init__()
+    self.auth_attempts = []
+    self.sessions = []
+
+  def handle_auth_log(self, data):
+    self.auth_attempts.append(data)
+
+  def handle_session_log(self, data):
+    self.sessions.append(data)
+
+
+def message(number):
+  return {'message_type': 'aux_info', 'content': {'number': number}}
+
+
+def numbers(messages):
+  return [m['number'] for m in messages]
+
+
+class SlowLogger(CollectingLogger):
+
+  def handle_auth_log(self, data):
+    time.sleep(0.01)
+    super().handle_auth_log(data)
+
+
+class ReportingRelayTests(unittest.TestCase):
+
+  def setUp(self):
+    self.threads = []
+    self.stoppables = []
+
+  def tearDown(self):
+    # also when a test failed before stopping them
+    for stoppable in self.stoppables:
+      stoppable.stop()
+    for thread in self.threads:
+      thread.join(5)
+
+  def _run(self, target):
+    thread = threading.Thread(target=target)
+    thread.start()
+    self.threads.append(thread)
+
+  def _start(self, relay, *loggers):
+    self.stoppables.extend((relay,) + loggers)
+    self._run(relay.start)
+    # the relay binds the socket the loggers connect to
+    time.sleep(0.2)
+    for logger in loggers:
+      self._run(logger.start)
+    # give the subscribers time to connect before anything is published
+    time.sleep(0.2)
+
+  def test_batches_keep_order(self):
+    """Tests that every logger receives all messages in order"""
+    relay = ReportingRelay(batch_size=16, flush_interval=20)
+    loggers = [CollectingLogger(), CollectingLogger()]
+    self._start(relay, *loggers)
+
+    for i in range(1000):
+      ReportingRelay.logAuthAttempt({'number': i})
+      if i % 100 == 0:
+        ReportingRelay.logSessionInfo({'number': i})
+    relay.stop()
+    for thread in self.threads:
+      thread.join(5)
+
+    for logger in loggers:
+      self.assertEqual(numbers(logger.auth_attempts), list(range(1000)))
+      self.assertEqual(numbers(logger.sessions), list(range(0, 1000, 100)))
+
+  def test_flush_interval(self):
+    """Tests that a batch which is not full is sent after flush_interval"""
+    relay = ReportingRelay(batch_size=1000, flush_interval=50)
+    logger = CollectingLogger()
+    self._start(relay, logger)
+
+    ReportingRelay.logAuthAttempt({'number': 0})
+    time.sleep(1)
+    self.assertEqual(numbers(logger.auth_attempts), [0])
+
+
+  def test_slow_logger_does_not_stall_others(self):
+    """Tests that a slow logger drops messages instead of holding up
+        the other loggers"""
+    relay = ReportingRelay(batch_size=10, flush_interval=0)
+    fast_logger = CollectingLogger()
+    slow_logger = SlowLogger()
+    slow_logger.configure_queue(10, 'drop_newest')
+    self._start(relay, fast_logger, slow_logger)
+
+    for i in range(200):
+      ReportingRelay.logAuthAttempt({'number': i})
+    time.sleep(0.5)
+    self.assertEqual(numbers(fast_logger.auth_attempts), list(range(200)))
+    self.assertLess(slow_logger.handled, 200)
+
+    relay.stop()
+    for thread in self.threads:
+      thread.join(5)
+    stats = slow_logger.stats()
+    self.assertEqual(stats['received'], 200)
+    self.assertGreater(stats['dropped'], 0)
+    self.assertEqual(stats['handled'] + stats['dropped'], 200)
+    self.assertEqual(stats['high_water_mark'], 10)
+    self.assertEqual(stats['lag'], 0)
+
+
+class CountingLogger(CollectingLogger):
+
+  def __init__(self, blocking):
+    super().__init__()
+    self.blocking = blocking
+    self.regular_calls = 0
+    self.stopped = False
+    self.threads = set()
+
+  def handle_auth_log(self, data):
+    self.threads.add(threading.get_ident())
+    super().handle_auth_log(data)
+
+  def _execute_regulary(self):
+    self.regular_calls += 1
+
+  def loggerStopped(self):
+    self.stopped = True
+
+
+class ReportingBusTests(unittest.TestCase):
+
+  def setUp(self):
+    self.loop = asyncio.new_event_loop()
+    self.bus = ReportingBus(self.loop)
+
+  def tearDown(self):
+    self.bus.stop()
+    self.loop.run_until_complete(self.bus.wait_closed())
+    self.loop.close()
+
+  def test_delivery(self):
+    """Tests that messages reach every logger right away, in order, and that
+        blocking loggers are kept off the event loop"""
+    loggers = [CountingLogger(blocking=True), CountingLogger(blocking=False)]
+    for l in loggers:
+      self.bus.add_logger(l)
+
+    for i in range(100):
+      ReportingRelay.logAuthAttempt({'number': i})
+    # from another thread, as the ReportingCollector does
+    thread = threading.Thread(
+        target=ReportingRelay.logAuthAttempt, args=({'number': 100},))
+    thread.start()
+    thread.join()
+    self.loop.run_until_complete(asyncio.sleep(0.1))
+
+    for l in loggers:
+      self.assertEqual(numbers(l.auth_attempts), list(range(101)))
+      self.assertEqual(l.stats()['handled'], 101)
+    self.assertNotIn(threading.get_ident(), loggers[0].threads)
+    self.assertEqual(loggers[1].threads, {threading.get_ident()})
+
+    self.bus.stop()
+    self.loop.run_until_complete(self.bus.wait_closed())
+    self.assertIsNone(ReportingRelay.bus)
+    for l in loggers:
+      self.assertTrue(l.stopped)
+    # not delivered anymore
+    ReportingRelay.logAuthAttempt({'number': 101})
+    self.assertEqual(len(loggers[1].auth_attempts), 101)
+
+  def test_no_wakeups_while_idle(self):
+    """Tests that loggers with nothing to do are not woken up"""
+    reporting_logger = CountingLogger(blocking=True)
+    self.bus.add_logger(reporting_logger)
+    ReportingRelay.logAuthAttempt({'number': 0})
+    self.loop.run_until_complete(asyncio.sleep(0.1))
+    calls = reporting_logger.regular_calls
+    self.assertEqual(calls, 1)
+    self.loop.run_until_complete(asyncio.sleep(1))
+    self.assertEqual(reporting_logger.regular_calls, calls)
+
+  def test_drop_policy(self):
+    """Tests that a full logger queue drops messages as configured"""
+    reporting_logger = CountingLogger(blocking=False)
+    reporting_logger.configure_queue(3, 'drop_oldest')
+    self.bus.add_logger(reporting_logger)
+    # the event loop does not get to the logger in between
+    for i in range(10):
+      ReportingRelay.logAuthAttempt({'number': i})
+    self.loop.run_until_complete(asyncio.sleep(0.1))
+    self.assertEqual(numbers(reporting_logger.auth_attempts), [7, 8, 9])
+    self.assertEqual(reporting_logger.stats()['dropped'], 7)
+    self.assertEqual(reporting_logger.stats()['high_water_mark'], 3)
+
+
+class LoggerQueueTests(unittest.TestCase):
+
+  def test_queue_handled_in_batches(self):
+    """Tests that the handler thread takes whatever is queued in one go"""
+    reporting_logger = CountingLogger(blocking=True)
+    reporting_logger._queue = queue.Queue()
+    for i in range(BaseLogger.BATCH_SIZE + 10):
+      reporting_logger._enqueue({
+          'message_type': 'auth',
+          'content': {
+              'number': i
+          }
+      })
+    reporting_logger._queue.put(None)
+    reporting_logger._handle_queue()
+    self.assertEqual(
+        numbers(reporting_logger.auth_attempts),
+        list(range(BaseLogger.BATCH_SIZE + 10)))
+    self.assertEqual(reporting_logger.regular_calls, 2)
+
+
+class OverflowPolicyTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    # the relays in here are never started, so reset the singleton by hand
+    if ReportingRelay._spill is not None:
+      ReportingRelay._spill.close()
+    ReportingRelay._spill = None
+    ReportingRelay._logQueue = None
+    shutil.rmtree(self.tmpdir)
+
+  def _queued(self):
+    messages = []
+    while not ReportingRelay._logQueue.empty():
+      messages.append(ReportingRelay._logQueue.get_nowait())
+    return [m['content']['number'] for m in messages]
+
+  def test_drop_newest(self):
+    ReportingRelay(queue_size=3, overflow_policy='drop_newest')
+    for i in range(5):
+      ReportingRelay.logAuthAttempt({'number': i})
+    self.assertEqual(ReportingRelay.dropped, 2)
+    self.assertEqual(self._queued(), [0, 1, 2])
+
+  def test_drop_oldest(self):
+    ReportingRelay(queue_size=3, overflow_policy='drop_oldest')
+    for i in range(5):
+      ReportingRelay.logAuthAttempt({'number': i})
+    self.assertEqual(ReportingRelay.dropped, 2)
+    self.assertEqual(self._queued(), [2, 3, 4])
+
+  def test_spill_keeps_order(self):
+    """Tests that spilled messages are sent after the queued ones, in order"""
+    relay = ReportingRelay(
+        batch_size=4,
+        queue_size=3,
+        overflow_policy='spill',
+        spill_file=os.path.join(self.tmpdir, 'spill'))
+    for i in range(10):
+      ReportingRelay.logAuthAttempt({'number': i})
+    self.assertEqual(ReportingRelay.spilled, 7)
+
+    received = []
+    # the relay is caught up with the spill after two batches of it, from
+    # then on new messages go to the queue again
+    for i in range(4):
+      received.extend(relay._collect_batch())
+      ReportingRelay.logAuthAttempt({'number': 10 + i})
+    received.extend(relay._collect_batch())
+    self.assertEqual([m['content']['number'] for m in received],
+                     list(range(14)))
+    self.assertEqual(ReportingRelay.dropped, 0)
+    self.assertFalse(ReportingRelay._spill.pending)
+
+  def test_spill_left_over(self):
+    """Tests that complete records left by an earlier run are read back"""
+    path = os.path.join(self.tmpdir, 'spill')
+    spill = OverflowSpill(path)
+    for i in range(3):
+      spill.append(message(i))
+    spill.close()
+    # the last record was cut short
+    with open(path, 'r+b') as f:
+      f.truncate(os.path.getsize(path) - 1)
+
+    spill = OverflowSpill(path)
+    spill.append(message(3))
+    self.assertEqual(spill.read(10), [message(i) for i in (0, 1, 3)])
+    self.assertFalse(spill.pending)
+    self.assertEqual(os.path.getsize(path), 0)
+    spill.close()
+
+
+class ReportingCollectorTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    ReportingRelay._logQueue = None
+    shutil.rmtree(self.tmpdir)
+
+  def test_worker_reporting(self):
+    """Tests that batches pushed by a worker end up in the queue, over a
+        socket in the run directory"""
+    ReportingRelay(queue_size=100)
+    address = worker_reporting_address(self.tmpdir)
+    collector = ReportingCollector(address)
+    thread = threading.Thread(target=collector.start)
+    thread.start()
+
+    socket = heralding.misc.zmq_context.socket(zmq.PUSH)
+    socket.connect(address)
+    socket.send(wire_format.encode_batch([message(i) for i in range(3)]))
+    time.sleep(0.5)
+    collector.stop()
+    thread.join(5)
+    socket.close()
+
+    self.assertEqual(os.listdir(self.tmpdir), ['worker_reporting'])
+    queued = [ReportingRelay._logQueue.get_nowait() for _ in range(3)]
+    self.assertEqual(queued, [message(i) for i in range(3)])
+
+
+class FailingLogger(CollectingLogger):
+
+  def handle_auth_log(self, data):
+    if data['number'] == 1:
+      raise ValueError('cannot handle this one')
+    super().handle_auth_log(data)
+
+
+class DeliveringLogger(CollectingLogger):
+  """Delivers the messages handed to it once told to."""
+
+  def __init__(self):
+    super().__init__()
+    self.delivered = 0
+
+  def delivery_mark(self):
+    return len(self.auth_attempts)
+
+  def delivered_through(self):
+    return self.delivered
+
+
+class SpoolTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _segments(self):
+    return sorted(n for n in os.listdir(self.tmpdir) if n.endswith('.seg'))
+
+  def test_read_across_segments(self):
+    spool = Spool(self.tmpdir, segment_size=256)
+    reader = spool.reader('test')
+    for i in range(0, 100, 5):
+      spool.append([message(n) for n in range(i, i + 5)])
+    self.assertGreater(len(self._segments()), 1)
+
+    received = []
+    while True:
+      messages = reader.read(max_messages=7)
+      if not messages:
+        break
+      received.extend(messages)
+    self.assertEqual(received, [message(n) for n in range(100)])
+    reader.close()
+    spool.close()
+
+  def test_cursor_and_compaction(self):
+    """Tests that segments are kept until every reader is done with them"""
+    spool = Spool(self.tmpdir, segment_size=256)
+    fast = spool.reader('fast')
+    slow = spool.reader('slow')
+    for i in range(0, 100, 5):
+      spool.append([message(n) for n in range(i, i + 5)])
+    segments = self._segments()
+
+    fast.read(max_messages=100)
+    fast.commit()
+    self.assertEqual(self._segments(), segments)
+
+    self.assertEqual(slow.read(max_messages=50),
+                     [message(n) for n in range(50)])
+    slow.commit()
+    self.assertLess(len(self._segments()), len(segments))
+    fast.close()
+    slow.close()
+    spool.close()
+
+    # after a restart the slow reader continues where it committed
+    spool = Spool(self.tmpdir, segment_size=256)
+    slow = spool.reader('slow')
+    self.assertEqual(slow.read(max_messages=100),
+                     [message(n) for n in range(50, 100)])
+    spool.append([message(100)])
+    self.assertEqual(slow.read(), [message(100)])
+    slow.close()
+    spool.close()
+
+  def test_truncated_batch(self):
+    """Tests that a batch cut short by a crash is discarded"""
+    spool = Spool(self.tmpdir)
+    spool.reader('test').close()
+    spool.append([message(0)])
+    spool.append([message(1)])
+    spool.close()
+    path = os.path.join(self.tmpdir, self._segments()[-1])
+    with open(path, 'r+b') as f:
+      f.truncate(os.path.getsize(path) - 1)
+
+    spool = Spool(self.tmpdir)
+    reader = spool.reader('test')
+    spool.append([message(2)])
+    self.assertEqual(reader.read(), [message(0), message(2)])
+    reader.close()
+    spool.close()
+
+  def test_logger_skips_failing_message(self):
+    """Tests that a message a logger fails on does not stop it reading
+        the spool, nor hold up its cursor"""
+    spool = Spool(self.tmpdir)
+    reporting_logger = FailingLogger()
+    reporting_logger._spool_reader = spool.reader(reporting_logger.name)
+    spool.append([{
+        'message_type': 'auth',
+        'content': {
+            'number': n
+        }
+    } for n in range(3)])
+    reporting_logger._read_spool()
+    self.assertEqual(numbers(reporting_logger.auth_attempts), [0, 2])
+    self.assertEqual(reporting_logger.stats()['dropped'], 1)
+    self.assertEqual(reporting_logger.stats()['lag'], 0)
+    reporting_logger._spool_reader.close()
+    spool.close()
+
+  def test_cursor_waits_for_delivery(self):
+    """Tests that the cursor only moves past delivered messages"""
+    spool = Spool(self.tmpdir)
+    reporting_logger = DeliveringLogger()
+    reader = reporting_logger._spool_reader = spool.reader(
+        reporting_logger.name)
+    start = reader.committed
+    spool.append([{'message_type': 'auth', 'content': {'number': 0}}])
+    reporting_logger._read_spool()
+    middle = reader.offset
+    spool.append([{'message_type': 'auth', 'content': {'number': 1}}])
+    reporting_logger._read_spool()
+    self.assertEqual(reader.committed, start)
+
+    reporting_logger.delivered = 1
+    reporting_logger._read_spool()
+    self.assertEqual(reader.committed, middle)
+    reporting_logger.delivered = 2
+    reporting_logger._read_spool()
+    self.assertEqual(reader.committed, spool.end_offset)
+    reader.close()
+    spool.close()
+
+  def test_logger_replays_after_restart(self):
+    """Tests that a logger handles what it missed while it was stopped"""
+    relay = ReportingRelay(flush_interval=0, spool_dir=self.tmpdir)
+    logger = CollectingLogger()
+    relay_thread = threading.Thread(target=relay.start)
+    relay_thread.start()
+    logger_thread = threading.Thread(target=logger.start)
+    logger_thread.start()
+    time.sleep(0.2)
+    ReportingRelay.logAuthAttempt({'number': 0})
+    time.sleep(0.5)
+    logger.stop()
+    logger_thread.join(5)
+    ReportingRelay.logAuthAttempt({'number': 1})
+    relay.stop()
+    relay_thread.join(5)
+    self.assertEqual(numbers(logger.auth_attempts), [0])
+
+    relay = ReportingRelay(spool_dir=self.tmpdir)
+    logger = CollectingLogger()
+    relay_thread = threading.Thread(target=relay.start)
+    relay_thread.start()
+    logger_thread = threading.Thread(target=logger.start)
+    logger_thread.start()
+    time.sleep(0.2)
+    relay.stop()
+    relay_thread.join(5)
+    logger_thread.join(5)
+    self.assertEqual(numbers(logger.auth_attempts), [1])
+
+
+class WireFormatTests(unittest.TestCase):
+
+  def test_round_trip(self):
+    auth = {
+        'timestamp': '2017-01-01 00:00:00.000000',
+        'session_id': 'b0d3f5e4',
+        'auth_id': 'b9e2ee3f',
+        'source_ip': '192.168.0.10',
+        'source_port': 51234,
+        'destination_ip': '192.168.0.1',
+        'destination_port': 22,
+        'protocol': 'ssh',
+        'username': b'\x00root',
+        'password': 'пайтон',
+        'password_hash': None
+    }
+    messages = [
+        {
+            'message_type': 'auth',
+            'content': auth
+        },
+        # fields beyond the layout are kept
+        {
+            'message_type': 'auth',
+            'content': dict(auth, extra=[1, 2])
+        },
+        {
+            'message_type': 'listen_ports',
+            'content': [21, 22]
+        },
+        {
+            'message_type': 'aux_info',
+            'content': {
+                'session_id': 'b0d3f5e4',
+                'data': {
+                    1: 'one'
+                }
+            }
+        },
+    ]
+    frame = wire_format.encode_batch(messages)
+    self.assertEqual(wire_format.decode_batch(frame), messages)
+    for message in messages:
+      self.assertEqual(
+          wire_format.decode_message(wire_format.encode_message(message)),
+          message)
+    self.assertIsNone(
+        wire_format.decode_batch(wire_format.encode_batch(None)))
+
+  def test_missing_fields(self):
+    message = {'message_type': 'auth', 'content': {'username': 'root'}}
+    content = wire_format.decode_message(
+        wire_format.encode_message(message))['content']
+    self.assertEqual(content['username'], 'root')
+    self.assertIsNone(content['password'])
+
+  def test_unknown_types_as_text(self):
+    message = {'message_type': 'log_record', 'content': {'args': object}}
+    content = wire_format.decode_message(
+        wire_format.encode_message(message))['content']
+    self.assertEqual(content['args'], str(object))
@@ -0,0 +1,73 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from unittest import mock
+
+# only imported for the import order, heralding.misc.session cannot be
+# imported before it because of a circular import
+import heralding.honeypot  # noqa: F401
+from heralding.misc.session import Session
+from heralding.reporting.reporting_relay import ReportingRelay
+
+
+class SessionTests(unittest.TestCase):
+
+  def tearDown(self):
+    ReportingRelay._logQueue = None
+
+  def _messages(self):
+    messages = []
+    while not ReportingRelay._logQueue.empty():
+      messages.append(ReportingRelay._logQueue.get_nowait()['content'])
+    return messages
+
+  def test_session_info(self):
+    """Tests the messages logged during a session"""
+    ReportingRelay(queue_size=100)
+    with mock.patch('time.time', return_value=1500000000.25):
+      session = Session('192.0.2.1', 1234, 'pop3', None, 110, '192.0.2.2')
+      session.add_auth_attempt(
+          'plaintext', username='james', password='bond')
+    with mock.patch('time.time', return_value=1500000003.5):
+      session.end_session()
+
+    started, auth, ended = self._messages()
+    self.assertEqual(started['timestamp'], '2017-07-14 02:40:00.250000')
+    self.assertFalse(started['session_ended'])
+    self.assertEqual(auth['timestamp'], '2017-07-14 02:40:00.250000')
+    self.assertEqual(auth['session_id'], str(session.id))
+    self.assertEqual(auth['username'], 'james')
+    self.assertEqual(auth['password'], 'bond')
+    self.assertIsNone(auth['password_hash'])
+    self.assertEqual(ended['duration'], 3)
+    self.assertEqual(ended['num_auth_attempts'], 1)
+    self.assertEqual(ended['auth_attempts'], [{
+        'timestamp': '2017-07-14 02:40:00.250000',
+        'username': 'james',
+        'password': 'bond'
+    }])
+    self.assertEqual(ended['auxiliary_data'], {})
+
+  def test_not_reporting(self):
+    """Tests that sessions are kept without reporting them"""
+    session = Session('192.0.2.1', 1234, 'pop3', None, 110)
+    session.vdata['USER'] = 'james'
+    session.add_auth_attempt('plaintext', username='james', password='bond')
+    session.end_session()
+    self.assertEqual(session.get_number_of_login_attempts(), 1)
+    self.assertFalse(session.is_connected())
+    with self.assertRaises(AttributeError):
+      session.something = None
@@ -0,0 +1,121 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from heralding.reporting.sqlite_logger import SqliteLogger
+
+
+def session_info(session_ended, num_auth_attempts):
+  return {
+      'timestamp': '2017-01-01 00:00:00.000000',
+      'duration': 3 if session_ended else 0,
+      'session_id': 'b0d3f5e4',
+      'source_ip': '192.168.0.10',
+      'source_port': 51234,
+      'destination_ip': '192.168.0.1',
+      'destination_port': 22,
+      'protocol': 'ssh',
+      'num_auth_attempts': num_auth_attempts,
+      'auth_attempts': [],
+      'session_ended': session_ended,
+      'auxiliary_data': {}
+  }
+
+
+class SqliteLoggerTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.database_file = os.path.join(self.tmpdir, 'heralding.db')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _query(self, sql, *args):
+    connection = sqlite3.connect(self.database_file)
+    try:
+      return connection.execute(sql, args).fetchall()
+    finally:
+      connection.close()
+
+  def test_password_hash(self):
+    """Tests that a VNC password hash is stored as JSON, and that a batch
+        which cannot be written does not stop the following ones"""
+    sqlite_logger = SqliteLogger(self.database_file, batch_size=100)
+    sqlite_logger.handle_auth_log({
+        'auth_id': 'vnc',
+        'protocol': 'vnc',
+        'password_hash': {
+            'challenge': '00ff',
+            'response': 'ff00'
+        }
+    })
+    sqlite_logger.flush()
+    self.assertEqual(
+        self._query('SELECT password_hash FROM auth_attempts'),
+        [('{"challenge": "00ff", "response": "ff00"}',)])
+
+    sqlite_logger.handle_auth_log({'auth_id': 'bad', 'password': object()})
+    sqlite_logger.flush()
+    self.assertEqual(sqlite_logger.stats()['dropped'], 1)
+    sqlite_logger.handle_auth_log({'auth_id': 'next', 'password': 'next'})
+    sqlite_logger.loggerStopped()
+    self.assertEqual(
+        self._query('SELECT auth_id FROM auth_attempts ORDER BY auth_id'),
+        [('next',), ('vnc',)])
+
+  def test_auth_attempts(self):
+    sqlite_logger = SqliteLogger(self.database_file, batch_size=3)
+    for i in range(4):
+      sqlite_logger.handle_auth_log({
+          'auth_id': str(i),
+          'session_id': 'b0d3f5e4',
+          'source_ip': '192.168.0.10',
+          'protocol': 'ssh',
+          'username': 'root',
+          'password': str(i)
+      })
+    # a full batch is committed right away, the rest is buffered
+    self.assertEqual(self._query('SELECT count(*) FROM auth_attempts'), [(3,)])
+    # replaying a message does not duplicate it
+    sqlite_logger.handle_auth_log({'auth_id': '0', 'password': 'replayed'})
+    sqlite_logger.loggerStopped()
+
+    self.assertEqual(
+        self._query('SELECT password FROM auth_attempts WHERE source_ip = ? '
+                    'ORDER BY auth_id', '192.168.0.10'),
+        [('0',), ('1',), ('2',), ('3',)])
+    plan = self._query('EXPLAIN QUERY PLAN SELECT * FROM auth_attempts '
+                       'WHERE username = ?', 'root')
+    self.assertIn('auth_attempts_username', plan[0][-1])
+
+  def test_session_upsert(self):
+    """Tests that the start and end of a session become one row"""
+    sqlite_logger = SqliteLogger(self.database_file)
+    sqlite_logger.handle_session_log(session_info(False, 0))
+    sqlite_logger.handle_session_log(session_info(True, 2))
+    # a replayed start does not undo the end
+    sqlite_logger.handle_session_log(session_info(False, 0))
+    sqlite_logger.loggerStopped()
+
+    self.assertEqual(
+        self._query('SELECT session_id, duration, num_auth_attempts, '
+                    'session_ended FROM sessions'), [('b0d3f5e4', 3, 2, 1)])
+    self.assertEqual(self._query('PRAGMA journal_mode'), [('wal',)])
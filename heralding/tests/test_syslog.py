@@ -0,0 +1,192 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import asyncio
+import unittest
+
+from heralding.reporting.syslog_logger import Rfc5424Formatter, RemoteSyslogLogger, AUTH_PARAMS, \
+  SESSION_PARAMS
+from heralding.reporting.reporting_bus import ReportingBus
+from heralding.reporting.reporting_relay import ReportingRelay
+
+
+def auth_attempt(number, password='pass'):
+  return {
+      'timestamp': '2017-01-02 03:04:05.678901',
+      'auth_id': 'auth{0}'.format(number),
+      'session_id': 'session',
+      'source_ip': '192.0.2.1',
+      'source_port': 1234,
+      'destination_ip': '192.0.2.2',
+      'destination_port': 22,
+      'protocol': 'ssh',
+      'username': 'root',
+      'password': password,
+      'password_hash': None
+  }
+
+
+def session_info():
+  return {
+      'timestamp': '2017-01-02 03:04:05.678901',
+      'duration': 3,
+      'session_id': 'session',
+      'source_ip': '192.0.2.1',
+      'source_port': 1234,
+      'destination_ip': '192.0.2.2',
+      'destination_port': 22,
+      'protocol': 'ssh',
+      'num_auth_attempts': 2,
+      'session_ended': True
+  }
+
+
+def split_octet_counted(data):
+  messages = []
+  while data:
+    length, data = data.split(b' ', 1)
+    messages.append(data[:int(length)])
+    data = data[int(length):]
+  return messages
+
+
+class SyslogTests(unittest.TestCase):
+
+  def setUp(self):
+    self.loop = asyncio.new_event_loop()
+
+  def tearDown(self):
+    self.loop.close()
+
+  def test_format(self):
+    """Tests the RFC 5424 header and the escaping of structured data"""
+    formatter = Rfc5424Formatter('local0', hostname='honeypot')
+    message = formatter.format(1, 'auth', auth_attempt(0, 'a"b]c\\'),
+                               AUTH_PARAMS, 'text')
+    self.assertEqual(
+        message,
+        '<129>1 2017-01-02T03:04:05.678901Z honeypot heralding {0} auth '
+        '[heralding@32473 auth_id="auth0" session_id="session" '
+        'source_ip="192.0.2.1" source_port="1234" destination_ip="192.0.2.2" '
+        'destination_port="22" protocol="ssh" username="root" '
+        'password="a\\"b\\]c\\\\"] ﻿text'.format(os.getpid()).encode())
+
+  def test_session_end_timestamp(self):
+    """Tests that an ended session is dated when it ended"""
+    formatter = Rfc5424Formatter('local0', hostname='honeypot')
+    message = formatter.format(6, 'session', session_info(), SESSION_PARAMS,
+                               'text', 3)
+    self.assertTrue(
+        message.startswith(b'<134>1 2017-01-02T03:04:08.678901Z honeypot '))
+
+  def _run_logger(self, reporting_logger, log):
+    bus = ReportingBus(self.loop)
+    bus.add_logger(reporting_logger)
+    try:
+      log()
+    finally:
+      bus.stop()
+      self.loop.run_until_complete(bus.wait_closed())
+
+  def test_tcp(self):
+    """Tests that messages are sent octet counted over TCP"""
+    received = bytearray()
+    done = asyncio.Event()
+
+    async def handle(reader, writer):
+      received.extend(await reader.read())
+      done.set()
+
+    server = self.loop.run_until_complete(
+        asyncio.start_server(handle, '127.0.0.1', 0))
+    port = server.sockets[0].getsockname()[1]
+    syslog_logger = RemoteSyslogLogger(
+        '127.0.0.1', port, 'tcp', 'local0', sd_id='honeypot@64512')
+
+    def log():
+      for i in range(50):
+        ReportingRelay.logAuthAttempt(auth_attempt(i))
+      ReportingRelay.logSessionInfo(session_info())
+
+    self._run_logger(syslog_logger, log)
+    self.loop.run_until_complete(asyncio.wait_for(done.wait(), 5))
+    server.close()
+    self.loop.run_until_complete(server.wait_closed())
+
+    messages = split_octet_counted(bytes(received))
+    self.assertEqual(len(messages), 51)
+    for i, message in enumerate(messages[:50]):
+      self.assertTrue(message.startswith(b'<129>1 '))
+      self.assertIn(' auth_id="auth{0}" '.format(i).encode(), message)
+    self.assertTrue(messages[50].startswith(b'<134>1 '))
+    self.assertIn(b' session [honeypot@64512 session_id="session" ',
+                  messages[50])
+    self.assertEqual(syslog_logger.client.published, 51)
+
+  def test_udp(self):
+    """Tests that every message is sent in a datagram of its own"""
+    received = []
+
+    class Server(asyncio.DatagramProtocol):
+
+      def datagram_received(self, data, addr):
+        received.append(data)
+
+    transport, _ = self.loop.run_until_complete(
+        self.loop.create_datagram_endpoint(
+            Server, local_addr=('127.0.0.1', 0)))
+    port = transport.get_extra_info('sockname')[1]
+    syslog_logger = RemoteSyslogLogger('127.0.0.1', port, 'udp')
+
+    def log():
+      for i in range(10):
+        ReportingRelay.logAuthAttempt(auth_attempt(i))
+      self.loop.run_until_complete(asyncio.sleep(0.1))
+
+    self._run_logger(syslog_logger, log)
+    self.loop.run_until_complete(asyncio.sleep(0.1))
+    transport.close()
+    self.assertEqual(len(received), 10)
+    self.assertTrue(received[9].startswith(b'<9>1 '))
+    self.assertIn(b' auth_id="auth9" ', received[9])
+
+  def test_udp_message_size(self):
+    """Tests that messages too long for a datagram are truncated"""
+    received = []
+
+    class Server(asyncio.DatagramProtocol):
+
+      def datagram_received(self, data, addr):
+        received.append(data)
+
+    transport, _ = self.loop.run_until_complete(
+        self.loop.create_datagram_endpoint(
+            Server, local_addr=('127.0.0.1', 0)))
+    port = transport.get_extra_info('sockname')[1]
+    syslog_logger = RemoteSyslogLogger(
+        '127.0.0.1', port, 'udp', max_message_size=300)
+
+    def log():
+      ReportingRelay.logAuthAttempt(auth_attempt(0, '\u00e9' * 1000))
+      self.loop.run_until_complete(asyncio.sleep(0.1))
+
+    self._run_logger(syslog_logger, log)
+    self.loop.run_until_complete(asyncio.sleep(0.1))
+    transport.close()
+    self.assertEqual(len(received), 1)
+    self.assertLessEqual(len(received[0]), 300)
+    self.assertTrue(received[0].startswith(b'<9>1 '))
+    received[0].decode('utf-8')
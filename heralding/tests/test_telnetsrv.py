@@ -0,0 +1,156 @@
+# Copyright (C) 2017 Johnny Vestergaard <jkv@unixcluster.dk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import asyncio
+import unittest
+import collections
+
+from heralding.capabilities.telnet import TelnetWrapper
+from heralding.libs.telnetsrv.telnetsrvlib import TelnetHandlerBase, BELL
+from heralding.tests.telnet_reference_handler import ReferenceInput
+
+ITERATIONS = 500
+# ESC is left out, the reference handler lost the keys typed right after a
+# lone ESC while the cooker now reads them as keys
+FUZZ_BYTES = (b'abcdefgh \t\r\r\n\n\x00\x03\x04\x08\x7f\xe9\xff\xff\xff' +
+              bytes([240, 241, 250, 251, 252, 253, 254]))
+
+
+class ChunkReader:
+  """Returns the chunks one read at a time, like segments arriving from the
+    network."""
+
+  def __init__(self, chunks):
+    self.chunks = collections.deque(chunks)
+
+  async def read(self, size):
+    if not self.chunks:
+      return b''
+    chunk = self.chunks.popleft()
+    if len(chunk) > size:
+      self.chunks.appendleft(chunk[size:])
+      chunk = chunk[:size]
+    return chunk
+
+
+class BufferWriter:
+
+  def __init__(self):
+    self.data = bytearray()
+
+  def write(self, data):
+    self.data += data
+
+
+class Handler(TelnetHandlerBase):
+  setterm = TelnetWrapper.setterm
+
+
+class ReferenceHandler(ReferenceInput, Handler):
+  pass
+
+
+def split(data, *positions):
+  positions = [0] + sorted(positions) + [len(data)]
+  return [data[a:b] for a, b in zip(positions, positions[1:]) if b > a]
+
+
+async def read_lines(handler_class, chunks, echo=None):
+  """Returns the lines read from the chunks, what was written back and the
+    last subnegotiation."""
+  writer = BufferWriter()
+  handler = handler_class(ChunkReader(chunks), writer, None,
+                          asyncio.get_running_loop())
+  handler.setup()
+  lines = []
+
+  async def read():
+    while True:
+      lines.append(await handler.readline(echo=echo))
+
+  reading = asyncio.ensure_future(read())
+  await handler.inputcooker_task
+  for _ in range(10):
+    await asyncio.sleep(0)
+  reading.cancel()
+  try:
+    await reading
+  except asyncio.CancelledError:
+    pass
+  return lines, bytes(writer.data), handler.sbdataq
+
+
+class InputCookerTests(unittest.TestCase):
+
+  def setUp(self):
+    self.loop = asyncio.new_event_loop()
+
+  def tearDown(self):
+    self.loop.close()
+
+  def read_lines(self, handler_class, chunks, echo=None):
+    return self.loop.run_until_complete(
+        read_lines(handler_class, chunks, echo))
+
+  def assertLines(self, data, expected):
+    """Checks the lines read from data, split in two at every position."""
+    for pos in range(len(data)):
+      lines, _, _ = self.read_lines(Handler, split(data, pos))
+      self.assertEqual(expected, lines, 'split at {0}'.format(pos))
+
+  def test_lines(self):
+    self.assertLines(b'user\r\npass\r\n', [b'user', b'pass'])
+
+  def test_newlines(self):
+    self.assertLines(b'a\r\x00b\rc\r\nd\ne\x00f\r\n',
+                     [b'a', b'b', b'c', b'd', b'ef'])
+
+  def test_iac(self):
+    self.assertLines(b'ab\xff\xffc\xff\xfb\x18d\xff\xf1e\r\n', [b'ab\xffcde'])
+
+  def test_subnegotiation(self):
+    data = b'\xff\xfa\x18\x00xterm\r\xff\xf0user\r\n'
+    for pos in range(len(data)):
+      lines, _, sbdata = self.read_lines(Handler, split(data, pos))
+      self.assertEqual([b'user'], lines)
+      self.assertEqual(b'\x18xterm\r', sbdata)
+
+  def test_keys(self):
+    self.assertLines(b'ac\x1b[Db\x1b[C\x1b[Cd\r\n', [b'abcd'])
+    self.assertLines(b'abx\x08d\x7fc\r\n', [b'abc'])
+
+  def test_not_a_key(self):
+    data = b'a\x1b[Zb\x1bxc\r\n'
+    for pos in range(len(data)):
+      lines, written, _ = self.read_lines(Handler, split(data, pos))
+      self.assertEqual([b'abc'], lines)
+      self.assertEqual(2, written.count(BELL))
+
+  def test_echo(self):
+    lines, written, _ = self.read_lines(
+        Handler, [b'us\xff\xffer\r\n', b'pass\r\n'], echo=True)
+    self.assertEqual([b'us\xffer', b'pass'], lines)
+    self.assertTrue(written.endswith(b'us\xff\xffer\r\npass\r\n'))
+
+  def test_same_as_reference(self):
+    rng = random.Random(25)
+    for _ in range(ITERATIONS):
+      data = bytes(rng.choice(FUZZ_BYTES) for _ in range(rng.randint(0, 60)))
+      positions = [rng.randint(0, len(data)) for _ in range(rng.randint(0, 4))]
+      chunks = split(data, *positions)
+      self.assertEqual(
+          self.read_lines(ReferenceHandler, chunks),
+          self.read_lines(Handler, chunks), data)
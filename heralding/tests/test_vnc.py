@@ -17,7 +17,11 @@ import os
 import asyncio
 import unittest
 
+from Crypto.Cipher import DES
+
 from heralding.capabilities.vnc import Vnc, RFB_VERSION, VNC_AUTH
+from heralding.libs.cracker.pool import CrackerPool
+from heralding.libs.cracker.vnc import get_vnc_key, crack_hash, crack_hash_reference, VncKeyTable
 from heralding.reporting.reporting_relay import ReportingRelay
 
 
@@ -71,3 +75,92 @@ class VncTests(unittest.TestCase):
     self.server = self.loop.run_until_complete(server_coro)
 
     self.loop.run_until_complete(vnc_auth())
+
+
+class VncKeyTableTests(unittest.TestCase):
+
+  def test_duplicate_keys(self):
+    """Tests that passwords sharing their first 8 bytes give one key"""
+    table = VncKeyTable(['password', 'password1', 'password2', 'secret'])
+    self.assertEqual(len(table), 2)
+    self.assertEqual(len(table.keys), 16)
+    self.assertEqual(list(table), [(get_vnc_key(b'password'), 'password'),
+                                   (get_vnc_key(b'secret'), 'secret')])
+
+  def test_crack_hash(self):
+    challenge = os.urandom(16)
+    cipher = DES.new(get_vnc_key(b'letmein'), DES.MODE_ECB)
+    table = VncKeyTable(['123456', 'letmein'])
+    self.assertEqual(
+        crack_hash(challenge, cipher.encrypt(challenge), table), 'letmein')
+    self.assertIsNone(crack_hash(challenge, os.urandom(16), table))
+    # garbage of the wrong length is not an error
+    self.assertIsNone(crack_hash(challenge, os.urandom(11), table))
+
+  def test_crack_hash_matches_reference(self):
+    """Tests the cracker against the per-key reference implementation"""
+    wordlist = os.path.join(
+        os.path.dirname(__file__), os.pardir, 'wordlist.txt')
+    with open(wordlist, 'r') as f:
+      table = VncKeyTable(f.read().splitlines()[:500])
+    for i in range(0, len(table), 50):
+      vnc_key, password = list(table)[i]
+      challenge = os.urandom(16)
+      response = DES.new(vnc_key, DES.MODE_ECB).encrypt(challenge)
+      self.assertEqual(
+          crack_hash(challenge, response, table),
+          crack_hash_reference(challenge, response, table))
+      self.assertEqual(crack_hash(challenge, response, table), password)
+
+
+class CrackerPoolTests(unittest.TestCase):
+
+  def setUp(self):
+    self.loop = asyncio.new_event_loop()
+    self.challenge = os.urandom(16)
+    cipher = DES.new(get_vnc_key(b'letmein'), DES.MODE_ECB)
+    self.response = cipher.encrypt(self.challenge)
+
+  def tearDown(self):
+    self.loop.close()
+
+  def test_crack(self):
+    """Tests that the pool cracks a VNC response in a worker process"""
+    pool = CrackerPool(VncKeyTable(['123456', 'letmein', 'qwerty']))
+
+    async def crack():
+      return await pool.submit_vnc(self.challenge, self.response)
+
+    try:
+      self.assertEqual(self.loop.run_until_complete(crack()), 'letmein')
+      self.assertEqual(pool.pending, 0)
+    finally:
+      pool.stop()
+
+  def test_start(self):
+    """Tests that start runs every worker process up front, without fork"""
+    pool = CrackerPool(VncKeyTable(['letmein']), workers=2)
+    try:
+      pool.start()
+      processes = pool._executor._processes
+      self.assertEqual(len(processes), 2)
+      self.assertNotEqual(
+          pool._executor._mp_context.get_start_method(), 'fork')
+    finally:
+      pool.stop()
+
+  def test_shed_when_full(self):
+    """Tests that jobs are shed when the queue is full"""
+    pool = CrackerPool(VncKeyTable(['letmein']), queue_size=1)
+
+    async def crack():
+      first = pool.submit_vnc(self.challenge, self.response)
+      second = pool.submit_vnc(self.challenge, self.response)
+      self.assertIsNone(second)
+      return await first
+
+    try:
+      self.assertEqual(self.loop.run_until_complete(crack()), 'letmein')
+      self.assertEqual(pool.shed, 1)
+    finally:
+      pool.stop()